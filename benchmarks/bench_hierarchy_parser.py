@@ -0,0 +1,173 @@
+"""Benchmark: parsing Verilog sources for the design hierarchy.
+
+Compares the line-by-line regex state machine the hierarchy viewer used
+before (module, instance and endmodule regexes matched per line, plus the
+per-line port/parameter scan added for the symbol index) with the
+single-pass scanner in ``verilog_gui._parse_verilog_source``. The original
+instances-only pass is timed as well: it is several times faster than the
+scanner (about 5x here), since it neither blanks comments and strings nor
+collects ports and parameters, and it misses instances spanning lines. The
+scanner is only faster than the line-based pass doing the same work. Also
+counts the instances each parser finds in RTL written with multi-line
+instantiations.
+
+No display needed. Run from the repository root:
+
+    python benchmarks/bench_hierarchy_parser.py [lines]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import _parse_verilog_source
+
+MODULE_RE = re.compile(r"^\s*module\s+([a-zA-Z_][\w]*)", re.MULTILINE)
+INSTANCE_RE = re.compile(r"^\s*([a-zA-Z_][\w]*)\s+(?:#\s*\(.*\)\s*)?([a-zA-Z_][\w]*)\s*\(", re.MULTILINE)
+ENDMODULE_RE = re.compile(r"^\s*endmodule", re.MULTILINE)
+NON_INSTANCE_WORDS = ["input", "output", "inout", "reg", "wire", "always", "initial", "assign", "parameter", "localparam", "function", "task"]
+PORT_SPLIT_RE = re.compile(r"\b(input|output|inout)\b")
+PARAMETER_SPLIT_RE = re.compile(r"\b(parameter|localparam)\b")
+PARAMETER_NAME_RE = re.compile(r"([a-zA-Z_][\w]*)\s*(?:\[[^\]]*\]\s*)?=(?!=)")
+RANGE_RE = re.compile(r"\[[^\]]*\]")
+IDENTIFIER_RE = re.compile(r"[a-zA-Z_][\w$]*")
+NET_TYPE_WORDS = {"wire", "reg", "logic", "signed", "unsigned", "integer", "real", "realtime", "time", "tri", "wand", "wor",
+                  "supply0", "supply1", "var", "bit", "byte", "int", "shortint", "longint", "string"}
+
+
+def expression_end(text, pos):
+    depth = 0
+    for i in range(pos, len(text)):
+        char = text[i]
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            if not depth:
+                return i
+            depth -= 1
+        elif char in ",;" and not depth:
+            return i
+    return len(text)
+
+
+def scan_declarations(text, line_num, module):
+    text = text.split("//", 1)[0]
+    parts = PORT_SPLIT_RE.split(text)
+    for direction, rest in zip(parts[1::2], parts[2::2]):
+        rest = re.split(r"[;)]", RANGE_RE.sub(" ", rest), maxsplit=1)[0]
+        for item in rest.split(","):
+            words = [word for word in IDENTIFIER_RE.findall(item.split("=", 1)[0]) if word not in NET_TYPE_WORDS]
+            if words:
+                module["ports"].append({"name": words[-1], "direction": direction, "line": line_num})
+    parts = PARAMETER_SPLIT_RE.split(text)
+    for kind, rest in zip(parts[1::2], parts[2::2]):
+        pos = 0
+        while True:
+            match = PARAMETER_NAME_RE.search(rest, pos)
+            if not match:
+                break
+            end = expression_end(rest, match.end())
+            module["parameters"].append({"name": match.group(1), "value": rest[match.end():end].strip(),
+                                         "local": kind == "localparam", "line": line_num})
+            if end >= len(rest) or rest[end] != ",":
+                break
+            pos = end + 1
+
+
+def line_regex_parse(content, file_path, declarations=True):
+    """The previous line-based state machine."""
+    modules = []
+    current_module = None
+    for i, line in enumerate(content.splitlines()):
+        if current_module is None:
+            match = MODULE_RE.match(line)
+            if match:
+                current_module = {"name": match.group(1), "definition_line": i + 1, "instances": [], "ports": [], "parameters": []}
+                modules.append(current_module)
+                if declarations:
+                    scan_declarations(line[match.end():], i + 1, current_module)
+        else:
+            if declarations:
+                scan_declarations(line, i + 1, current_module)
+            inst_match = INSTANCE_RE.match(line)
+            if inst_match:
+                inst_type, inst_name = inst_match.groups()
+                if inst_type and inst_type.lower() not in NON_INSTANCE_WORDS:
+                    current_module["instances"].append({"type": inst_type, "name": inst_name, "file_path": file_path, "line": i + 1})
+            elif ENDMODULE_RE.match(line):
+                current_module = None
+    return modules
+
+
+def make_source(line_count, multiline_instances=False):
+    """Generates synthetic RTL of roughly ``line_count`` lines."""
+    chunks = []
+    lines = 0
+    index = 0
+    while lines < line_count:
+        ports = "".join(f"    input  wire [W-1:0] in{p}, // lane {p}\n" for p in range(12))
+        body = "".join(
+            f"        if (in{p}[0]) acc <= acc + in{p}; else acc <= acc - 1'b1; /* lane {p} */\n" for p in range(24)
+        )
+        if multiline_instances:
+            instance = (f"    sub{index % 7} #(\n        .P({index}),\n        .W(W)\n    ) u_sub (\n"
+                        "        .clk(clk),\n        .d(in0)\n    );\n")
+        else:
+            instance = f"    sub{index % 7} #(.P({index})) u_sub (.clk(clk), .d(in0));\n"
+        chunk = (
+            f"// block {index}\n"
+            f"module mod{index} #(parameter W = 8, parameter D = {index % 16}) (\n"
+            "    input wire clk,\n"
+            "    input wire rst_n,\n"
+            f"{ports}"
+            "    output reg [W-1:0] acc\n"
+            ");\n"
+            "    localparam HALF = W / 2;\n"
+            f"{instance}"
+            '    initial $display("mod %d", W);\n'
+            "    always @(posedge clk) begin\n"
+            f"{body}"
+            "    end\n"
+            "endmodule\n\n"
+        )
+        chunks.append(chunk)
+        lines += chunk.count("\n")
+        index += 1
+    return "".join(chunks), index
+
+
+def best_of(runs, func, *args):
+    best = None
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    source, module_count = make_source(line_count)
+    print(f"{source.count(chr(10))} lines, {len(source) / 1e6:.1f} MB, {module_count} modules")
+
+    original_time, _ = best_of(3, line_regex_parse, source, "bench.v", False)
+    legacy_time, legacy = best_of(3, line_regex_parse, source, "bench.v")
+    scanner_time, scanned = best_of(3, _parse_verilog_source, source, "bench.v")
+    print(f"line regex, instances only: {original_time * 1000:8.1f} ms")
+    print(f"line regex + declarations:  {legacy_time * 1000:8.1f} ms")
+    print(f"single-pass scanner:        {scanner_time * 1000:8.1f} ms  "
+          f"({legacy_time / scanner_time:.2f}x the declarations pass, {original_time / scanner_time:.2f}x the instances-only pass)")
+    print(f"same result on single-line RTL: {legacy == scanned}")
+
+    multiline, module_count = make_source(line_count // 10, multiline_instances=True)
+    legacy_found = sum(len(module["instances"]) for module in line_regex_parse(multiline, "bench.v"))
+    scanner_found = sum(len(module["instances"]) for module in _parse_verilog_source(multiline, "bench.v"))
+    print(f"multi-line instances found: line regex {legacy_found}, scanner {scanner_found} (of {module_count})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Benchmark: syntax highlighting a freshly opened 10k-line Verilog file.
+
+Compares the original highlighter, which asked Tk for ``1.0 + Nc`` twice per
+token and called tag_add per token, with the current one, which converts
+offsets through a line-start table and issues one tag_add per tag.
+
+Needs a display (Tk text widget). Run from the repository root:
+
+    python benchmarks/bench_highlighting.py [lines]
+"""
+import os
+import sys
+import time
+import tkinter as tk
+from tkinter import scrolledtext
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pygments.lexers import VerilogLexer
+from pygments.token import Token
+
+from verilog_gui import IncrementalHighlighter
+
+TAG_STYLES = {
+    Token.Keyword: "keyword",
+    Token.Comment: "comment",
+    Token.String: "string",
+    Token.Literal.Number: "number",
+    Token.Name.Builtin: "builtin",
+    Token.Operator: "operator",
+    Token.Punctuation: "punctuation",
+    Token.Name.Other: "plain",
+    Token.Error: "error",
+    Token.Name.Variable: "variable",
+    Token.Name.Function: "function",
+    Token.Name.Class: "class",
+    Token.Text: "text",
+}
+
+
+def tag_for_token(token_type):
+    while token_type is not None:
+        if token_type in TAG_STYLES:
+            return TAG_STYLES[token_type]
+        token_type = token_type.parent
+    return None
+
+
+def make_source(line_count):
+    """Generates a synthetic RTL file of roughly ``line_count`` lines."""
+    chunks = []
+    lines = 0
+    index = 0
+    while lines < line_count:
+        chunk = (
+            f"/* block {index}\n   generated */\n"
+            f"module mod{index} #(parameter W = 8) (\n"
+            "    input wire clk,\n"
+            "    input wire rst_n, // active low\n"
+            "    output reg [W-1:0] q\n"
+            ");\n"
+            f"    sub{index % 7} #(.P({index})) u_sub (.clk(clk), .d(8'h{index % 256:02x}));\n"
+            '    initial $display("mod %d", W);\n'
+            "    always @(posedge clk) begin\n"
+            "        if (!rst_n) q <= 0; else q <= q + 1'b1;\n"
+            "    end\n"
+            "endmodule\n\n"
+        )
+        chunks.append(chunk)
+        lines += chunk.count("\n")
+        index += 1
+    return "".join(chunks)
+
+
+def legacy_highlight(text_widget):
+    """The pre-table implementation: two Tk index round trips per token."""
+    content = text_widget.get("1.0", tk.END + "-1c")
+    offset = 0
+    for token_type, value in VerilogLexer().get_tokens_unprocessed(content):
+        tag = tag_for_token(token_type)
+        if tag:
+            start_index = text_widget.index(f"1.0 + {offset}c")
+            end_index = text_widget.index(f"1.0 + {offset + len(value)}c")
+            text_widget.tag_add(tag, start_index, end_index)
+        offset += len(value)
+
+
+def table_highlight(text_widget):
+    """Mirrors VerilogGUI._apply_syntax_highlighting for a newly opened buffer."""
+    content = text_widget.get("1.0", tk.END + "-1c")
+    highlighter = IncrementalHighlighter(VerilogLexer(), tag_for_token)
+    _, _, spans = highlighter.reset(content)
+    for tag, indices in highlighter.tag_ranges(spans).items():
+        text_widget.tag_add(tag, *indices)
+
+
+def timed(root, content, highlight):
+    text_widget = scrolledtext.ScrolledText(root)
+    text_widget.insert(tk.END, content)
+    root.update_idletasks()
+    start = time.perf_counter()
+    highlight(text_widget)
+    root.update_idletasks()
+    elapsed = time.perf_counter() - start
+    text_widget.destroy()
+    return elapsed
+
+
+def main():
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    content = make_source(line_count)
+    root = tk.Tk()
+    root.withdraw()
+
+    start = time.perf_counter()
+    list(VerilogLexer().get_tokens_unprocessed(content))
+    lex_only = time.perf_counter() - start
+
+    table = timed(root, content, table_highlight)
+    legacy = timed(root, content, legacy_highlight)
+    root.destroy()
+
+    print(f"{content.count(chr(10))} lines, {len(content)} chars")
+    print(f"lexing alone:          {lex_only:8.3f}s")
+    print(f"per-token Tk indices:  {legacy:8.3f}s")
+    print(f"line table + batching: {table:8.3f}s  ({legacy / table:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
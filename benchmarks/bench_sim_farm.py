@@ -0,0 +1,106 @@
+"""Benchmark: a regression on the local simulation farm.
+
+Starts a FarmServer on a Unix socket and several ``verilog_gui.py --worker``
+processes standing in for remote hosts, then runs the same set of tests
+through the local RegressionRunner and through the farm. Stand-in
+``iverilog`` and ``vvp`` scripts (each simulation sleeps for a fixed time)
+are put first in PATH, so the numbers show the scheduling and transfer
+overhead rather than the simulator, and Icarus Verilog does not have to be
+installed. Halfway through, one worker is killed to exercise the retry of
+its jobs on the others. Linux/macOS only.
+
+No display needed. Run from the repository root:
+
+    python benchmarks/bench_sim_farm.py [tests] [workers] [slots] [seconds]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import FarmRun, FarmServer, RegressionRunner, _sweep_test
+
+GUI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "verilog_gui.py")
+
+FAKE_IVERILOG = """#!/bin/sh
+out=$2; shift 2
+for arg in "$@"; do case "$arg" in *.v) cat "$arg" >> "$out";; esac; done
+"""
+
+FAKE_VVP = """#!/bin/sh
+sleep {seconds}
+echo "#vcd" > wave.vcd
+echo "METRIC pid = $$"
+"""
+
+
+def write_tools(directory, seconds):
+    for name, text in (("iverilog", FAKE_IVERILOG), ("vvp", FAKE_VVP.format(seconds=seconds))):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(text)
+        os.chmod(path, 0o755)
+
+
+def drain(runner, tests, on_result=None):
+    started = time.perf_counter()
+    runner.start(tests)
+    while True:
+        kind, payload = runner.results.get()
+        if kind == "done":
+            return time.perf_counter() - started, payload
+        if on_result:
+            on_result(payload)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    slots = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 0.5
+    with tempfile.TemporaryDirectory() as scratch:
+        bin_dir = os.path.join(scratch, "bin")
+        os.makedirs(bin_dir)
+        write_tools(bin_dir, seconds)
+        os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+        source = os.path.join(scratch, "tb.v")
+        with open(source, "w") as f:
+            f.write("module tb; endmodule\n")
+        tests = [_sweep_test(f"p{index:03d}", "tb", {"-DMODE": str(index % 4), "+seed": str(index)}) for index in range(count)]
+        tools = {"iverilog": os.path.join(bin_dir, "iverilog"), "vvp": os.path.join(bin_dir, "vvp")}
+        print(f"{count} tests of {seconds} s, {workers} workers x {slots} slots")
+
+        local = RegressionRunner(tools, [source], [], os.path.join(scratch, "local"), workers=workers * slots)
+        wall, results = drain(local, tests)
+        print(f"{f'local pool ({workers * slots} threads):':<28}{wall:6.2f} s  {sum(r['status'] == 'PASS' for r in results)}/{count} passed")
+
+        address = "unix:" + os.path.join(scratch, "farm.sock")
+        server = FarmServer(address)
+        server.start()
+        processes = [subprocess.Popen([sys.executable, GUI, "--worker", address, "--slots", str(slots), "--name", f"w{index}",
+                                       "--workdir", os.path.join(scratch, "worker")], stdout=subprocess.DEVNULL)
+                     for index in range(workers)]
+        try:
+            while len(server.workers()) < workers:
+                time.sleep(0.05)
+            finished = []
+
+            def kill_one(result):
+                finished.append(result["name"])
+                if workers > 1 and len(finished) == count // 2:
+                    processes[0].kill()
+            wall, results = drain(FarmRun(server, [source], [], os.path.join(scratch, "farm")), tests, kill_one)
+            print(f"{f'farm ({workers} processes):':<28}{wall:6.2f} s  {sum(r['status'] == 'PASS' for r in results)}/{count} passed"
+                  f"{'  (one worker killed midway)' if workers > 1 else ''}")
+            print(f"{'ideal:':<28}{seconds * -(-count // (workers * slots)):6.2f} s")
+        finally:
+            for process in processes:
+                process.kill()
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
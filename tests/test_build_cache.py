@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import BuildCache, _source_bundle
+
+
+class IncludeResolutionTest(unittest.TestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = scratch.name
+        for path in ("work", "rtl", "inc"):
+            os.makedirs(os.path.join(self.root, path))
+        self.source = self.write("rtl/top.v", '`include "defs.vh"\nmodule top; endmodule\n')
+        self.cache = BuildCache(os.path.join(self.root, "cache"), 1 << 20)
+        self.cwd = os.path.join(self.root, "work")
+
+    def write(self, path, text):
+        path = os.path.join(self.root, path)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def key(self, flags):
+        return self.cache.key(os.path.join(self.root, "no-iverilog"), [self.source], flags, "sim.vvp", self.cwd)
+
+    def test_working_directory_before_include_dirs(self):
+        self.write("inc/defs.vh", "`define W 8\n")
+        flags = ["-I", os.path.join(self.root, "inc")]
+        before = self.key(flags)
+        self.write("work/defs.vh", "`define W 16\n")
+        shadowed = self.key(flags)
+        self.assertNotEqual(before, shadowed)
+        self.write("inc/defs.vh", "`define W 32\n") # No longer the one iverilog reads
+        self.assertEqual(shadowed, self.key(flags))
+
+    def test_including_directory_only_with_relative_include(self):
+        self.write("rtl/defs.vh", "`define W 8\n")
+        before = self.key([])
+        self.write("rtl/defs.vh", "`define W 16\n")
+        self.assertEqual(before, self.key([]))
+        relative = self.key(["-grelative-include"])
+        self.write("rtl/defs.vh", "`define W 32\n")
+        self.assertNotEqual(relative, self.key(["-grelative-include"]))
+
+    def test_command_file_is_not_cached(self):
+        self.write("work/files.f", "../rtl/top.v\n")
+        self.assertIsNone(self.key(["-c", "files.f"]))
+        self.assertIsNone(self.key(["-ffiles.f"]))
+
+    def test_bundle_ships_includes_from_working_directory(self):
+        self.write("work/defs.vh", "`define W 8\n")
+        old_cwd = os.getcwd()
+        os.chdir(self.cwd)
+        self.addCleanup(os.chdir, old_cwd)
+        files, sources, _, cwd = _source_bundle([self.source], [])
+        self.assertEqual(sorted(files), ["rtl/top.v", "work/defs.vh"])
+        self.assertEqual(sources, ["rtl/top.v"])
+        self.assertEqual(cwd, "work")
+        with self.assertRaises(ValueError):
+            _source_bundle([self.source], ["-c", "files.f"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import DesignHierarchy
+
+
+def design(**children):
+    """A module map where each keyword names a module and the types it instantiates, in order."""
+    return {name: {"instances": [{"type": child, "name": f"u{index}"} for index, child in enumerate(types)]}
+            for name, types in children.items()}
+
+
+class DesignHierarchyTest(unittest.TestCase):
+    def test_counts_through_repeated_instantiation(self):
+        # top has two cores, each core four adders, each adder two full adders
+        hierarchy = DesignHierarchy(design(top=["core", "core", "ram"], core=["add"] * 4 + ["ram"], add=["fa", "fa"], fa=[], ram=[]))
+        self.assertEqual(hierarchy.tops, ["top"])
+        self.assertEqual(hierarchy.instance_counts, {"top": 1, "core": 2, "add": 8, "fa": 16, "ram": 3})
+        self.assertEqual(hierarchy.subtree_sizes["add"], 2)
+        self.assertEqual(hierarchy.subtree_sizes["core"], 4 * 3 + 1)
+        self.assertEqual(hierarchy.total_instances, 1 + 2 + 8 + 16 + 3)
+        self.assertEqual(hierarchy.depths, {"top": 0, "core": 1, "add": 2, "fa": 3, "ram": 2})
+        self.assertEqual(hierarchy.cycles, [])
+
+    def test_undefined_modules_are_not_counted(self):
+        hierarchy = DesignHierarchy(design(top=["sub", "vendor_ip"], sub=[]))
+        self.assertEqual(hierarchy.edges["top"], {"sub": 1})
+        self.assertEqual(hierarchy.instance_counts, {"top": 1, "sub": 1})
+
+    def test_several_tops(self):
+        hierarchy = DesignHierarchy(design(tb_b=["dut"], tb_a=["dut"], dut=[], spare=[]))
+        self.assertEqual(hierarchy.tops, ["spare", "tb_a", "tb_b"])
+        self.assertEqual(hierarchy.roots, hierarchy.tops)
+        self.assertEqual(hierarchy.instance_counts["dut"], 2)
+
+    def test_cycle_below_a_top(self):
+        hierarchy = DesignHierarchy(design(top=["a"], a=["b"], b=["c"], c=["a", "leaf"], leaf=[]))
+        self.assertEqual(hierarchy.cycles, [["a", "b", "c", "a"]])
+        self.assertEqual(hierarchy.back_edges, {("c", "a")})
+        self.assertEqual(hierarchy.instance_counts, {"top": 1, "a": 1, "b": 1, "c": 1, "leaf": 1})
+
+    def test_self_instantiation(self):
+        hierarchy = DesignHierarchy(design(top=["rec"], rec=["rec"]))
+        self.assertEqual(hierarchy.cycles, [["rec", "rec"]])
+        self.assertEqual(hierarchy.instance_counts["rec"], 1)
+
+    def test_cycle_no_top_reaches(self):
+        hierarchy = DesignHierarchy(design(top=["leaf"], leaf=[], x=["y"], y=["x"]))
+        self.assertEqual(hierarchy.tops, ["top"])
+        self.assertEqual(len(hierarchy.roots), 2)
+        self.assertEqual(len(hierarchy.cycles), 1)
+        entry = hierarchy.roots[1]
+        self.assertIn(entry, ("x", "y"))
+        self.assertEqual(hierarchy.cycles[0][0], entry)
+        self.assertEqual(hierarchy.instance_counts["x"], 1)
+        self.assertEqual(hierarchy.instance_counts["y"], 1)
+
+    def test_cycle_is_reported_from_where_a_top_enters_it(self):
+        # The top "wrap" reaches the cycle lib <-> helper through lib
+        hierarchy = DesignHierarchy(design(wrapper_user=[], lib=["helper"], helper=["lib"], wrap=["lib"]))
+        self.assertEqual(hierarchy.tops, ["wrap", "wrapper_user"])
+        self.assertEqual(hierarchy.cycles, [["lib", "helper", "lib"]])
+        self.assertEqual(hierarchy.instance_counts, {"wrapper_user": 1, "lib": 1, "helper": 1, "wrap": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
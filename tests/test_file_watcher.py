@@ -0,0 +1,103 @@
+import os
+import queue
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import FileWatcher
+
+
+class FastPollingWatcher(FileWatcher):
+    POLL_SECONDS = 0.02
+
+
+class WatcherTestMixin:
+    SETTLE_SECONDS = 0.2
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = scratch.name
+        self.watched = os.path.join(self.root, "top.v")
+        self.other = os.path.join(self.root, "other.v")
+        self.watcher = self.make_watcher()
+        self.addCleanup(self.watcher.stop)
+        self.watcher.set_paths([self.watched])
+        time.sleep(self.SETTLE_SECONDS) # Let the watcher take in the new paths
+
+    def write(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+
+    def changes(self):
+        """Every path reported until the watcher has been quiet for a while."""
+        changed = set()
+        try:
+            while True:
+                changed |= self.watcher.changes.get(timeout=self.SETTLE_SECONDS)
+        except queue.Empty:
+            return changed
+
+    def test_create_modify_delete(self):
+        self.write(self.watched, "module top;\n")
+        self.assertEqual(self.changes(), {self.watched})
+        self.write(self.watched, "module top;\nendmodule\n")
+        self.assertEqual(self.changes(), {self.watched})
+        os.remove(self.watched)
+        self.assertEqual(self.changes(), {self.watched})
+
+    def test_replace_by_rename(self):
+        self.write(self.watched, "module top;\n")
+        self.changes()
+        temporary = self.watched + ".tmp"
+        self.write(temporary, "module top;\nendmodule\n")
+        os.replace(temporary, self.watched)
+        self.assertEqual(self.changes(), {self.watched})
+
+    def test_unwatched_files_are_not_reported(self):
+        self.write(self.other, "module other;\n")
+        self.assertEqual(self.changes(), set())
+
+    def test_new_paths_start_unchanged(self):
+        self.write(self.other, "module other;\n")
+        self.watcher.set_paths([self.watched, self.other])
+        time.sleep(self.SETTLE_SECONDS)
+        self.changes()
+        self.write(self.other, "module other;\nendmodule\n")
+        self.assertEqual(self.changes(), {self.other})
+
+
+class PollingWatcherTest(WatcherTestMixin, unittest.TestCase):
+    def make_watcher(self):
+        with mock.patch.object(sys, "platform", "polling-only"):
+            watcher = FastPollingWatcher()
+        self.assertEqual(watcher.backend, "polling")
+        return watcher
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+class InotifyWatcherTest(WatcherTestMixin, unittest.TestCase):
+    def make_watcher(self):
+        watcher = FileWatcher()
+        if watcher.backend != "inotify":
+            watcher.stop()
+            self.skipTest("inotify is not available")
+        return watcher
+
+    def test_set_paths_after_stop(self):
+        self.watcher.stop()
+        deadline = time.monotonic() + 5
+        while self.watcher._fd >= 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.watcher._fd, -1)
+        with mock.patch.object(self.watcher._libc, "inotify_add_watch") as add_watch:
+            self.watcher.set_paths([self.other])
+        add_watch.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
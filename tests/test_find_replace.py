@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import _compile_search_pattern, _replace_all, _search_text
+
+SOURCE = "wire a;\nwire b;\n  wire c;\nassign a = b;\n"
+
+
+def replace(content, term, replacement, use_regex=False, whole_word=False, ignore_case=True):
+    result = _replace_all(content, _compile_search_pattern(term, use_regex, whole_word, ignore_case), replacement, use_regex)
+    if result is None:
+        return 0, content
+    count, start, end, new_text = result
+    return count, content[:start] + new_text + content[end:]
+
+
+class ReplaceAllTest(unittest.TestCase):
+    def test_anchors_match_at_every_line(self):
+        self.assertEqual(replace(SOURCE, "^wire", "logic", use_regex=True),
+                         (2, "logic a;\nlogic b;\n  wire c;\nassign a = b;\n"))
+        self.assertEqual(replace(SOURCE, ";$", " ;", use_regex=True)[0], 4)
+
+    def test_template(self):
+        self.assertEqual(replace(SOURCE, r"wire (\w);", r"reg \1;", use_regex=True)[1],
+                         "reg a;\nreg b;\n  reg c;\nassign a = b;\n")
+
+    def test_literal_and_whole_word(self):
+        self.assertEqual(replace("a.b a_b a.b", "a.b", "x"), (2, "x a_b x"))
+        self.assertEqual(replace(SOURCE, "a", "x", whole_word=True)[1], "wire x;\nwire b;\n  wire c;\nassign x = b;\n")
+
+    def test_case(self):
+        self.assertEqual(replace("Wire wire", "wire", "w", ignore_case=False), (1, "Wire w"))
+        self.assertEqual(replace("Wire wire", "wire", "w"), (2, "w w"))
+
+    def test_no_match(self):
+        self.assertIsNone(_replace_all(SOURCE, _compile_search_pattern("logic"), "wire"))
+
+    def test_search_lines(self):
+        self.assertEqual(_search_text(SOURCE, _compile_search_pattern("^  wire", use_regex=True)), [(3, 0, "  wire c;")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import ParseCache, _parse_verilog_file, _parse_verilog_source
+
+
+def instances(source):
+    return [(instance["type"], instance["name"]) for module in _parse_verilog_source(source, "t.v") for instance in module["instances"]]
+
+
+class StatementBoundaryTest(unittest.TestCase):
+    def test_after_endfunction(self):
+        self.assertEqual(instances("module m; function integer f; input x; f = x; endfunction sub u1 (); endmodule"), [("sub", "u1")])
+
+    def test_after_endtask(self):
+        self.assertEqual(instances("module m;\ntask t; begin end endtask\nsub u1 ();\nendmodule\n"), [("sub", "u1")])
+
+    def test_after_endspecify(self):
+        self.assertEqual(instances("module m;\nspecify (a => b) = 1; endspecify\nsub u1 ();\nendmodule\n"), [("sub", "u1")])
+
+    def test_after_endprimitive_and_endtable(self):
+        source = ("primitive p (o, a); output o; input a; table 0 : 1; endtable endprimitive\n"
+                  "module m;\nsub u1 ();\nendmodule\n")
+        self.assertEqual(instances(source), [("sub", "u1")])
+
+    def test_after_include(self):
+        self.assertEqual(instances('module m;\n`include "defs.vh"\nsub u1 ();\nendmodule\n'), [("sub", "u1")])
+
+    def test_after_timescale(self):
+        self.assertEqual(instances("`timescale 1ns/1ps\nmodule m;\n`default_nettype none\nsub u1 ();\nendmodule\n"), [("sub", "u1")])
+
+    def test_after_bare_macro(self):
+        self.assertEqual(instances("module m;\n`RESET_LOGIC\nsub u1 ();\nendmodule\n"), [("sub", "u1")])
+        self.assertEqual(instances("module m;\n  `CHECK(a, b)\nsub u1 ();\nendmodule\n"), [("sub", "u1")])
+
+    def test_inline_macro_is_not_a_boundary(self):
+        source = "module m;\nwire [`W-1:0] a;\nsub u1 (.a(a));\nassign y = `F g(b);\nendmodule\n"
+        self.assertEqual(instances(source), [("sub", "u1")])
+
+    def test_function_body_has_no_instances(self):
+        self.assertEqual(instances("module m;\nfunction f; input x; g y (x); endfunction\nendmodule\n"), [])
+
+
+class ParseCacheStoreTest(unittest.TestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.path = os.path.join(scratch.name, "top.v")
+        with open(self.path, "w") as f:
+            f.write("module top;\nsub u1 ();\nendmodule\n")
+        self.cache = ParseCache()
+        self.cache.get(self.path)
+
+    def unchanged_result(self):
+        _, entry, error = _parse_verilog_file(self.path, self.cache.digest(self.path))
+        self.assertIsNone(error)
+        self.assertIsNone(entry[3])
+        return entry
+
+    def test_unchanged_digest_reuses_entry(self):
+        modules = self.cache.store(self.path, self.unchanged_result())
+        self.assertEqual([m["name"] for m in modules], ["top"])
+        self.assertEqual(self.cache.parsed, 1)
+
+    def test_entry_dropped_while_parsing(self):
+        entry = self.unchanged_result()
+        self.cache.retain([])
+        modules = self.cache.store(self.path, entry)
+        self.assertEqual([m["name"] for m in modules], ["top"])
+        self.assertEqual(self.cache.cached(self.path), modules)
+
+    def test_defines_changed_while_parsing(self):
+        entry = self.unchanged_result()
+        self.cache.set_defines(["FAST"])
+        modules = self.cache.store(self.path, entry, ())
+        self.assertEqual([m["name"] for m in modules], ["top"])
+        self.assertIsNone(self.cache.cached(self.path))
+
+    def test_unreadable_file_raises(self):
+        entry = self.unchanged_result()
+        self.cache.retain([])
+        os.remove(self.path)
+        with self.assertRaises(ValueError):
+            self.cache.store(self.path, entry)
+
+
+if __name__ == "__main__":
+    unittest.main()
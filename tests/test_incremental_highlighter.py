@@ -0,0 +1,139 @@
+import gzip
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pygments.lexers import VerilogLexer
+from pygments.token import Token
+
+from verilog_gui import IncrementalHighlighter, TokenCache, _lexer_is_resumable
+
+
+def tag_map(spans, tags=None):
+    tags = dict(tags or {})
+    for start, end, tag in spans:
+        for pos in range(start, end):
+            tags[pos] = tag
+    return tags
+
+
+class OpaqueLexer:
+    """A lexer with only the public API, as a Pygments release with other internals would look."""
+
+    def __init__(self):
+        self.lexer = VerilogLexer()
+
+    def get_tokens_unprocessed(self, text):
+        return self.lexer.get_tokens_unprocessed(text)
+
+
+class IncrementalUpdateTest(unittest.TestCase):
+    lexer_class = VerilogLexer
+
+    def assert_same_as_full_lex(self, old, new):
+        highlighter = IncrementalHighlighter(self.lexer_class(), str)
+        _, _, spans = highlighter.reset(old)
+        result = highlighter.update(new)
+        tags = tag_map(spans)
+        if result:
+            # Like the Tk widget: tags before the edit stay, those after it move with the text,
+            # and the returned range is retagged
+            start, end, spans = result
+            _, old_end, delta = highlighter.last_edit
+            tags = {**{pos: tag for pos, tag in tags.items() if pos < start},
+                    **{pos + delta: tag for pos, tag in tags.items() if pos >= old_end and pos + delta >= end}}
+            tags.update(tag_map(spans))
+        full = IncrementalHighlighter(VerilogLexer(), str)
+        _, _, spans = full.reset(new)
+        self.assertEqual(highlighter.states, full.states)
+        self.assertEqual(tags, tag_map(spans))
+
+    def insert_after(self, old, anchor, inserted):
+        at = old.index(anchor) + len(anchor)
+        self.assert_same_as_full_lex(old, old[:at] + inserted + old[at:])
+
+    def test_close_unclosed_comment(self):
+        self.insert_after("module m;\n  /* old code\n  wire a;\nendmodule\n", "wire a;", " */")
+
+    def test_close_comment_whose_opener_overlaps_a_close(self):
+        self.insert_after("module m;\n  /*// old code\n  wire a;\nendmodule\n", "wire a;", " */")
+        self.insert_after("module m;\n  /*/ old code\n  wire a;\nendmodule\n", "wire a;", " */")
+
+    def test_close_after_a_closed_comment(self):
+        self.insert_after("/* a */ module m;\n  /* old\n  wire a;\nendmodule\n", "wire a;", "*/")
+
+    def test_close_comment_whose_opener_is_split(self):
+        self.insert_after("module m;\n  /\\\n* old code\n  wire a;\nendmodule\n", "wire a;", " */")
+        self.insert_after("a*/\\\n*\n//\n///*a////", "a///", "*/")
+
+    def test_close_comment_with_split_close(self):
+        self.insert_after("/*/a\" \n/* \\\n/", "\n", "/")
+        self.insert_after("module m;\n  /* old code\n  wire a;\nendmodule\n", "wire a;", " *\\\n/")
+
+    def test_edit_inside_line(self):
+        self.insert_after("module m;\n  wire a;\n  assign a = 1'b0;\nendmodule\n", "assign a", "b")
+
+
+class FallbackLexerTest(IncrementalUpdateTest):
+    """The same edits with a lexer whose internals cannot be driven: whole-buffer lexing."""
+
+    lexer_class = OpaqueLexer
+
+    def assert_same_as_full_lex(self, old, new):
+        self.assertFalse(_lexer_is_resumable(OpaqueLexer()))
+        self.assertTrue(_lexer_is_resumable(VerilogLexer()))
+        highlighter = IncrementalHighlighter(OpaqueLexer(), str)
+        _, _, spans = highlighter.reset(old)
+        self.assertEqual(highlighter.update(new)[0], 0)
+        self.assertIsNone(highlighter.provisional(0, 10))
+        super().assert_same_as_full_lex(old, new)
+
+
+class TokenCacheKeyTest(unittest.TestCase):
+    def test_key_covers_tag_mapping(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tags = {Token.Keyword: "keyword", Token.Comment: "comment"}
+            cache = TokenCache(directory, 1 << 20, tags)
+            self.assertEqual(cache.key("module m;"), TokenCache(directory, 1 << 20, dict(reversed(tags.items()))).key("module m;"))
+            self.assertNotEqual(cache.key("module m;"), cache.key("module n;"))
+            renamed = TokenCache(directory, 1 << 20, {**tags, Token.Comment: "remark"})
+            self.assertNotEqual(cache.key("module m;"), renamed.key("module m;"))
+            cache.store(cache.key("module m;"), [(0, 6, "keyword")], [(0, ("root",))])
+            self.assertIsNone(renamed.load(renamed.key("module m;")))
+            self.assertEqual(cache.load(cache.key("module m;")), ([(0, 6, "keyword")], [(0, ("root",))]))
+
+    def test_damaged_entry_is_a_miss_and_removed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TokenCache(directory, 1 << 20)
+            key = cache.key("module m;")
+            cache.store(key, [(0, 6, "keyword")], [(0, ("root",))])
+            path = os.path.join(directory, key + ".json.gz")
+            with open(path, "rb") as f:
+                whole = f.read()
+            good = {"tags": ["keyword"], "spans": [0, 6, 0], "carries": [0], "stack_ids": [0], "stacks": [["root"]]}
+            damaged = [
+                whole[:len(whole) // 2], # Truncated: EOFError
+                whole[:10] + bytes(len(whole) - 10), # Corrupt deflate data
+                b"not gzip",
+                gzip.compress(b"{"),
+                gzip.compress(json.dumps({**good, "tags": None}).encode()),
+                gzip.compress(json.dumps({name: value for name, value in good.items() if name != "stacks"}).encode()),
+                gzip.compress(json.dumps({**good, "spans": [0, 6, 3]}).encode()),
+                gzip.compress(json.dumps(["tags"]).encode()),
+            ]
+            for data in damaged:
+                with open(path, "wb") as f:
+                    f.write(data)
+                self.assertIsNone(cache.load(key), msg=data)
+                self.assertFalse(os.path.exists(path), msg=data)
+            with open(path, "wb") as f:
+                f.write(gzip.compress(json.dumps(good).encode()))
+            self.assertEqual(cache.load(key), ([(0, 6, "keyword")], [(0, ("root",))]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import RegressionRunner
+
+FAKE_IVERILOG = """#!/bin/sh
+out=$2; shift 2
+for arg in "$@"; do case "$arg" in *.v) cat "$arg" >> "$out";; esac; done
+"""
+
+# The first plusarg picks what the simulation does
+FAKE_VVP = """#!/bin/sh
+case "$3" in
++error) echo "ERROR: tb.v:3: boom";;
++failed) echo "*** FAILED ***";;
++benign) echo "ERROR count: 0"; echo "wire FAILED_FLAG = 0"; echo "METRIC errors = 0";;
++exit) exit 3;;
++hang) touch started; sleep 30;;
+esac
+echo done
+"""
+
+
+class FailPatternTest(unittest.TestCase):
+    def test_failure_lines(self):
+        for line in ("ERROR: tb.v:10: assertion\n", "FATAL: tb.v:3: stop\n", "FAIL: t1 expected 3\n", "FAILED\n",
+                     "*** FAILED ***\n", "[FAIL] mismatch\n", "  FAILURE!\n", "ERROR : x\r\n"):
+            self.assertTrue(RegressionRunner.FAIL_RE.search(line), line)
+
+    def test_words_inside_messages(self):
+        for line in ("ERROR count: 0\n", "Test FAILED\n", "wire_ERROR = 1\n", "FAILED_FLAG = 0\n", "no errors\n"):
+            self.assertFalse(RegressionRunner.FAIL_RE.search(line), line)
+
+
+class JobDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = scratch.name
+
+    def test_names_sharing_a_directory(self):
+        self.assertEqual(RegressionRunner.shared_directories(["a b", "a_b", "c", ".x", "x"]), ["a b", "a_b", ".x", "x"])
+        self.assertEqual(RegressionRunner.shared_directories(["a", "b"]), [])
+
+    def test_reset_only_marked_directories(self):
+        job_dir = os.path.join(self.root, "rtl")
+        os.makedirs(job_dir)
+        with open(os.path.join(job_dir, "top.v"), "w") as f:
+            f.write("module top; endmodule\n")
+        with self.assertRaises(FileExistsError):
+            RegressionRunner.reset_job_directory(job_dir)
+        self.assertTrue(os.path.isfile(os.path.join(job_dir, "top.v")))
+
+    def test_reset_empties_own_directory(self):
+        job_dir = os.path.join(self.root, "t1")
+        RegressionRunner.reset_job_directory(job_dir)
+        with open(os.path.join(job_dir, "wave.vcd"), "w") as f:
+            f.write("#vcd\n")
+        RegressionRunner.reset_job_directory(job_dir)
+        self.assertEqual(os.listdir(job_dir), [RegressionRunner.JOB_MARKER])
+
+    @unittest.skipUnless(hasattr(os, "symlink") and os.name == "posix", "needs symlinks")
+    def test_symlink_is_not_followed(self):
+        target = os.path.join(self.root, "target")
+        RegressionRunner.reset_job_directory(target)
+        link = os.path.join(self.root, "link")
+        os.symlink(target, link)
+        with self.assertRaises(FileExistsError):
+            RegressionRunner.reset_job_directory(link)
+        self.assertTrue(os.path.isfile(os.path.join(target, RegressionRunner.JOB_MARKER)))
+
+
+@unittest.skipUnless(os.name == "posix", "stand-in tools are sh scripts")
+class ClassificationTest(unittest.TestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = scratch.name
+        self.tools = {}
+        for name, text in (("iverilog", FAKE_IVERILOG), ("vvp", FAKE_VVP)):
+            self.tools[name] = os.path.join(self.root, name)
+            with open(self.tools[name], "w") as f:
+                f.write(text)
+            os.chmod(self.tools[name], 0o755)
+        self.source = os.path.join(self.root, "tb.v")
+        with open(self.source, "w") as f:
+            f.write("module tb; endmodule\n")
+
+    def runner(self, timeout=None):
+        return RegressionRunner(self.tools, [self.source], [], os.path.join(self.root, "out"), timeout=timeout)
+
+    def run_test(self, plusarg, timeout=None):
+        return self.runner(timeout).run_test({"name": plusarg.lstrip("+"), "top": "tb", "plusargs": [plusarg]})
+
+    def test_pass(self):
+        result = self.run_test("+ok")
+        self.assertEqual(result["status"], "PASS")
+        self.assertTrue(os.path.isfile(result["log"]))
+
+    def test_benign_words_pass(self):
+        result = self.run_test("+benign")
+        self.assertEqual(result["status"], "PASS")
+        self.assertEqual(result["metrics"], {"errors": "0"})
+
+    def test_fail_on_marker(self):
+        for plusarg, message in (("+error", "ERROR: tb.v:3: boom"), ("+failed", "*** FAILED ***")):
+            result = self.run_test(plusarg)
+            self.assertEqual((result["status"], result["message"]), ("FAIL", message))
+
+    def test_fail_on_exit_code(self):
+        self.assertEqual(self.run_test("+exit")["status"], "FAIL")
+
+    def test_timeout(self):
+        self.assertEqual(self.run_test("+hang", timeout=0.5)["status"], "TIMEOUT")
+
+    def test_stopped(self):
+        runner = self.runner()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(runner.run_test({"name": "hang", "top": "tb", "plusargs": ["+hang"]})))
+        thread.start()
+        started = os.path.join(runner.job_directory("hang"), "started")
+        deadline = time.monotonic() + 10
+        while not os.path.exists(started) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        runner.stop()
+        thread.join(10)
+        self.assertEqual(results[0]["status"], "STOPPED")
+        self.assertEqual(runner.run_test({"name": "late", "top": "tb"})["status"], "STOPPED")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import RunLog, _compile_search_pattern
+
+
+class RunLogSearchTest(unittest.TestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.log = RunLog(scratch.name)
+        self.addCleanup(self.log.close)
+        self.log.append(["正在执行命令: vvp sim.vvp\n\n", "ERROR: 错误 at 10ns\n", "数据正确\n", "Ärger im Modul\n", "plain line\n", "tail"])
+
+    def search(self, term, regex=False):
+        return [line for line, _ in self.log.search(_compile_search_pattern(term, regex))]
+
+    def test_unicode_escape(self):
+        self.assertEqual(self.search(r"\u9519", regex=True), [1])
+
+    def test_character_class_matches_characters(self):
+        self.assertEqual(self.search("[错误]", regex=True), [1])
+
+    def test_ignore_case_beyond_ascii(self):
+        self.assertEqual(self.search("ärger"), [3])
+
+    def test_line_numbers_and_text(self):
+        self.assertEqual(self.log.search(re.compile("^plain")), [(4, "plain line")])
+        self.assertEqual(self.search("tail"), [5])
+        self.assertEqual(self.search("sim.vvp"), [0])
+
+    def test_small_blocks(self):
+        self.log.SEARCH_BLOCK_BYTES = 8
+        self.assertEqual(self.search("e"), [1, 3, 4])
+        self.assertEqual(self.search(r"\u9519", regex=True), [1])
+
+    def test_empty_match_at_end(self):
+        self.assertEqual(self.search("$", regex=True), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(self.search(r"\Z", regex=True), [5])
+        self.log.append(["\n"])
+        self.assertEqual(self.search(r"\Z", regex=True), [])
+
+    def test_empty_match_at_end_of_small_log(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        log = RunLog(scratch.name)
+        self.addCleanup(log.close)
+        log.append(["a\n", "abc"])
+        self.assertEqual([line for line, _ in log.search(re.compile("$"))], [0, 1])
+        self.assertEqual(log.search(re.compile(r"\Z")), [(1, "abc")])
+        self.assertEqual(log.search(re.compile("b*$")), [(0, "a"), (1, "abc")])
+
+
+if __name__ == "__main__":
+    unittest.main()
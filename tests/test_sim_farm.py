@@ -0,0 +1,246 @@
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import FarmRun, FarmServer, FarmWorker, _FarmConnection, _farm_socket, _safe_relative_path, _sweep_test
+
+# Stand-ins for iverilog and vvp, as in benchmarks/bench_sim_farm.py
+FAKE_IVERILOG = """#!/bin/sh
+out=$2; shift 2
+for arg in "$@"; do case "$arg" in *.v) cat "$arg" >> "$out";; esac; done
+"""
+
+FAKE_VVP = """#!/bin/sh
+echo "#vcd" > wave.vcd
+echo "METRIC pid = $$"
+"""
+
+POSIX = os.name == "posix" and hasattr(socket, "AF_UNIX")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message() if callable(message) else message)
+
+    def close(self, after_sending=False):
+        pass
+
+    def of_type(self, kind):
+        return [message for message in self.sent if message["type"] == kind]
+
+
+class SafeRelativePathTest(unittest.TestCase):
+    def test_inside(self):
+        self.assertEqual(_safe_relative_path("a/../b/c.v"), os.path.join("b", "c.v"))
+
+    def test_escapes(self):
+        for path in ("a/../../x", "..", "../x", "/etc/passwd", os.path.abspath("x")):
+            with self.assertRaises(ValueError, msg=path):
+                _safe_relative_path(path)
+
+
+class SchedulerTest(unittest.TestCase):
+    """Drives FarmServer's scheduling with fake workers instead of sockets."""
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = scratch.name
+        self.source = os.path.join(self.root, "tb.v")
+        with open(self.source, "w") as f:
+            f.write("module tb; endmodule\n")
+        self.server = FarmServer("unix:" + os.path.join(self.root, "farm.sock"))
+
+    def add_worker(self, name, slots=1):
+        worker = {"name": name, "conn": FakeConnection(), "host": "test", "slots": slots, "assigned": [],
+                  "bundles": set(), "done": 0, "failed": 0}
+        with self.server._lock:
+            self.server._workers[name] = worker
+            self.server._dispatch()
+        return worker
+
+    def submit(self, count):
+        run = FarmRun(self.server, [self.source], [], os.path.join(self.root, "out"))
+        run._tests = [_sweep_test(f"t{index}", "tb", {}) for index in range(count)]
+        self.server.submit(run, run._tests)
+        return run
+
+    def finished(self, run):
+        results = []
+        while not run.results.empty():
+            kind, payload = run.results.get()
+            if kind == "job":
+                results.append(payload)
+        return results
+
+    def test_prefetch_per_slot_then_queue(self):
+        a, b = self.add_worker("a"), self.add_worker("b")
+        self.submit(5)
+        self.assertEqual(len(a["assigned"]) + len(b["assigned"]), 2 * FarmServer.PREFETCH)
+        self.assertEqual(self.server.queued, 1)
+        self.assertEqual(len(a["conn"].of_type("bundle")), 1)
+
+    def test_retry_goes_to_another_worker(self):
+        a = self.add_worker("a")
+        self.submit(1)
+        job_id = a["assigned"][0]
+        b = self.add_worker("b")
+        self.server._handle(a, {"type": "started", "job": job_id})
+        self.server._handle(a, {"type": "result", "job": job_id, "retry": True, "result": {"message": "broken"}})
+        self.assertEqual(a["failed"], 1)
+        self.assertEqual(b["assigned"], [job_id])
+        self.assertEqual(self.server._jobs[job_id]["excluded"], {"a"})
+
+    def test_excluded_worker_is_used_when_it_is_the_only_one(self):
+        a = self.add_worker("a")
+        run = self.submit(1)
+        job_id = a["assigned"][0]
+        for attempt in range(FarmServer.MAX_ATTEMPTS):
+            self.assertEqual(a["assigned"], [job_id])
+            self.server._handle(a, {"type": "result", "job": job_id, "retry": True, "result": {"message": "broken"}})
+        [result] = self.finished(run)
+        self.assertEqual(result["status"], "ERROR")
+        self.assertIn("broken", result["message"])
+        self.assertEqual(a["conn"].of_type("end_run"), [{"type": "end_run", "run": run.id}])
+
+    def test_idle_worker_steals_unstarted_job(self):
+        a = self.add_worker("a")
+        self.submit(2)
+        b = self.add_worker("b")
+        [steal] = a["conn"].of_type("steal")
+        self.assertEqual(steal["job"], a["assigned"][-1])
+        self.server._handle(a, {"type": "released", "job": steal["job"]})
+        self.assertEqual(b["assigned"], [steal["job"]])
+        self.assertNotIn(steal["job"], a["assigned"])
+
+    def test_failed_steal_can_be_tried_again(self):
+        a = self.add_worker("a")
+        self.submit(2)
+        self.add_worker("b")
+        [steal] = a["conn"].of_type("steal")
+        self.server._handle(a, {"type": "steal_failed", "job": steal["job"]})
+        self.assertIsNone(self.server._jobs[steal["job"]]["stealing"])
+
+    def test_dropped_worker_jobs_are_requeued(self):
+        a = self.add_worker("a")
+        self.submit(2)
+        started, waiting = a["assigned"]
+        self.server._handle(a, {"type": "started", "job": started})
+        b = self.add_worker("b")
+        b["conn"].sent.clear()
+        self.server._drop_worker(a)
+        self.assertNotIn("a", self.server._workers)
+        self.assertEqual(sorted(b["assigned"]), sorted([started, waiting]))
+        self.assertEqual(self.server._jobs[started]["attempts"], 1)
+        self.assertEqual(self.server._jobs[waiting]["attempts"], 0)
+
+    def test_cancel(self):
+        a = self.add_worker("a")
+        run = self.submit(3)
+        self.server.cancel(run)
+        self.assertEqual([result["status"] for result in self.finished(run)], ["STOPPED"])
+        self.assertEqual(a["conn"].of_type("cancel"), [{"type": "cancel", "run": run.id}])
+        for job_id in list(a["assigned"]):
+            self.server._handle(a, {"type": "result", "job": job_id, "result": FarmServer._stopped_result(self.server._jobs[job_id])})
+        self.assertEqual(len(self.finished(run)), 2)
+        self.assertFalse(run.pending)
+
+
+@unittest.skipUnless(POSIX, "needs Unix sockets and sh")
+class FarmSocketTest(unittest.TestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = scratch.name
+
+    def test_listen_refuses_to_replace_a_regular_file(self):
+        path = os.path.join(self.root, "top.v")
+        with open(path, "w") as f:
+            f.write("module top; endmodule\n")
+        with self.assertRaises(FileExistsError):
+            _farm_socket("unix:" + path, listen=True)
+        self.assertTrue(os.path.isfile(path))
+
+    def test_listen_replaces_a_stale_socket(self):
+        address = "unix:" + os.path.join(self.root, "farm.sock")
+        _farm_socket(address, listen=True).close()
+        _farm_socket(address, listen=True).close()
+
+    def hello(self, server, hello, reply=True):
+        conn = _FarmConnection(_farm_socket(server.address))
+        self.addCleanup(conn.close)
+        conn.send(hello)
+        return conn.receive() if reply else None
+
+    def test_token_and_malformed_hello(self):
+        server = FarmServer("unix:" + os.path.join(self.root, "farm.sock"), token="模拟农场")
+        server.start()
+        self.addCleanup(server.stop)
+        reply = self.hello(server, {"type": "hello", "worker": "w", "token": "错误"})
+        self.assertEqual(reply["type"], "reject")
+        reply = self.hello(server, {"type": "hello", "worker": "w", "token": "模拟农场", "slots": "many"})
+        self.assertEqual(reply["type"], "reject")
+        self.assertIsNone(self.hello(server, ["hello"]))
+        self.hello(server, {"type": "hello", "worker": "w", "token": "模拟农场", "slots": 3}, reply=False)
+        deadline = time.monotonic() + 5
+        while not server.workers() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([(worker["name"], worker["slots"]) for worker in server.workers()], [("w", 3)])
+
+
+@unittest.skipUnless(POSIX, "needs Unix sockets and sh")
+class FarmEndToEndTest(unittest.TestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = scratch.name
+        tools = {}
+        for name, text in (("iverilog", FAKE_IVERILOG), ("vvp", FAKE_VVP)):
+            tools[name] = os.path.join(self.root, name)
+            with open(tools[name], "w") as f:
+                f.write(text)
+            os.chmod(tools[name], 0o755)
+        self.source = os.path.join(self.root, "tb.v")
+        with open(self.source, "w") as f:
+            f.write("module tb; endmodule\n")
+        address = "unix:" + os.path.join(self.root, "farm.sock")
+        self.server = FarmServer(address, token="令牌")
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.worker = FarmWorker(address, tools, slots=2, name="w", workdir=os.path.join(self.root, "worker"), token="令牌")
+        self.addCleanup(setattr, self.worker, "_closed", True)
+        threading.Thread(target=self.worker.serve_forever, daemon=True).start()
+        deadline = time.monotonic() + 10
+        while not self.server.workers() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_run_returns_results_and_artifacts(self):
+        tests = [_sweep_test(f"p{index}", "tb", {"+seed": str(index)}) for index in range(4)]
+        run = FarmRun(self.server, [self.source], [], os.path.join(self.root, "out"), timeout=30)
+        run.start(tests)
+        while True:
+            kind, payload = run.results.get(timeout=30)
+            if kind == "done":
+                break
+        self.assertEqual([result["status"] for result in payload], ["PASS"] * 4)
+        for result in payload:
+            self.assertIn("pid", result["metrics"])
+            self.assertTrue(os.path.isfile(os.path.join(run.job_directory(result["name"]), "wave.vcd")))
+        run_dir = os.path.join(self.root, "worker", "runs", "w", str(run.id))
+        deadline = time.monotonic() + 5
+        while os.path.exists(run_dir) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(os.path.exists(run_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import RegressionRunner, _expand_sweep, _sweep_test, _write_sweep_results
+
+
+class ExpandSweepTest(unittest.TestCase):
+    def test_grid_is_every_combination(self):
+        spec = "# widths and modes\n-DWIDTH = 8 16\n\n-Ptb.DEPTH = 4 # trailing comment\n+mode = fast 'slow start'\n"
+        points = _expand_sweep(spec, "grid")
+        self.assertEqual(len(points), 4)
+        self.assertEqual(points[0], {"-DWIDTH": "8", "-Ptb.DEPTH": "4", "+mode": "fast"})
+        self.assertEqual(points[-1], {"-DWIDTH": "16", "-Ptb.DEPTH": "4", "+mode": "slow start"})
+        self.assertEqual(list(points[0]), ["-DWIDTH", "-Ptb.DEPTH", "+mode"])
+
+    def test_list_is_one_point_per_line(self):
+        points = _expand_sweep("-DWIDTH=8 +seed=1\n\n-DWIDTH=16 -DFAST\n", "list")
+        self.assertEqual(points, [{"-DWIDTH": "8", "+seed": "1"}, {"-DWIDTH": "16", "-DFAST": ""}])
+
+    def test_empty_spec(self):
+        self.assertEqual(_expand_sweep("# nothing\n", "list"), [])
+
+    def test_malformed_grid_axes(self):
+        for spec in ("-DWIDTH 8 16", "-DWIDTH =", "WIDTH = 8", "-D8BIT = 1", "-DW = 1\n-DW = 2", "-Pa b = 1"):
+            with self.assertRaises(ValueError, msg=spec):
+                _expand_sweep(spec, "grid")
+
+    def test_malformed_list_point(self):
+        with self.assertRaisesRegex(ValueError, "第 2 行"):
+            _expand_sweep("-DW=1\nW=2\n", "list")
+        with self.assertRaises(ValueError):
+            _expand_sweep("-DW='1\n", "list")
+
+
+class SweepTestMappingTest(unittest.TestCase):
+    def test_axes_map_to_defines_parameters_and_plusargs(self):
+        test = _sweep_test("p0", "tb", {"-DWIDTH": "8", "-DFAST": "", "-Ptb.DEPTH": "4", "+seed": "3", "+verbose": ""})
+        self.assertEqual(test, {"name": "p0", "top": "tb", "defines": ["WIDTH=8", "FAST"], "parameters": ["tb.DEPTH=4"],
+                                "plusargs": ["+seed=3", "+verbose"]})
+        self.assertEqual(RegressionRunner.compile_flags(test), ["-s", "tb", "-DWIDTH=8", "-DFAST", "-Ptb.DEPTH=4"])
+
+
+class WriteSweepResultsTest(unittest.TestCase):
+    def test_csv_and_json_columns(self):
+        points = [{"-DWIDTH": "8", "+seed": "1"}, {"-DWIDTH": "16"}]
+        results = [{"name": "p0", "status": "PASS", "message": "", "compile": 0.5, "simulate": 1.23456, "wall": 1.8,
+                    "metrics": {"cycles": "100", "area": "3"}},
+                   {"name": "p1", "status": "ERROR", "message": "编译返回代码 1", "compile": 0.25, "simulate": None, "wall": 0.3,
+                    "metrics": {}}]
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path, json_path = _write_sweep_results(os.path.join(directory, "sweep"), "tb", points, results)
+            with open(csv_path, encoding="utf-8", newline="") as f:
+                reader = csv.DictReader(f)
+                rows = list(reader)
+            self.assertEqual(reader.fieldnames, ["point", "-DWIDTH", "+seed", "status", "compile_s", "simulate_s", "wall_s",
+                                                 "area", "cycles", "message"])
+            self.assertEqual(rows[0], {"point": "p0", "-DWIDTH": "8", "+seed": "1", "status": "PASS", "compile_s": "0.5",
+                                       "simulate_s": "1.235", "wall_s": "1.8", "area": "3", "cycles": "100", "message": ""})
+            self.assertEqual((rows[1]["+seed"], rows[1]["simulate_s"], rows[1]["cycles"], rows[1]["message"]), ("", "", "", "编译返回代码 1"))
+            with open(json_path, encoding="utf-8") as f:
+                data = json.load(f)
+        self.assertEqual((data["top"], data["axes"], data["metrics"]), ("tb", ["-DWIDTH", "+seed"], ["area", "cycles"]))
+        self.assertEqual(data["points"][1]["simulate_s"], None)
+        self.assertEqual(data["points"][0]["cycles"], "100")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from verilog_gui import ParseCache, SymbolIndex
+
+TOP = """module top #(parameter W = 8) (input clk, output [W-1:0] q);
+  localparam D = 2;
+  sub u1 (.clk(clk));
+`ifdef FAST
+  fast u2 ();
+`endif
+endmodule
+"""
+
+
+class SymbolIndexTest(unittest.TestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = scratch.name
+        self.db = os.path.join(self.root, "project.symbols.db")
+        self.top = self.write("top.v", TOP)
+        self.sub = self.write("sub.v", "module sub (input clk);\nendmodule\n")
+
+    def write(self, name, text):
+        path = os.path.join(self.root, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def open_cache(self, defines=()):
+        index = SymbolIndex(self.db)
+        self.addCleanup(index.close)
+        return ParseCache(index, defines)
+
+    def instance_types(self, cache):
+        return [instance["type"] for module in cache.cached(self.top) for instance in module["instances"]]
+
+    def test_old_schema_is_rebuilt(self):
+        conn = sqlite3.connect(self.db)
+        conn.executescript("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);"
+                           "INSERT INTO meta VALUES ('schema', '1');"
+                           "CREATE TABLE symbols (name TEXT);")
+        conn.commit()
+        conn.close()
+        index = SymbolIndex(self.db)
+        index.close()
+        conn = sqlite3.connect(self.db)
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        version = conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        conn.close()
+        self.assertNotIn("symbols", tables)
+        self.assertLessEqual({"files", "modules", "instances", "ports", "parameters"}, tables)
+        self.assertEqual(version, (str(SymbolIndex.SCHEMA_VERSION),))
+
+    def test_unreadable_database_is_rebuilt(self):
+        self.write("project.symbols.db", "not a database" * 100)
+        cache = self.open_cache()
+        self.assertEqual(cache.index.load(), {})
+
+    def test_round_trip_through_parse_cache(self):
+        cache = self.open_cache()
+        cache.get(self.top)
+        cache.get(self.sub)
+        cache.flush()
+        self.assertEqual(cache.parsed, 2)
+        reopened = self.open_cache()
+        self.assertEqual(reopened.fresh(self.top), cache.cached(self.top))
+        self.assertEqual(reopened.fresh(self.sub), cache.cached(self.sub))
+        self.assertEqual(reopened.parsed, 0)
+        index = reopened.index
+        self.assertEqual(index.definitions("sub"), [(self.sub, 1)])
+        self.assertEqual(index.references("sub"), [(self.top, 3, "u1", "top")])
+        self.assertEqual([name for name, _, _ in index.ports("top")], ["clk", "q"])
+        self.assertEqual([(name, bool(local)) for name, _, local, _ in index.parameters("top")], [("W", False), ("D", True)])
+
+    def test_retain_drops_rows(self):
+        cache = self.open_cache()
+        cache.get(self.top)
+        cache.get(self.sub)
+        cache.retain([self.top])
+        self.assertIsNone(cache.cached(self.sub))
+        reopened = self.open_cache()
+        self.assertEqual(list(reopened.index.load()), [self.top])
+        self.assertEqual(reopened.index.definitions("sub"), [])
+
+    def test_store_of_changed_file_replaces_rows(self):
+        cache = self.open_cache()
+        cache.get(self.top)
+        self.write("top.v", TOP.replace("sub u1", "other u1"))
+        os.utime(self.top, ns=(1, 1))
+        cache.get(self.top)
+        cache.flush()
+        reopened = self.open_cache()
+        self.assertEqual(reopened.index.references("sub"), [])
+        self.assertEqual([row[2] for row in reopened.index.references("other")], ["u1"])
+
+    def test_defines_switch_reloads_matching_rows(self):
+        cache = self.open_cache()
+        cache.get(self.top)
+        cache.flush()
+        self.assertEqual(self.instance_types(cache), ["sub"])
+        self.assertTrue(cache.set_defines(["FAST"]))
+        self.assertFalse(cache.set_defines(["FAST"]))
+        self.assertIsNone(cache.cached(self.top)) # Parsed for other defines
+        cache.get(self.top)
+        cache.flush()
+        self.assertEqual(self.instance_types(cache), ["sub", "fast"])
+        reopened = self.open_cache(["FAST"])
+        self.assertEqual(self.instance_types(reopened), ["sub", "fast"])
+        self.assertEqual(reopened.parsed, 0)
+        self.assertIsNone(self.open_cache().cached(self.top)) # Only one set of defines is kept
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
+from tkinter import filedialog, messagebox, scrolledtext, simpledialog
 from tkinter import ttk # Import ttk module
 import shutil
 import subprocess
@@ -7,12 +7,3453 @@ import os
 import json
 import shlex # Import shlex for safe command string splitting
 import re # NEW: Import re for regular expressions
+import time
+import threading
+import queue
+import hashlib
+import gzip
+import zlib
+import mmap
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import multiprocessing
+import ctypes
+import ctypes.util
+import select
+import struct
+import sys
+import codecs
+import io
+import socket
+import base64
+import hmac
+from collections import deque
+import csv
+import itertools
+import signal
+import stat
 
 # For syntax highlighting
+import pygments
 from pygments import highlight
 from pygments.lexers import VerilogLexer
 from pygments.formatters import TerminalFormatter # We will use this to get style info
 from pygments.token import Token
+try:
+    from pygments.token import _TokenType # Private; only used to drive RegexLexer rules directly
+except ImportError:
+    _TokenType = None
+from bisect import bisect_right
+from array import array
+
+
+def _common_prefix_length(a, b, block=4096):
+    """Returns the length of the common prefix of two strings, comparing in blocks."""
+    limit = min(len(a), len(b))
+    i = 0
+    while i + block <= limit and a[i:i + block] == b[i:i + block]:
+        i += block
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _common_suffix_length(a, b, limit, block=4096):
+    """Returns the length of the common suffix of two strings, at most ``limit`` chars."""
+    len_a, len_b = len(a), len(b)
+    i = 0
+    while i + block <= limit and a[len_a - i - block:len_a - i] == b[len_b - i - block:len_b - i]:
+        i += block
+    while i < limit and a[len_a - i - 1] == b[len_b - i - 1]:
+        i += 1
+    return i
+
+
+def _line_starts(text, start=0, end=None):
+    """Offsets of the first character of every line beginning in text[start:end] after a newline."""
+    starts = []
+    find = text.find
+    end = len(text) if end is None else end
+    pos = find("\n", start, end)
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = find("\n", pos + 1, end)
+    return starts
+
+
+# Pygments versions whose RegexLexer internals _lex_matches was written against
+_RESUMABLE_PYGMENTS = ((2, 17), (3, 0))
+_PYGMENTS_VERSION = tuple(int(part) for part in re.findall(r"\d+", pygments.__version__)[:2])
+
+
+def _lexer_is_resumable(lexer):
+    """Whether ``_lex_matches`` can drive ``lexer``: a RegexLexer of a known Pygments
+    version whose ``_tokens`` rules are all ``(match, action, new_state)`` as expected."""
+    low, high = _RESUMABLE_PYGMENTS
+    if _TokenType is None or not low <= _PYGMENTS_VERSION < high:
+        return False
+    tokendefs = getattr(lexer, "_tokens", None)
+    if not isinstance(tokendefs, dict) or "root" not in tokendefs:
+        return False
+    for rules in tokendefs.values():
+        for rule in rules:
+            if not isinstance(rule, tuple) or len(rule) != 3 or not callable(rule[0]):
+                return False
+            action, new_state = rule[1], rule[2]
+            if not (action is None or type(action) is _TokenType or callable(action)):
+                return False
+            if not (new_state is None or isinstance(new_state, (tuple, int)) or new_state == '#push'):
+                return False
+    return True
+
+
+def _lex_whole(lexer, text):
+    """Fallback for lexers ``_lex_matches`` cannot drive: yields every token of the whole
+    text through the public API in the same form, with a dummy stack."""
+    for token in lexer.get_tokens_unprocessed(text):
+        yield token[0], ("root",), (token,)
+    yield len(text), ("root",), ()
+
+
+def _lex_matches(lexer, text, pos=0, stack=("root",)):
+    """Drives a Pygments RegexLexer from ``pos`` with an explicit state stack.
+
+    Mirrors RegexLexer.get_tokens_unprocessed, but yields one
+    ``(pos, stack, tokens)`` tuple per regex match, where ``stack`` is the
+    lexer state *before* the match, followed by a final tuple for the end of
+    the text. Every yielded position is a point where lexing can be restarted
+    with that stack and produce identical tokens.
+    """
+    tokendefs = lexer._tokens
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    length = len(text)
+    while pos < length:
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                if action is None:
+                    tokens = ()
+                elif type(action) is _TokenType:
+                    tokens = ((pos, action, m.group()),)
+                else:
+                    tokens = tuple(action(lexer, m))
+                yield pos, tuple(statestack), tokens
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == '#push':
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == '#push':
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                break
+        else:
+            # No rule matched: Pygments resets to "root" at a newline and emits an Error otherwise
+            if text[pos] == '\n':
+                yield pos, tuple(statestack), ((pos, Token.Text.Whitespace, '\n'),)
+                statestack = ['root']
+                statetokens = tokendefs['root']
+            else:
+                yield pos, tuple(statestack), ((pos, Token.Error, text[pos]),)
+            pos += 1
+    yield length, tuple(statestack), ()
+
+
+_COMMENT_OPEN_RE = re.compile(r"/(?:\\\n)?\*")
+_COMMENT_CLOSE_RE = re.compile(r"\*(?:\\\n)?/")
+
+
+class IncrementalHighlighter:
+    """Keeps lexer state at line boundaries so edits only re-lex the damaged lines.
+
+    For every line we cache ``(carry, stack)``: the distance from the line start
+    to the first token boundary at or after it, and the lexer stack there.
+    Tokens such as block comments or whitespace runs may span lines, which is
+    why the boundary is not always the line start itself. After an edit we
+    restart from the last boundary before the change and stop as soon as a
+    line past the change reaches the same state it had before.
+
+    Large buffers can be lexed lazily: ``begin`` lexes nothing, ``lex_step``
+    advances a frontier in bounded time slices, and ``provisional`` colours
+    a range of lines past the frontier until the frontier catches up.
+
+    A lexer that cannot be restarted mid-buffer (see ``_lexer_is_resumable``)
+    is run over the whole buffer for every change instead.
+    """
+
+    def __init__(self, lexer, tag_for_token):
+        self.lexer = lexer
+        self.resumable = _lexer_is_resumable(lexer)
+        self.tag_for_token = tag_for_token # Callable mapping a Pygments token type to a Tk tag (or None)
+        self.text = ""
+        self.line_starts = [0]
+        self.states = [(0, ("root",))]
+        self.frontier = None # (pos, stack) where lazy lexing resumes; None once the buffer is fully lexed
+        self.provisional_lines = None # (first, last) lines coloured ahead of the frontier
+        self.last_edit = None # (prefix, old_end, delta) of the most recent update, for mapping offsets
+        self.first_line = 1 # Tk line number of the buffer's first line (>1 when lexing a snippet)
+
+    @property
+    def done(self):
+        return self.frontier is None
+
+    def index(self, offset):
+        """Converts a character offset into a Tk "line.col" index."""
+        line = bisect_right(self.line_starts, offset) - 1
+        return f"{line + self.first_line}.{offset - self.line_starts[line]}"
+
+    def tag_ranges(self, spans):
+        """Groups spans into flat lists of Tk indices per tag, for one tag_add call per tag.
+
+        Spans come out of the lexer sorted and non-overlapping, so offsets are
+        converted by walking the line table once rather than searching it (or
+        asking Tk) for every token. Adjacent spans with the same tag are merged.
+        """
+        ranges = {}
+        if not spans:
+            return ranges
+        line_starts = self.line_starts
+        last_line = len(line_starts) - 1
+        first_line = self.first_line
+        line = bisect_right(line_starts, spans[0][0]) - 1
+        merged_start, merged_end, merged_tag = spans[0]
+        for start, end, tag in spans[1:] + [(None, None, None)]:
+            if tag == merged_tag and start == merged_end:
+                merged_end = end
+                continue
+            while line < last_line and line_starts[line + 1] <= merged_start:
+                line += 1
+            start_index = f"{line + first_line}.{merged_start - line_starts[line]}"
+            while line < last_line and line_starts[line + 1] <= merged_end:
+                line += 1
+            end_index = f"{line + first_line}.{merged_end - line_starts[line]}"
+            ranges.setdefault(merged_tag, []).extend((start_index, end_index))
+            merged_start, merged_end, merged_tag = start, end, tag
+        return ranges
+
+    def reset(self, text):
+        """Lexes the whole buffer. Returns ``(start, end, spans)`` covering all of it."""
+        self.begin(text)
+        end, spans = self._relex(0, ("root",), 0, None)
+        return 0, end, spans
+
+    def restore(self, text, states):
+        """Takes a fully lexed buffer whose line states came from a cache."""
+        self.begin(text)
+        self.states = states
+        self.frontier = None
+
+    def begin(self, text):
+        """Takes a new buffer without lexing it; call ``lex_step`` to make progress."""
+        self.text = text
+        self.line_starts = [0] + _line_starts(text)
+        self.states = [None] * len(self.line_starts)
+        self.states[0] = (0, ("root",))
+        self.frontier = (0, ("root",))
+        self.provisional_lines = None
+        self.last_edit = None
+
+    def lex_step(self, budget):
+        """Advances the lazy frontier for roughly ``budget`` seconds.
+
+        Returns ``(start, end, spans)`` for the newly lexed range, or None if
+        the buffer is already fully lexed.
+        """
+        if self.frontier is None:
+            return None
+        pos, stack = self.frontier
+        next_line = bisect_right(self.line_starts, pos) # Lines up to the frontier already have states
+        end, spans = self._relex(pos, stack, next_line, None, deadline=time.perf_counter() + budget)
+        return pos, end, spans
+
+    def provisional(self, first_line, last_line, force=False):
+        """Colours 0-based lines ``first_line..last_line`` that lie past the frontier.
+
+        The range is lexed from the root state (or from the frontier itself
+        when it falls inside the range) without recording line states; the
+        sequential pass overwrites these tags once it gets there. Returns
+        ``(start, end, spans)`` or None when there is nothing new to colour.
+        """
+        if self.frontier is None or not self.resumable:
+            return None
+        frontier_pos, frontier_stack = self.frontier
+        last_line = min(last_line, len(self.line_starts) - 1)
+        frontier_line = bisect_right(self.line_starts, frontier_pos) - 1
+        first_line = max(first_line, frontier_line)
+        if first_line > last_line:
+            return None
+        covered = self.provisional_lines
+        if not force and covered and covered[0] <= first_line and last_line <= covered[1]:
+            return None
+        self.provisional_lines = (first_line, last_line)
+
+        if first_line == frontier_line:
+            pos, stack = frontier_pos, frontier_stack
+        else:
+            pos, stack = self.line_starts[first_line], ("root",)
+        stop = self.line_starts[last_line + 1] if last_line + 1 < len(self.line_starts) else len(self.text)
+        tag_for_token = self.tag_for_token
+        spans = []
+        end = pos
+        for match_pos, _, tokens in _lex_matches(self.lexer, self.text, pos, stack):
+            end = match_pos
+            if match_pos >= stop:
+                break
+            for token_pos, token_type, value in tokens:
+                tag = tag_for_token(token_type)
+                if tag and value:
+                    spans.append((token_pos, token_pos + len(value), tag))
+        return pos, end, spans
+
+    def update(self, text):
+        """Re-lexes after the buffer changed to ``text``.
+
+        Returns ``(start, end, spans)`` for the offset range whose tags must be
+        replaced, or None if nothing already lexed was affected.
+        """
+        old = self.text
+        if text == old:
+            self.last_edit = None
+            return None
+        prefix = _common_prefix_length(old, text)
+        suffix = _common_suffix_length(old, text, min(len(old), len(text)) - prefix)
+        old_end = len(old) - suffix
+        new_end = len(text) - suffix
+        delta = len(text) - len(old)
+        self.last_edit = (prefix, old_end, delta)
+
+        # Splice the line table: lines before the damage keep their offsets,
+        # lines starting inside the unchanged suffix are shifted by delta.
+        old_starts = self.line_starts
+        first = bisect_right(old_starts, prefix) - 1
+        tail = bisect_right(old_starts, old_end)
+        middle = _line_starts(text, old_starts[first], new_end)
+        self.line_starts = old_starts[:first + 1] + middle + [start + delta for start in old_starts[tail:]]
+        tail_line = first + 1 + len(middle)
+        self.states = self.states[:first + 1] + [None] * len(middle) + self.states[tail:]
+        self.text = text
+        self.provisional_lines = None
+        if not self.resumable:
+            end, spans = self._relex(0, ("root",), 1, None)
+            return 0, end, spans
+
+        # Restart from the last checkpoint strictly before the damage. Some
+        # rules look ahead past their own match: a comment continued with a
+        # trailing backslash reads into the following lines, and a block
+        # comment opener with no "*/" after it lexes as operators. Back the
+        # restart point up past both so their tokens are re-evaluated.
+        limit = prefix
+        head = first
+        while head > 0 and old.endswith("\\\n", 0, old_starts[head]):
+            head -= 1
+        if head < first:
+            limit = min(limit, old_starts[head] + 1)
+        # Openers and closers may be split by a backslash-newline ("/\\\n*", "*\\\n/")
+        last_close = max(old.rfind("*/"), old.rfind("*\\\n/"))
+        last_close_end = -1 if last_close == -1 else _COMMENT_CLOSE_RE.match(old, last_close).end()
+        if last_close_end <= prefix and any(close.end() > prefix for close in
+                                            _COMMENT_CLOSE_RE.finditer(text, max(prefix - 3, 0), new_end + 3)):
+            # An opener is unclosed unless a close starts at or after its end, so one
+            # overlapping the last close (as in "/*/" or "/*//") is unclosed too
+            for opener in _COMMENT_OPEN_RE.finditer(old, max(last_close - 3, 0), prefix + 3):
+                if opener.start() >= prefix:
+                    break
+                if opener.end() > last_close:
+                    limit = min(limit, opener.start() + 1)
+                    break
+
+        # With lazy lexing, edits entirely past the frontier touch nothing
+        # lexed so far; otherwise re-lex no further than the shifted frontier.
+        stop = None
+        if self.frontier is not None:
+            frontier_pos, frontier_stack = self.frontier
+            if frontier_pos < limit:
+                return None
+            if frontier_pos >= old_end:
+                stop = frontier_pos + delta
+                self.frontier = (stop, frontier_stack) # Still valid if we resynchronise before reaching it
+            else:
+                stop = new_end
+
+        restart = first
+        while restart > 0 and (self.states[restart] is None or
+                               self.line_starts[restart] + self.states[restart][0] >= limit):
+            restart -= 1
+        carry, stack = self.states[restart]
+        start = self.line_starts[restart] + carry
+        end, spans = self._relex(start, stack, restart + 1, tail_line, stop=stop)
+        return start, end, spans
+
+    def map_range(self, start, end):
+        """Maps an offset range from before the last update into the current buffer."""
+        if self.last_edit is None:
+            return start, end
+        prefix, old_end, delta = self.last_edit
+
+        def map_offset(offset, inside):
+            if offset <= prefix:
+                return offset
+            if offset >= old_end:
+                return offset + delta
+            return inside
+
+        return map_offset(start, prefix), map_offset(end, old_end + delta)
+
+    def relex_range(self, start, end):
+        """Re-lexes an unchanged range, e.g. to repaint tags that never reached the screen.
+
+        Returns ``(start, end, spans)`` covering at least the lexed part of the
+        range, or None if it lies entirely past the lazy frontier.
+        """
+        stop = None
+        if self.frontier is not None:
+            stop = self.frontier[0]
+            end = min(end, stop)
+        if start >= end:
+            return None
+        if not self.resumable:
+            end, spans = self._relex(0, ("root",), 1, None)
+            return 0, end, spans
+        line = bisect_right(self.line_starts, start) - 1
+        while line > 0 and self.line_starts[line] + self.states[line][0] > start:
+            line -= 1
+        carry, stack = self.states[line]
+        pos = self.line_starts[line] + carry
+        end, spans = self._relex(pos, stack, line + 1, bisect_right(self.line_starts, end), stop=stop)
+        return pos, end, spans
+
+    def _relex(self, pos, stack, next_line, resync_line, stop=None, deadline=None):
+        """Lexes from ``pos`` recording line states; stops at a resynchronised line.
+
+        Lines from ``resync_line`` on still hold their pre-edit states; the first
+        of them whose new state matches lets us stop. Lexing also pauses at the
+        first boundary past ``stop`` or after ``deadline``, leaving the frontier
+        there. Returns ``(end, spans)``. Without a resumable lexer the whole buffer
+        is lexed in one go, from the start.
+        """
+        if not self.resumable:
+            pos, stack, next_line, resync_line, stop, deadline = 0, ("root",), 1, None, None, None
+        text = self.text
+        line_starts = self.line_starts
+        states = self.states
+        line_count = len(line_starts)
+        tag_for_token = self.tag_for_token
+        spans = []
+        matches = 0
+        matcher = _lex_matches(self.lexer, text, pos, stack) if self.resumable else _lex_whole(self.lexer, text)
+        for match_pos, match_stack, tokens in matcher:
+            while next_line < line_count and line_starts[next_line] <= match_pos:
+                state = (match_pos - line_starts[next_line], match_stack)
+                if resync_line is not None and next_line >= resync_line and states[next_line] == state:
+                    return match_pos, spans
+                states[next_line] = state
+                next_line += 1
+            if stop is not None and match_pos >= stop and tokens:
+                self.frontier = (match_pos, match_stack)
+                return match_pos, spans
+            matches += 1
+            if deadline is not None and not matches % 256 and tokens and time.perf_counter() >= deadline:
+                self.frontier = (match_pos, match_stack)
+                return match_pos, spans
+            for token_pos, token_type, value in tokens:
+                tag = tag_for_token(token_type)
+                if tag and value:
+                    spans.append((token_pos, token_pos + len(value), tag))
+        self.frontier = None
+        return len(text), spans
+
+
+def _compile_search_pattern(search_term, use_regex=False, whole_word=False, ignore_case=True):
+    """Compiles a find/replace term; raises re.error for an invalid regex.
+    ^ and $ match at every line, as they do in a Tk text search."""
+    expression = search_term if use_regex else re.escape(search_term)
+    if whole_word:
+        expression = rf"\b(?:{expression})\b"
+    return re.compile(expression, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+
+def _replace_all(content, pattern, replacement, use_regex=False):
+    """Replaces every match of ``pattern`` in a single pass over ``content``.
+
+    Returns ``(count, start, end, new_text)`` where ``content[start:end]`` spans
+    the first to the last match and ``new_text`` is its replacement, or None
+    when nothing matched. In regex mode ``replacement`` is a template (``\\1``).
+    """
+    pieces = []
+    count = 0
+    start = end = None
+    for match in pattern.finditer(content):
+        if start is None:
+            start = match.start()
+        else:
+            pieces.append(content[end:match.start()])
+        pieces.append(match.expand(replacement) if use_regex else replacement)
+        end = match.end()
+        count += 1
+    if not count:
+        return None
+    return count, start, end, "".join(pieces)
+
+
+def _search_text(content, pattern, max_matches=None):
+    """Returns ``[(line, column, line_text)]`` for the non-empty matches of ``pattern``."""
+    matches = []
+    line = 1
+    scanned = 0
+    for match in pattern.finditer(content):
+        start = match.start()
+        if start == match.end():
+            continue
+        line += content.count("\n", scanned, start)
+        scanned = start
+        line_start = content.rfind("\n", 0, start) + 1
+        line_end = content.find("\n", start)
+        if line_end < 0:
+            line_end = len(content)
+        matches.append((line, start - line_start, content[line_start:line_end].rstrip("\r")))
+        if max_matches and len(matches) >= max_matches:
+            break
+    return matches
+
+
+def _atomic_write_text(path, text):
+    """Writes ``text`` next to ``path`` and renames it into place, keeping the file mode."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ProjectSearch:
+    """Searches or replaces across the project files on a thread pool.
+
+    Every file of a run puts ``(generation, file_path, result, error)`` on
+    ``results`` as soon as it is done, where ``result`` is the match list of
+    a search or the replacement count of a replace. Starting a new run
+    bumps ``generation``; the Tk thread drops results of older runs.
+    """
+
+    MAX_MATCHES_PER_FILE = 1000 # Keeps a runaway pattern from flooding the results tree
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.results = queue.Queue()
+        self.generation = 0
+        self._executor = None
+
+    def search(self, files, pattern, buffers=None):
+        """Searches ``files``; ``buffers`` maps paths to unsaved editor contents to search instead."""
+        buffers = buffers or {}
+        return self._start(lambda generation, path: self._search_file(generation, path, pattern, buffers.get(path)), files)
+
+    def replace(self, files, pattern, replacement, use_regex=False):
+        """Replaces in ``files`` on disk; files without a match are left untouched."""
+        return self._start(lambda generation, path: self._replace_file(generation, path, pattern, replacement, use_regex), files)
+
+    def cancel(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _start(self, task, files):
+        self.cancel()
+        self.generation += 1
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="project-search")
+        for path in files:
+            self._executor.submit(task, self.generation, path)
+        return self.generation
+
+    def _search_file(self, generation, path, pattern, content):
+        if generation != self.generation:
+            return
+        try:
+            if content is None:
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    content = f.read()
+            self.results.put((generation, path, _search_text(content, pattern, self.MAX_MATCHES_PER_FILE), None))
+        except (OSError, UnicodeDecodeError) as e:
+            self.results.put((generation, path, [], e))
+
+    def _replace_file(self, generation, path, pattern, replacement, use_regex):
+        if generation != self.generation:
+            return
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                content = f.read()
+            result = _replace_all(content, pattern, replacement, use_regex)
+            if result:
+                count, start, end, new_text = result
+                _atomic_write_text(path, content[:start] + new_text + content[end:])
+            self.results.put((generation, path, result[0] if result else 0, None))
+        except (OSError, UnicodeDecodeError, re.error, IndexError) as e:
+            self.results.put((generation, path, 0, e))
+
+
+# Verilog identifier (simple or escaped); possessive so that a word is never split
+_IDENTIFIER = r"[a-zA-Z_][\w$]*+|\\\S++"
+# Comments and strings are blanked out (newlines kept, so offsets and line numbers stay valid)
+_COMMENT_STRING_RE = re.compile(r'//[^\n]*|/\*(?s:.*?)(?:\*/|\Z)|"(?:\\.|[^"\\\n])*"?')
+_BALANCED_PARENS = r"\((?:[^()]|\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\))*\)" # Nesting up to four levels
+# Every event starts at a word (or a directive). The first character is matched before the
+# lookbehind so that the regex engine can skip ahead with a character-set scan.
+_EVENT_RE = re.compile(rf"""
+    `(?P<directive>[a-zA-Z_][\w$]*+)
+  | [a-zA-Z_\\](?<![\w$`'.\\].)(?:
+        (?<=m)(?:odule|acromodule)\s++(?P<module_name>{_IDENTIFIER})
+      | (?<=e)nd(?:(?P<endmodule>module)|(?P<endsubroutine>function|task))\b
+      | (?<=f)unction\b(?P<function>)
+      | (?<=t)ask\b(?P<task>)
+      | (?<=i)nput\b(?P<input>)
+      | (?<=o)utput\b(?P<output>)
+      | (?<=i)nout\b(?P<inout>)
+      | (?<=p)arameter\b(?P<parameter>)
+      | (?<=l)ocalparam\b(?P<localparam>)
+      | [\w$]*+\s*+(?:\#\s*+(?:{_BALANCED_PARENS}|[\w.']+)\s*+)?(?P<instance>{_IDENTIFIER})\s*+(?:\[[^\]]*\]\s*+)?\(
+    )
+""", re.VERBOSE)
+_WORD_RE = re.compile(_IDENTIFIER)
+_CONDITIONAL_RE = re.compile(r"`(ifdef|ifndef|elsif|else|endif)\b")
+_MACRO_NAME_RE = re.compile(rf"\s*({_IDENTIFIER})")
+_MORE_INSTANCES_RE = re.compile(rf"\s*,\s*({_IDENTIFIER})\s*(?:\[[^\]]*\]\s*)?\(")
+# One comma-separated item of a port or parameter list, with [...] ranges kept whole
+_DECLARATION_ITEM_RE = re.compile(r"(?:[^;(){}=,\[]|\[[^\]]*\])*+")
+_ITEM_WORD_RE = re.compile(rf"\[[^\]]*\]|({_IDENTIFIER})")
+_DECLARATION_KEYWORD_RE = re.compile(r"\s*(?:input|output|inout|parameter|localparam)\b")
+_TRAILING_WORD_RE = re.compile(r"[\w$]+\Z")
+_PARENTHESIS_RE = re.compile(r"[()]")
+
+_VERILOG_KEYWORDS = frozenset("""
+    always and assign automatic begin buf bufif0 bufif1 case casex casez cell cmos config deassign default defparam
+    design disable edge else end endcase endconfig endfunction endgenerate endmodule endprimitive endspecify endtable
+    endtask event for force forever fork function generate genvar highz0 highz1 if ifnone incdir include initial inout
+    input instance integer join large liblist library localparam macromodule medium module nand negedge nmos nor
+    noshowcancelled not notif0 notif1 or output parameter pmos posedge primitive pull0 pull1 pulldown pullup
+    pulsestyle_onevent pulsestyle_ondetect rcmos real realtime reg release repeat rnmos rpmos rtran rtranif0 rtranif1
+    scalared showcancelled signed small specify specparam strong0 strong1 supply0 supply1 table task time tran
+    tranif0 tranif1 tri tri0 tri1 triand trior trireg unsigned use uwire vectored wait wand weak0 weak1 while wire wor
+    xnor xor
+    always_comb always_ff always_latch assert assume bit break byte chandle class clocking const constraint continue
+    cover covergroup do endclass endclocking endgroup endinterface endpackage endprogram endproperty endsequence enum
+    export extends extern final foreach forkjoin iff import inside int interface intersect join_any join_none
+    local logic longint modport new null package packed priority program property protected pure rand randc
+    randcase randsequence ref return sequence shortint shortreal solve static string struct super this throughout
+    timeprecision timeunit type typedef union unique var virtual void wait_order wildcard with within
+""".split())
+# Words after which a new statement (and so possibly an instance) starts
+_STATEMENT_KEYWORDS = frozenset(("begin", "end", "else", "generate", "endgenerate", "endcase", "fork", "join", "join_any", "join_none", "default",
+                                 "endfunction", "endtask", "endspecify", "endprimitive", "endtable"))
+# Compiler directives that take the rest of their line
+_LINE_DIRECTIVES = frozenset(("include", "timescale", "default_nettype", "resetall", "celldefine", "endcelldefine", "line", "pragma",
+                              "begin_keywords", "end_keywords", "unconnected_drive", "nounconnected_drive", "undefineall",
+                              "default_decay_time", "default_trireg_strength", "delay_mode_distributed", "delay_mode_path",
+                              "delay_mode_unit", "delay_mode_zero"))
+_NET_TYPE_WORDS = frozenset(("wire", "reg", "logic", "signed", "unsigned", "integer", "real", "realtime", "time", "tri", "wand", "wor",
+                             "supply0", "supply1", "var", "bit", "byte", "int", "shortint", "longint", "string", "uwire", "tri0", "tri1"))
+
+
+def _blank(match):
+    text = match.group()
+    return " " * len(text) if "\n" not in text else "\n".join(" " * len(part) for part in text.split("\n"))
+
+
+def _logical_line_end(text, pos):
+    """End of the line at ``pos``, following backslash continuations (for `define bodies)."""
+    while True:
+        end = text.find("\n", pos)
+        if end < 0:
+            return len(text)
+        if text[end - 1:end] != "\\" and text[end - 2:end] != "\\\r":
+            return end
+        pos = end + 1
+
+
+def _balanced_end(text, pos):
+    """Position after the parenthesis group opening at ``pos``."""
+    depth = 0
+    for match in _PARENTHESIS_RE.finditer(text, pos):
+        depth += 1 if match.group() == "(" else -1
+        if not depth:
+            return match.end()
+    return len(text)
+
+
+def _starts_statement(text, pos, floor=0):
+    """Whether the word at ``pos`` begins a statement (where a module instance may appear).
+    ``floor`` is the end of the last compiler directive, which also ends a statement."""
+    end = pos
+    while True:
+        start = max(floor, end - 64)
+        chunk = text[start:end].rstrip()
+        if chunk or start == floor:
+            break
+        end = start
+    if not chunk:
+        return True # Nothing since the start of the file or the last directive
+    char = chunk[-1]
+    if not (char.isalnum() or char in "_$"):
+        return char in ";):"
+    word = _TRAILING_WORD_RE.search(chunk).group()
+    if word in _STATEMENT_KEYWORDS:
+        return True
+    if word in _VERILOG_KEYWORDS:
+        return False
+    # A block label, as in `begin : g_lanes`
+    before = text[max(floor, start + len(chunk) - len(word) - 64):start + len(chunk) - len(word)].rstrip()
+    return before.endswith(":")
+
+
+def _skip_inactive(text, pos, conditions, defined):
+    """Skips an inactive `ifdef branch; returns where parsing resumes."""
+    depth = 0
+    while True:
+        match = _CONDITIONAL_RE.search(text, pos)
+        if not match:
+            return len(text)
+        pos = match.end()
+        directive = match.group(1)
+        if directive in ("ifdef", "ifndef"):
+            depth += 1
+        elif depth:
+            depth -= directive == "endif"
+        elif directive == "endif":
+            conditions.pop()
+            return pos
+        elif not conditions[-1]:
+            if directive == "else":
+                conditions[-1] = True
+                return pos
+            name = _MACRO_NAME_RE.match(text, pos)
+            if name:
+                pos = name.end()
+                if name.group(1) in defined:
+                    conditions[-1] = True
+                    return pos
+
+
+def _expression_end(text, pos):
+    """Returns where the expression starting at ``pos`` ends: the first ``,``, ``;`` or unmatched ``)`` at depth 0."""
+    depth = 0
+    for i in range(pos, len(text)):
+        char = text[i]
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            if not depth:
+                return i
+            depth -= 1
+        elif char in ",;" and not depth:
+            return i
+    return len(text)
+
+
+def _scan_ports(text, pos, direction, ports, line_at):
+    """Collects the names declared after a direction keyword; returns where the declaration ends."""
+    while True:
+        end = _DECLARATION_ITEM_RE.match(text, pos).end()
+        names = [word for word in _ITEM_WORD_RE.findall(text, pos, end) if word and word not in _NET_TYPE_WORDS]
+        if names:
+            ports.append({"name": names[-1], "direction": direction, "line": line_at(text.rfind(names[-1], pos, end))})
+        if text.startswith("=", end):
+            end = _expression_end(text, end + 1) # Default value
+        if not text.startswith(",", end):
+            return end + 1 if text.startswith(";", end) else end
+        pos = end + 1
+        if _DECLARATION_KEYWORD_RE.match(text, pos):
+            return pos # `input a, output b`: the next declaration starts here
+
+
+def _scan_parameters(text, pos, local, parameters, line_at):
+    """Collects ``name = value`` assignments after parameter/localparam; returns where they end."""
+    while True:
+        end = _DECLARATION_ITEM_RE.match(text, pos).end()
+        if text.startswith("=", end):
+            value_end = _expression_end(text, end + 1)
+            words = [word for word in _ITEM_WORD_RE.findall(text, pos, end) if word]
+            if words:
+                parameters.append({"name": words[-1], "value": " ".join(text[end + 1:value_end].split()),
+                                   "local": local, "line": line_at(text.rfind(words[-1], pos, end))})
+            end = value_end
+        if not text.startswith(",", end):
+            return end + 1 if text.startswith(";", end) else end
+        pos = end + 1
+        if _DECLARATION_KEYWORD_RE.match(text, pos):
+            return pos
+
+
+def _parse_verilog_source(content, file_path, defines=()):
+    """
+    Parses one Verilog source in a single pass over its text.
+
+    Comments and strings are blanked out first; a scanner regex then yields
+    only the events the hierarchy needs (module boundaries, declarations,
+    instance starts and compiler directives), so constructs spanning lines,
+    `#(...)` parameter lists, generate blocks and multi-instance statements are
+    handled. `ifdef/`ifndef/`elsif/`else are evaluated against ``defines`` and
+    the macros `define'd earlier in the file.
+
+    Returns the modules in definition order as ``[{"name", "definition_line",
+    "instances": [{"type", "name", "file_path", "line"}], "ports": [{"name", "direction", "line"}],
+    "parameters": [{"name", "value", "local", "line"}]}]``.
+    """
+    text = _COMMENT_STRING_RE.sub(_blank, content)
+    modules = []
+    current_module = None
+    in_subroutine = False
+    defined = set(defines)
+    conditions = [] # One "a branch was taken" flag per open `ifdef
+    line, line_pos = 1, 0
+    directive_end = 0
+
+    def line_at(pos):
+        nonlocal line, line_pos
+        line += text.count("\n", line_pos, pos)
+        line_pos = pos
+        return line
+
+    pos = 0
+    while True:
+        match = _EVENT_RE.search(text, pos)
+        if not match:
+            break
+        pos = match.end()
+        kind = match.lastgroup
+
+        if kind == "instance":
+            inst_type = _WORD_RE.match(text, match.start()).group()
+            if current_module is None or in_subroutine or inst_type in _VERILOG_KEYWORDS or not _starts_statement(text, match.start(), directive_end):
+                pos = match.start("instance") # The second word may itself start an instance
+                continue
+            inst_line = line_at(match.start())
+            current_module["instances"].append({"type": inst_type, "name": match.group("instance"), "file_path": file_path, "line": inst_line})
+            pos = _balanced_end(text, pos - 1)
+            while True: # `sub u1 (...), u2 (...);`
+                more = _MORE_INSTANCES_RE.match(text, pos)
+                if not more:
+                    break
+                current_module["instances"].append({"type": inst_type, "name": more.group(1), "file_path": file_path, "line": inst_line})
+                pos = _balanced_end(text, more.end() - 1)
+        elif kind in ("input", "output", "inout"):
+            if current_module is not None and not in_subroutine:
+                pos = _scan_ports(text, pos, kind, current_module["ports"], line_at)
+        elif kind in ("parameter", "localparam"):
+            if current_module is not None and not in_subroutine:
+                pos = _scan_parameters(text, pos, kind == "localparam", current_module["parameters"], line_at)
+        elif kind == "module_name":
+            if current_module is None:
+                current_module = {"name": match.group("module_name"), "definition_line": line_at(match.start()),
+                                  "instances": [], "ports": [], "parameters": []}
+                modules.append(current_module)
+        elif kind == "endmodule":
+            current_module = None
+            in_subroutine = False
+        elif kind == "function" or kind == "task":
+            in_subroutine = True
+        elif kind == "endsubroutine":
+            in_subroutine = False
+        else:
+            directive = match.group("directive")
+            if directive == "define" or directive == "undef":
+                name = _MACRO_NAME_RE.match(text, pos)
+                if name:
+                    (defined.add if directive == "define" else defined.discard)(name.group(1))
+                if directive == "define":
+                    pos = _logical_line_end(text, pos)
+            elif directive == "ifdef" or directive == "ifndef":
+                name = _MACRO_NAME_RE.match(text, pos)
+                if name:
+                    pos = name.end()
+                taken = bool(name) and (name.group(1) in defined) == (directive == "ifdef")
+                conditions.append(taken)
+                if not taken:
+                    pos = _skip_inactive(text, pos, conditions, defined)
+            elif directive == "endif":
+                if conditions:
+                    conditions.pop()
+            elif directive == "elsif" or directive == "else":
+                if conditions: # Ends the branch that was taken
+                    conditions[-1] = True
+                    pos = _skip_inactive(text, pos, conditions, defined)
+            elif directive in _LINE_DIRECTIVES:
+                pos = _logical_line_end(text, pos)
+            else:
+                # A macro use only ends a statement when it stands alone on its line, as in `RESET_LOGIC
+                end = _balanced_end(text, pos) if text.startswith("(", pos) else pos
+                line_end = _logical_line_end(text, end)
+                if text[end:line_end].strip() or text[text.rfind("\n", 0, match.start()) + 1:match.start()].strip():
+                    continue
+                pos = line_end
+            directive_end = pos
+    return modules
+
+
+def _parse_verilog_file(file_path, known_digest=None, defines=()):
+    """
+    Reads and parses one source file; runs in the parser pools.
+    Returns ``(file_path, (mtime_ns, size, digest, modules), error)``. ``modules``
+    is None when the content hash equals ``known_digest`` (nothing to re-parse).
+    """
+    try:
+        st = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha1(data).digest()
+        if digest == known_digest:
+            return file_path, (st.st_mtime_ns, st.st_size, digest, None), None
+        return file_path, (st.st_mtime_ns, st.st_size, digest, _parse_verilog_source(data.decode("utf-8"), file_path, defines)), None
+    except Exception as e: # Returned as text so it always pickles back from a worker process
+        return file_path, None, f"{type(e).__name__}: {e}"
+
+
+def _parse_verilog_file_batch(items, defines=()):
+    return [_parse_verilog_file(file_path, known_digest, defines) for file_path, known_digest in items]
+
+
+class ParseCache:
+    """Per-file hierarchy parse results, reused while a file is unchanged.
+
+    An entry is valid while the file's mtime and size match. A file whose
+    stat changed but whose content hash did not (a touch, a branch switch
+    back and forth) is re-read but not parsed again. Results depend on the
+    macros defined for `ifdef evaluation, so changing them drops every entry.
+    """
+
+    def __init__(self, index=None, defines=()):
+        self._entries = {} # {file_path: (mtime_ns, size, digest, modules)}
+        self._lock = threading.Lock()
+        self.parsed = 0 # Files actually parsed, for diagnostics
+        self.defines = tuple(sorted(set(defines)))
+        self.index = None
+        if index:
+            self.attach(index)
+
+    def attach(self, index):
+        """Switches to ``index`` as the persistent store and loads every file it already knows."""
+        entries = index.load(self.defines)
+        with self._lock:
+            self.index = index
+            self._entries = entries
+
+    def set_defines(self, defines):
+        """Sets the macros used for `ifdef evaluation; returns whether they changed."""
+        defines = tuple(sorted(set(defines)))
+        if defines == self.defines:
+            return False
+        entries = self.index.load(defines) if self.index else {}
+        with self._lock:
+            self.defines = defines
+            self._entries = entries
+        return True
+
+    def fresh(self, file_path):
+        """Returns the cached modules if the file's stat is unchanged, else None; OSError propagates."""
+        st = os.stat(file_path)
+        with self._lock:
+            entry = self._entries.get(file_path)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[3]
+        return None
+
+    def cached(self, file_path):
+        """Returns the cached modules without checking the file, or None if there are none."""
+        with self._lock:
+            entry = self._entries.get(file_path)
+        return entry[3] if entry else None
+
+    def digest(self, file_path):
+        entry = self._entries.get(file_path)
+        return entry[2] if entry else None
+
+    def store(self, file_path, entry, defines=None):
+        """Records a ``(mtime_ns, size, digest, modules)`` result of ``_parse_verilog_file``
+        and returns the modules; None modules mean the cached ones are still current.
+        A result parsed for other ``defines`` than the current ones is not kept.
+        Raises ValueError if the file must be parsed again and cannot be read."""
+        with self._lock:
+            stale = defines is not None and defines != self.defines
+            current = self._entries.get(file_path)
+        if entry[3] is None and (stale or current is None or current[2] != entry[2]):
+            # The entry this result was checked against was replaced or dropped meanwhile
+            _, entry, error = _parse_verilog_file(file_path, None, self.defines if defines is None else defines)
+            if error:
+                raise ValueError(error)
+        mtime_ns, size, digest, modules = entry
+        with self._lock:
+            if modules is None:
+                modules = current[3]
+            else:
+                self.parsed += 1
+            if stale:
+                return modules
+            self._entries[file_path] = (mtime_ns, size, digest, modules)
+        if self.index:
+            self.index.update_file(file_path, (mtime_ns, size, digest, modules))
+        return modules
+
+    def flush(self):
+        """Commits pending index writes."""
+        if self.index:
+            self.index.commit()
+
+    def get(self, file_path):
+        """Returns the modules of ``file_path``, parsing it on this thread if needed."""
+        modules = self.fresh(file_path)
+        if modules is not None:
+            return modules
+        _, entry, error = _parse_verilog_file(file_path, self.digest(file_path), self.defines)
+        if error:
+            raise ValueError(error)
+        return self.store(file_path, entry)
+
+    def retain(self, file_paths):
+        """Drops entries of files that are no longer part of the project."""
+        keep = set(file_paths)
+        with self._lock:
+            dropped = [path for path in self._entries if path not in keep]
+            for file_path in dropped:
+                del self._entries[file_path]
+        if self.index:
+            self.index.remove_files(dropped)
+            self.index.commit()
+
+
+class SymbolIndex:
+    """Persistent SQLite index of the modules, instances, ports and parameters of a project.
+
+    Rows are stored per source file together with the file's stat and
+    content hash, so only changed files are rewritten and a reopened project
+    needs no parsing. The database sits next to the project file; an
+    unsaved project uses an in-memory database. One connection is shared
+    behind a lock, so any thread may call in.
+    """
+
+    SCHEMA_VERSION = 2 # Bump when the schema or the parser output changes; old databases are rebuilt
+    SCHEMA = """
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime_ns INTEGER, size INTEGER, digest BLOB);
+        CREATE TABLE modules (id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+                              ordinal INTEGER, name TEXT NOT NULL, line INTEGER);
+        CREATE TABLE instances (module_id INTEGER NOT NULL REFERENCES modules(id) ON DELETE CASCADE,
+                                ordinal INTEGER, type TEXT NOT NULL, name TEXT, line INTEGER);
+        CREATE TABLE ports (module_id INTEGER NOT NULL REFERENCES modules(id) ON DELETE CASCADE,
+                            ordinal INTEGER, name TEXT NOT NULL, direction TEXT, line INTEGER);
+        CREATE TABLE parameters (module_id INTEGER NOT NULL REFERENCES modules(id) ON DELETE CASCADE,
+                                 ordinal INTEGER, name TEXT NOT NULL, value TEXT, local INTEGER, line INTEGER);
+        CREATE INDEX modules_name ON modules(name);
+        CREATE INDEX modules_file ON modules(file_id);
+        CREATE INDEX instances_type ON instances(type);
+        CREATE INDEX instances_module ON instances(module_id);
+        CREATE INDEX ports_module ON ports(module_id);
+        CREATE INDEX parameters_module ON parameters(module_id);
+    """
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.Lock()
+        self.path = path
+        try:
+            self._conn = self._open(path)
+        except sqlite3.DatabaseError as e:
+            print(f"符号索引 {path} 无法打开，已重建: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+            self._conn = self._open(path)
+
+    @staticmethod
+    def path_for_project(project_file):
+        return os.path.splitext(project_file)[0] + ".symbols.db"
+
+    def _open(self, path):
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        has_meta = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'").fetchone()
+        version = has_meta and conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if not version or version[0] != str(self.SCHEMA_VERSION):
+            for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            conn.executescript(self.SCHEMA)
+            conn.execute("INSERT INTO meta VALUES ('schema', ?)", (str(self.SCHEMA_VERSION),))
+            conn.commit()
+        return conn
+
+    def load(self, defines=()):
+        """Returns ``{file_path: (mtime_ns, size, digest, modules)}`` for every indexed file.
+        Rows parsed with other `ifdef ``defines`` are dropped first."""
+        with self._lock:
+            conn = self._conn
+            signature = json.dumps(list(defines))
+            stored = conn.execute("SELECT value FROM meta WHERE key = 'defines'").fetchone()
+            if not stored or stored[0] != signature:
+                conn.execute("DELETE FROM files")
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('defines', ?)", (signature,))
+                conn.commit()
+            files = {file_id: (path, mtime_ns, size, digest, [])
+                     for file_id, path, mtime_ns, size, digest in conn.execute("SELECT id, path, mtime_ns, size, digest FROM files")}
+            modules = {}
+            for module_id, file_id, name, line in conn.execute("SELECT id, file_id, name, line FROM modules ORDER BY file_id, ordinal"):
+                module = {"name": name, "definition_line": line, "instances": [], "ports": [], "parameters": []}
+                modules[module_id] = (module, files[file_id][0])
+                files[file_id][4].append(module)
+            for module_id, type_, name, line in conn.execute("SELECT module_id, type, name, line FROM instances ORDER BY module_id, ordinal"):
+                module, file_path = modules[module_id]
+                module["instances"].append({"type": type_, "name": name, "file_path": file_path, "line": line})
+            for module_id, name, direction, line in conn.execute("SELECT module_id, name, direction, line FROM ports ORDER BY module_id, ordinal"):
+                modules[module_id][0]["ports"].append({"name": name, "direction": direction, "line": line})
+            for module_id, name, value, local, line in conn.execute(
+                    "SELECT module_id, name, value, local, line FROM parameters ORDER BY module_id, ordinal"):
+                modules[module_id][0]["parameters"].append({"name": name, "value": value, "local": bool(local), "line": line})
+        return {path: (mtime_ns, size, digest, file_modules) for path, mtime_ns, size, digest, file_modules in files.values()}
+
+    def update_file(self, file_path, entry):
+        """Replaces the rows of one file; call commit() to make them durable."""
+        mtime_ns, size, digest, modules = entry
+        with self._lock:
+            conn = self._conn
+            conn.execute("DELETE FROM files WHERE path = ?", (file_path,))
+            file_id = conn.execute("INSERT INTO files (path, mtime_ns, size, digest) VALUES (?, ?, ?, ?)",
+                                   (file_path, mtime_ns, size, digest)).lastrowid
+            for ordinal, module in enumerate(modules):
+                module_id = conn.execute("INSERT INTO modules (file_id, ordinal, name, line) VALUES (?, ?, ?, ?)",
+                                         (file_id, ordinal, module["name"], module["definition_line"])).lastrowid
+                conn.executemany("INSERT INTO instances VALUES (?, ?, ?, ?, ?)",
+                                 [(module_id, i, inst["type"], inst["name"], inst["line"]) for i, inst in enumerate(module["instances"])])
+                conn.executemany("INSERT INTO ports VALUES (?, ?, ?, ?, ?)",
+                                 [(module_id, i, port["name"], port["direction"], port["line"]) for i, port in enumerate(module.get("ports", ()))])
+                conn.executemany("INSERT INTO parameters VALUES (?, ?, ?, ?, ?, ?)",
+                                 [(module_id, i, param["name"], param["value"], int(param["local"]), param["line"])
+                                  for i, param in enumerate(module.get("parameters", ()))])
+
+    def remove_files(self, file_paths):
+        if file_paths:
+            with self._lock:
+                self._conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in file_paths])
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def definitions(self, module_name):
+        """Returns ``[(file_path, line)]`` of every definition of ``module_name``."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT files.path, modules.line FROM modules JOIN files ON files.id = modules.file_id "
+                "WHERE modules.name = ? ORDER BY files.path, modules.line", (module_name,)).fetchall()
+
+    def references(self, module_name):
+        """Returns ``[(file_path, line, instance_name, parent_module)]`` of every instance of ``module_name``."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT files.path, instances.line, instances.name, modules.name FROM instances "
+                "JOIN modules ON modules.id = instances.module_id JOIN files ON files.id = modules.file_id "
+                "WHERE instances.type = ? ORDER BY files.path, instances.line", (module_name,)).fetchall()
+
+    def ports(self, module_name):
+        """Returns ``[(name, direction, line)]`` of the first definition of ``module_name``."""
+        return self._module_rows("SELECT name, direction, line FROM ports WHERE module_id = ? ORDER BY ordinal", module_name)
+
+    def parameters(self, module_name):
+        """Returns ``[(name, value, local, line)]`` of the first definition of ``module_name``."""
+        return self._module_rows("SELECT name, value, local, line FROM parameters WHERE module_id = ? ORDER BY ordinal", module_name)
+
+    def _module_rows(self, query, module_name):
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM modules WHERE name = ? ORDER BY id LIMIT 1", (module_name,)).fetchone()
+            return self._conn.execute(query, row).fetchall() if row else []
+
+    def save_as(self, path):
+        """Copies the index to ``path`` and continues there (used when a project is saved under a new name)."""
+        with self._lock:
+            self._conn.commit()
+            if os.path.abspath(path) == os.path.abspath(self.path):
+                return
+            target = sqlite3.connect(path, check_same_thread=False)
+            self._conn.backup(target)
+            self._conn.close()
+            target.close()
+            self._conn = self._open(path)
+            self.path = path
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+class HierarchyParser:
+    """Parses project sources for the hierarchy viewer off the Tk thread.
+
+    A coordinator thread takes unchanged files from the ParseCache and fans
+    the rest out in batches: to a process pool when there is enough source
+    to be worth it, to a thread pool otherwise. It puts
+    ``("progress", generation, done, total)`` and finally
+    ``("done", generation, {file_path: modules}, {file_path: error})`` on
+    ``results``. Starting a new run abandons the previous one. When the
+    caller knows which files changed (``touched``), the others are taken
+    from the cache without even a stat.
+    """
+
+    PROCESS_POOL_MIN_BYTES = 8 * 1024 * 1024 # Below this, process start-up and pickling cost more than they save
+    BATCH_FILES = 32
+
+    def __init__(self, cache, max_workers=None):
+        self.cache = cache
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.results = queue.Queue()
+        self.generation = 0
+        self._process_pool = None # Kept across runs; worker processes are expensive to start
+        self._lock = threading.Lock()
+
+    def start(self, files, touched=None):
+        self.generation += 1
+        touched = None if touched is None else frozenset(touched)
+        threading.Thread(target=self._run, args=(self.generation, list(files), touched), name="hierarchy-parser", daemon=True).start()
+        return self.generation
+
+    def shutdown(self):
+        self.generation += 1
+        with self._lock:
+            if self._process_pool:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+
+    def _run(self, generation, files, touched=None):
+        defines = self.cache.defines
+        parsed, errors = {}, {}
+        stale = []
+        stale_bytes = 0
+        for file_path in files:
+            if touched is not None and file_path not in touched:
+                modules = self.cache.cached(file_path)
+                if modules is not None:
+                    parsed[file_path] = modules
+                    continue
+            try:
+                modules = self.cache.fresh(file_path)
+            except OSError as e:
+                errors[file_path] = f"{type(e).__name__}: {e}"
+                continue
+            if modules is None:
+                stale.append((file_path, self.cache.digest(file_path)))
+                try:
+                    stale_bytes += os.path.getsize(file_path)
+                except OSError:
+                    pass
+            else:
+                parsed[file_path] = modules
+        total = len(files)
+        done = total - len(stale)
+        self.results.put(("progress", generation, done, total))
+
+        if stale:
+            batches = [stale[i:i + self.BATCH_FILES] for i in range(0, len(stale), self.BATCH_FILES)]
+            if stale_bytes >= self.PROCESS_POOL_MIN_BYTES and len(batches) > 1:
+                executor, owned = self._get_process_pool(), False
+            else:
+                executor, owned = ThreadPoolExecutor(min(self.max_workers, len(batches)), thread_name_prefix="hierarchy-parse"), True
+            try:
+                futures = [executor.submit(_parse_verilog_file_batch, batch, defines) for batch in batches]
+                for future in as_completed(futures):
+                    if generation != self.generation:
+                        for pending in futures:
+                            pending.cancel()
+                        return
+                    try:
+                        batch_results = future.result()
+                    except Exception as e: # A worker process died; parse its batch here instead
+                        batch_results = _parse_verilog_file_batch(batches[futures.index(future)], defines)
+                        print(f"层次解析进程失败，已在本地重试: {e}")
+                    for file_path, entry, error in batch_results:
+                        if not error:
+                            try:
+                                parsed[file_path] = self.cache.store(file_path, entry, defines)
+                            except ValueError as e:
+                                error = str(e)
+                        if error:
+                            errors[file_path] = error
+                    done += len(batch_results)
+                    self.results.put(("progress", generation, done, total))
+            finally:
+                if owned:
+                    executor.shutdown(wait=False)
+                self.cache.flush()
+        self.results.put(("done", generation, parsed, errors))
+
+    def _get_process_pool(self):
+        with self._lock:
+            if self._process_pool is None:
+                # "spawn" everywhere: forking a process that runs Tk and other threads is not safe
+                self._process_pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._process_pool
+
+class DesignHierarchy:
+    """The elaborated design as a graph of modules rather than a tree of instances.
+
+    Each module is a node and its instantiations of defined modules are
+    counted edges, so a submodule shared by many instances is analysed once.
+    Per module it holds ``instance_counts`` (occurrences in the elaborated
+    design), ``subtree_sizes`` (instances below one occurrence) and
+    ``depths`` (deepest level it occurs at, 0 for a root). An instantiation
+    that closes a cycle is kept in ``back_edges`` and left out of those
+    numbers; ``cycles`` lists each cycle as a module path back to its start.
+    ``roots`` are the top-level modules, plus one entry module for each
+    cycle no top-level module reaches.
+    """
+
+    def __init__(self, modules):
+        self.modules = modules
+        self.edges = {} # {module_name: {child_module: instance count}}
+        for name, details in modules.items():
+            counts = {}
+            for instance in details["instances"]:
+                if instance["type"] in modules:
+                    counts[instance["type"]] = counts.get(instance["type"], 0) + 1
+            self.edges[name] = counts
+        instantiated = {child for counts in self.edges.values() for child in counts}
+        self.tops = sorted(modules.keys() - instantiated)
+        self.roots, order, self.back_edges, self.cycles = self._walk(self.tops + sorted(instantiated))
+        if len(self.roots) > len(self.tops):
+            # Some cycles are not reached from a top. Walking again in this order starts each of them
+            # from a module nothing else instantiates them through (as in Kosaraju's algorithm).
+            self.roots, order, self.back_edges, self.cycles = self._walk(self.tops + order)
+
+        # Children before parents for sizes, parents before children for counts and depths
+        self.subtree_sizes = {}
+        for name in reversed(order):
+            self.subtree_sizes[name] = sum(count * (1 + self.subtree_sizes[child])
+                                           for child, count in self.edges[name].items() if (name, child) not in self.back_edges)
+        self.instance_counts = dict.fromkeys(modules, 0)
+        self.depths = dict.fromkeys(modules, 0)
+        for root in self.roots:
+            self.instance_counts[root] = 1
+        for name in order:
+            for child, count in self.edges[name].items():
+                if (name, child) not in self.back_edges:
+                    self.instance_counts[child] += self.instance_counts[name] * count
+                    self.depths[child] = max(self.depths[child], self.depths[name] + 1)
+
+    def _walk(self, starts):
+        """Depth-first search without recursion. Returns the modules it started from, a topological
+        order ignoring the back edges, the back edges and the cycles they close."""
+        state = {} # 1 while on the current path, 2 when finished
+        roots, postorder = [], []
+        back_edges, cycles = set(), []
+        for start in starts:
+            if start in state:
+                continue
+            roots.append(start)
+            state[start] = 1
+            path, pending = [start], [iter(self.edges[start])]
+            while pending:
+                for child in pending[-1]:
+                    seen = state.get(child)
+                    if seen is None:
+                        state[child] = 1
+                        path.append(child)
+                        pending.append(iter(self.edges[child]))
+                        break
+                    if seen == 1:
+                        back_edges.add((path[-1], child))
+                        cycles.append(path[path.index(child):] + [child])
+                else:
+                    pending.pop()
+                    finished = path.pop()
+                    state[finished] = 2
+                    postorder.append(finished)
+        postorder.reverse()
+        return roots, postorder, back_edges, cycles
+
+    @property
+    def total_instances(self):
+        return sum(1 + self.subtree_sizes[root] for root in self.roots)
+
+
+class FileWatcher:
+    """Reports changes to a set of files, whichever program made them.
+
+    On Linux this uses inotify (through ctypes) on the files' directories,
+    so editors and generators that replace a file by renaming over it are
+    seen as well; elsewhere, or if inotify is unavailable, the files' mtime
+    and size are polled. Changed paths are put on ``changes`` as sets, from
+    a background thread; debouncing bursts of them is left to the consumer.
+    """
+
+    POLL_SECONDS = 1.0
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    INOTIFY_MASK = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+    IN_Q_OVERFLOW = 0x4000
+    _EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+    def __init__(self):
+        self.changes = queue.Queue()
+        self._paths = frozenset()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._libc = None
+        self._fd = -1
+        self._watches = {} # {directory: wd}
+        self._directories = {} # {wd: directory}
+        if sys.platform.startswith("linux"):
+            try:
+                self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            except (OSError, AttributeError):
+                self._fd = -1
+        self.backend = "inotify" if self._fd >= 0 else "polling"
+        target = self._read_events if self._fd >= 0 else self._poll
+        threading.Thread(target=target, name="file-watcher", daemon=True).start()
+
+    def set_paths(self, paths):
+        """Replaces the set of watched files; does nothing once the watcher is stopped."""
+        if self._stop.is_set():
+            return
+        paths = frozenset(os.path.abspath(path) for path in paths)
+        with self._lock:
+            self._paths = paths
+            if self._fd < 0: # Polling, or the inotify descriptor is already closed
+                return
+            directories = {os.path.dirname(path) for path in paths}
+            for directory in set(self._watches) - directories:
+                wd = self._watches.pop(directory)
+                self._directories.pop(wd, None)
+                self._libc.inotify_rm_watch(self._fd, wd)
+            for directory in directories - set(self._watches):
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.INOTIFY_MASK)
+                if wd < 0:
+                    print(f"无法监视目录 {directory}: {os.strerror(ctypes.get_errno())}")
+                    continue
+                self._watches[directory] = wd
+                self._directories[wd] = directory
+
+    def stop(self):
+        self._stop.set()
+
+    def _read_events(self):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = b""
+                while True:
+                    try:
+                        chunk = os.read(self._fd, 64 * 1024)
+                    except BlockingIOError:
+                        break
+                    if not chunk:
+                        break
+                    data += chunk
+                changed = set()
+                with self._lock:
+                    offset = 0
+                    while offset + self._EVENT_HEADER.size <= len(data):
+                        wd, mask, _, length = self._EVENT_HEADER.unpack_from(data, offset)
+                        offset += self._EVENT_HEADER.size
+                        name = data[offset:offset + length].split(b"\0", 1)[0]
+                        offset += length
+                        if mask & self.IN_Q_OVERFLOW:
+                            changed.update(self._paths) # Events were lost; treat everything as changed
+                        elif wd in self._directories and name:
+                            path = os.path.join(self._directories[wd], os.fsdecode(name))
+                            if path in self._paths:
+                                changed.add(path)
+                if changed:
+                    self.changes.put(changed)
+        finally:
+            with self._lock: # set_paths must not reach a closed (or reused) descriptor number
+                fd, self._fd = self._fd, -1
+                self._watches.clear()
+                self._directories.clear()
+            os.close(fd)
+
+    def _poll(self):
+        def snapshot(paths):
+            stats = {}
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                    stats[path] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    stats[path] = None
+            return stats
+
+        watched, stats = frozenset(), {}
+        while not self._stop.wait(self.POLL_SECONDS):
+            paths = self._paths
+            if paths is not watched:
+                # New paths start from their current state, not as changes
+                stats = {**snapshot(paths - watched), **{path: stats[path] for path in paths & watched}}
+                watched = paths
+                continue
+            current = snapshot(paths)
+            changed = {path for path in paths if current[path] != stats.get(path)}
+            stats = current
+            if changed:
+                self.changes.put(changed)
+
+
+def _log_line_tag(line):
+    """The console tag of an output line: "ERROR", "WARNING" or None."""
+    lower = line.lower()
+    if "error" in lower:
+        return "ERROR"
+    if "warning" in lower:
+        return "WARNING"
+    return None
+
+
+class CommandRunner:
+    """Runs an external command with its output read off the Tk thread.
+
+    A reader thread takes whatever the pipe has (so a chatty process is read
+    in large chunks and a quiet one line by line), splits it into lines,
+    tags each one, appends them to the run's RunLog if there is one, and puts
+    ``("output", run_id, [(line, tag), ...])`` on ``results``; the run ends
+    with ``("exit", run_id, stats)``, or ``("error", run_id, message)`` if
+    the command could not be started.
+
+    The command gets its own process group, so stop() and the timeout reach
+    whatever it spawned too: the group is terminated, then killed if it is
+    still there after KILL_GRACE_SECONDS. ``stats`` holds the return code,
+    wall time, user/system CPU seconds and peak RSS in bytes of the child
+    (from wait4; None where the platform does not report them) and why the
+    run was stopped, if it was ("stopped" or "timeout").
+    """
+
+    READ_BYTES = 64 * 1024
+    KILL_GRACE_SECONDS = 3.0
+
+    def __init__(self):
+        self.results = queue.Queue()
+        self.run_id = 0
+        self._run_state = None
+        self._lock = threading.Lock()
+
+    def start(self, command_list, cwd=None, log=None, timeout=None):
+        """Starts ``command_list``; its output is also appended to the RunLog ``log`` if given.
+        After ``timeout`` seconds the run is stopped as by stop()."""
+        self.run_id += 1
+        run = {"id": self.run_id, "process": None, "stopped": None, "exited": False, "timers": []}
+        self._run_state = run
+        threading.Thread(target=self._run, args=(run, list(command_list), cwd, log), name="command-reader", daemon=True).start()
+        if timeout:
+            self._start_timer(run, timeout, self._stop_run, run, "timeout")
+        return self.run_id
+
+    def stop(self):
+        """Stops the current run, if any."""
+        if self._run_state:
+            self._stop_run(self._run_state, "stopped")
+
+    def _start_timer(self, run, seconds, function, *args):
+        timer = threading.Timer(seconds, function, args=args)
+        timer.daemon = True
+        run["timers"].append(timer)
+        timer.start()
+
+    def _stop_run(self, run, reason):
+        with self._lock:
+            if run["stopped"] or run["exited"]:
+                return
+            run["stopped"] = reason
+            process = run["process"]
+        if process: # Otherwise _run stops it as soon as it has started
+            self._signal_group(run, kill=False)
+            self._start_timer(run, self.KILL_GRACE_SECONDS, self._signal_group, run, True)
+
+    def _signal_group(self, run, kill):
+        with self._lock:
+            if run["exited"]: # Reaped; its pid may belong to someone else now
+                return
+            pid = run["process"].pid
+        try:
+            if os.name == 'nt':
+                if kill:
+                    subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True,
+                                   creationflags=subprocess.CREATE_NO_WINDOW)
+                else:
+                    run["process"].send_signal(signal.CTRL_BREAK_EVENT)
+            else:
+                os.killpg(pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except (OSError, ValueError):
+            pass # Already gone
+
+    def _run(self, run, command_list, cwd, log):
+        run_id = run["id"]
+        try:
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                command_list,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT, # 将错误输出重定向到标准输出
+                cwd=cwd,
+                start_new_session=os.name != 'nt', # Own process group, so it can be stopped as a whole
+                # Windows下不显示控制台窗口
+                creationflags=subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0
+            )
+        except FileNotFoundError:
+            self.results.put(("error", run_id, f"错误: 命令 '{command_list[0]}' 未找到。请确保它已安装并位于系统PATH中。\n"))
+            return
+        except Exception as e:
+            self.results.put(("error", run_id, f"发生未知错误: {e}\n"))
+            return
+        with self._lock:
+            run["process"] = process
+            stopped_early = run["stopped"]
+        if stopped_early:
+            run["stopped"] = None
+            self._stop_run(run, stopped_early)
+
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        fd = process.stdout.fileno()
+        pending = ""
+        while True:
+            chunk = os.read(fd, self.READ_BYTES)
+            lines = (pending + decoder.decode(chunk, final=not chunk)).replace("\r\n", "\n").split("\n")
+            pending = lines.pop() # An incomplete last line, or "" after a newline
+            batch = [(line + "\n", _log_line_tag(line)) for line in lines]
+            if not chunk and pending:
+                batch.append((pending, _log_line_tag(pending)))
+            if batch:
+                if log:
+                    log.append([line for line, _ in batch])
+                self.results.put(("output", run_id, batch))
+            if not chunk:
+                break
+        process.stdout.close()
+        returncode, usage = self._wait(process)
+        wall = time.perf_counter() - started
+        with self._lock:
+            run["exited"] = True
+        for timer in run["timers"]:
+            timer.cancel()
+        user, system, max_rss = usage or (None, None, None)
+        self.results.put(("exit", run_id, {"returncode": returncode, "wall": wall, "user": user, "sys": system,
+                                           "max_rss": max_rss, "stopped": run["stopped"]}))
+
+    @staticmethod
+    def _wait(process):
+        """Reaps the process; returns its exit code and (user, sys, peak RSS bytes) where wait4 exists."""
+        if hasattr(os, "wait4"):
+            try:
+                _, status, usage = os.wait4(process.pid, 0)
+            except ChildProcessError:
+                return process.wait(), None
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+            max_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+            return process.returncode, (usage.ru_utime, usage.ru_stime, max_rss)
+        return process.wait(), None
+
+
+def _format_run_stats(stats):
+    """One-line summary of a run's wall time, CPU time and peak memory."""
+    parts = [f"用时 {stats['wall']:.2f} s"]
+    if stats.get("user") is not None:
+        parts.append(f"用户 CPU {stats['user']:.2f} s")
+        parts.append(f"系统 CPU {stats['sys']:.2f} s")
+    if stats.get("max_rss") is not None:
+        parts.append(f"峰值内存 {stats['max_rss'] / 2**20:.1f} MB")
+    return " | ".join(parts)
+
+
+class RunLog:
+    """The complete output of one command run, spilled to a file on disk.
+
+    The console only keeps the last lines of a run; this keeps all of them,
+    with the byte offset of every line start in an array, so any range of
+    lines can be read back and a search match mapped to its line number
+    without scanning the file. Lines are appended by the reader thread and
+    read on the Tk thread, so access goes through a lock. Only the newest
+    ``KEEP`` logs are left in the directory.
+    """
+
+    KEEP = 20
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, time.strftime("run-%Y%m%d-%H%M%S-") + f"{time.time_ns() % 10**9:09d}.log")
+        self._file = open(self.path, "wb")
+        self._offsets = array("Q", [0]) # Start of every line, then the end of the file
+        self._lock = threading.Lock()
+        logs = [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith("run-") and name.endswith(".log")]
+        for stale in sorted(logs, key=os.path.getmtime)[:-self.KEEP]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    @property
+    def line_count(self):
+        return len(self._offsets) - 1
+
+    def append(self, lines):
+        """Appends lines (each ending with a newline, except perhaps the last of the run)."""
+        encoded = [line.encode("utf-8") for line in lines]
+        with self._lock:
+            self._file.write(b"".join(encoded))
+            end = self._offsets[-1]
+            for data in encoded:
+                end += len(data)
+                self._offsets.append(end)
+
+    def read_lines(self, start, count):
+        """Returns up to ``count`` lines from line ``start`` (0-based)."""
+        with self._lock:
+            start = max(0, min(start, self.line_count))
+            stop = min(start + count, self.line_count)
+            begin, end = self._offsets[start], self._offsets[stop]
+            self._flush()
+        with open(self.path, "rb") as f:
+            f.seek(begin)
+            data = f.read(end - begin)
+        return data.decode("utf-8", "replace").splitlines(keepends=True)
+
+    def _flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    SEARCH_BLOCK_BYTES = 1 << 20
+
+    def search(self, pattern, max_matches=1000):
+        """Returns ``[(line_number, line)]`` (0-based) of the lines matching the str ``pattern``;
+        ^ and $ match at line boundaries. The file is decoded and searched a block of whole
+        lines at a time, so a match does not span SEARCH_BLOCK_BYTES boundaries."""
+        pattern = re.compile(pattern.pattern, pattern.flags | re.MULTILINE)
+        with self._lock:
+            self._flush()
+            offsets = self._offsets[:] # Appends go on while we search
+        line_count = len(offsets) - 1
+        if not offsets[-1]:
+            return []
+        results = []
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            first = 0
+            while first < line_count and len(results) < max_matches:
+                last = min(max(bisect_right(offsets, offsets[first] + self.SEARCH_BLOCK_BYTES) - 1, first + 1), line_count)
+                block = data[offsets[first]:offsets[last]]
+                if block.isascii(): # Byte offsets are character offsets
+                    text = block.decode("ascii")
+                    starts = [offset - offsets[first] for offset in offsets[first:last + 1]]
+                else:
+                    lines = [data[offsets[line]:offsets[line + 1]].decode("utf-8", "replace") for line in range(first, last)]
+                    text = "".join(lines)
+                    starts = list(itertools.accumulate(map(len, lines), initial=0))
+                pos = 0
+                while len(results) < max_matches:
+                    match = pattern.search(text, pos)
+                    if not match:
+                        break
+                    if match.start() >= len(text) and text.endswith("\n"):
+                        break # An empty match after the last newline is not on a line of this block
+                    index = min(bisect_right(starts, match.start()) - 1, len(starts) - 2)
+                    results.append((first + index, text[starts[index]:starts[index + 1]].rstrip("\n")))
+                    pos = starts[index + 1] # One result per line
+                    if pos >= len(text):
+                        break
+                first = last
+        return results
+
+    def close(self):
+        """Stops writing; the lines stay readable from the file."""
+        with self._lock:
+            self._file.close()
+
+
+class RegressionRunner:
+    """Compiles and simulates many testbenches at once on a bounded worker pool.
+
+    Each test is ``{"name", "top", "defines", "parameters", "plusargs"}``:
+    it is compiled with ``-s top``, a ``-D`` per define and a ``-P`` per
+    parameter, and simulated in its own directory under ``output_dir`` (so
+    $dumpfile and other outputs never collide), with everything it printed
+    in the directory's ``run.log``. Tests with the same compile flags share
+    one compile in ``output_dir/.daedalus-build``: the first one compiles, the others
+    wait for its .vvp. A test passes when both steps exit with 0 and the
+    simulation printed no failure line; lines matching METRIC_RE
+    (``METRIC name = value``) are collected into the result's ``metrics``.
+    A failure line matches FAIL_RE: it starts (after blanks and ``*#=>[-``
+    decoration) with ERROR, FATAL, FAIL, FAILED or FAILURE, followed by a
+    colon, ``!``, ``]`` or nothing else. That covers vvp's own ``ERROR:``
+    and ``FATAL:`` lines for $error and $fatal and the usual ``FAIL: ...``
+    and ``*** FAILED ***``; a message that merely contains such a word
+    (``ERROR count: 0``, ``Test FAILED``) does not fail the test.
+    Every step goes through a CommandRunner, so timeouts and stop() reach
+    the whole process group.
+
+    ``results`` receives ``("job", result)`` as each test finishes, then
+    ``("done", results)`` in test order. The log of every finished test is
+    also appended to the RunLog ``merged_log``, in completion order.
+    iverilog runs in ``cwd`` (default: the current directory), where it
+    looks for `include files first.
+    """
+
+    FAIL_RE = re.compile(r"^[\s*#=>\[-]*(?:ERROR|FATAL|FAIL(?:ED|URE)?)(?:\]|\s*[:!]|[\s*=-]*$)")
+    METRIC_RE = re.compile(r"^\s*METRIC\s+([\w.]+)\s*[=:]\s*(\S+)")
+
+    def __init__(self, tool_paths, sources, flags, output_dir, workers=None, timeout=None, build_cache=None, merged_log=None, cwd=None):
+        # The steps run in the test directories, so relative tool paths are resolved now
+        self.tool_paths = {name: os.path.abspath(path) if os.sep in path else path for name, path in tool_paths.items()}
+        self.sources = list(sources)
+        self.flags = list(flags)
+        self.cwd = cwd
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.build_cache = build_cache
+        self.merged_log = merged_log
+        self.results = queue.Queue()
+        self._stopped = False
+        self._active = set() # CommandRunners of the steps being run
+        self._compiles = {} # {compile flags: {"done": Event, "vvp", "step", "output", "owner"}}
+        self._lock = threading.Lock()
+
+    JOB_MARKER = ".daedalus-job" # Written into every test directory; only marked directories are ever deleted
+
+    @staticmethod
+    def job_directory_name(name):
+        return re.sub(r"[^\w.-]", "_", name).lstrip(".") or "_" # Never "." or "..", nor hidden like the build directory
+
+    @classmethod
+    def shared_directories(cls, names):
+        """The names among ``names`` whose job directory is also that of another name."""
+        by_directory = {}
+        for name in names:
+            by_directory.setdefault(cls.job_directory_name(name), []).append(name)
+        return [name for group in by_directory.values() if len(group) > 1 for name in group]
+
+    def job_directory(self, name):
+        return os.path.abspath(os.path.join(self.output_dir, self.job_directory_name(name)))
+
+    @classmethod
+    def check_job_directory(cls, job_dir):
+        """Raises FileExistsError if ``job_dir`` exists but was not created by a runner (say ``rtl`` in an output directory of ".")."""
+        if os.path.lexists(job_dir) and (os.path.islink(job_dir) or not os.path.isfile(os.path.join(job_dir, cls.JOB_MARKER))):
+            raise FileExistsError(f"{job_dir} 已存在且不是回归测试创建的目录，不会删除它；请换一个输出目录或测试名称")
+
+    @classmethod
+    def reset_job_directory(cls, job_dir):
+        """Empties a test directory for a new run, so nothing left over can pass for a result."""
+        cls.check_job_directory(job_dir)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        os.makedirs(job_dir)
+        open(os.path.join(job_dir, cls.JOB_MARKER), "w").close()
+
+    @staticmethod
+    def compile_flags(test):
+        return (["-s", test["top"]] + ["-D" + define for define in test.get("defines", [])]
+                + ["-P" + parameter for parameter in test.get("parameters", [])])
+
+    def start(self, tests):
+        threading.Thread(target=self._run, args=(list(tests),), name="regression", daemon=True).start()
+
+    def stop(self):
+        """Stops the running steps; tests that have not started are reported as stopped."""
+        with self._lock:
+            self._stopped = True
+            active = list(self._active)
+        for runner in active:
+            runner.stop()
+
+    def _run(self, tests):
+        finished = {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(tests)))) as pool:
+            futures = {pool.submit(self.run_test, test): test["name"] for test in tests}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e: # A bug must not take the other tests down with it
+                    result = {"name": futures[future], "status": "ERROR", "message": f"{type(e).__name__}: {e}",
+                              "compile": None, "simulate": None, "wall": 0.0, "log": None}
+                finished[result["name"]] = result
+                if self.merged_log:
+                    self._merge_log(result)
+                self.results.put(("job", result))
+        self.results.put(("done", [finished[test["name"]] for test in tests]))
+
+    def _merge_log(self, result):
+        lines = [f"===== {result['name']}: {result['status']} ({result['wall']:.2f} s) =====\n"]
+        try:
+            with open(result["log"], encoding="utf-8", errors="replace") as f:
+                lines.extend(f)
+        except (OSError, TypeError):
+            pass
+        if not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        self.merged_log.append(lines + ["\n"])
+
+    def run_test(self, test):
+        """Compiles (or waits for a shared compile) and simulates one test; returns its result."""
+        started = time.perf_counter()
+        result = {"name": test["name"], "status": "STOPPED", "message": "", "compile": None, "simulate": None,
+                  "wall": 0.0, "log": None, "metrics": {}}
+        if self._stopped:
+            return result
+        job_dir = self.job_directory(test["name"])
+        try:
+            self.reset_job_directory(job_dir)
+        except OSError as e:
+            result["status"], result["message"] = "ERROR", str(e)
+            return result
+        result["log"] = os.path.join(job_dir, "run.log")
+        with open(result["log"], "w", encoding="utf-8") as log:
+            build = self._compile(self.flags + self.compile_flags(test), test["name"])
+            if build["owner"] != test["name"]:
+                log.write(f"(与 {build['owner']} 共用编译结果)\n")
+            log.write(build["output"])
+            if not self._step_passed(build["step"], result, "compile"):
+                result["wall"] = time.perf_counter() - started
+                return result
+            if build["owner"] != test["name"]:
+                result["compile"] = 0.0
+            step = self._step([self.tool_paths["vvp"], "-n", build["vvp"]] + list(test.get("plusargs", [])), job_dir, log, check=True)
+            if self._step_passed(step, result, "simulate"):
+                result["status"] = "FAIL" if step["failures"] else "PASS"
+                result["metrics"] = step["metrics"]
+                if step["failures"]:
+                    result["message"] = step["failures"][0].strip()
+        result["wall"] = time.perf_counter() - started
+        return result
+
+    def _compile(self, flags, name):
+        """Compiles for ``flags`` once per run; later callers wait for the first one's result."""
+        key = tuple(flags)
+        with self._lock:
+            build = self._compiles.get(key)
+            owner = build is None
+            if owner:
+                build = self._compiles[key] = {"done": threading.Event(), "vvp": None, "step": None, "output": "", "owner": name}
+        if not owner:
+            build["done"].wait()
+            return build
+        try:
+            build_dir = os.path.abspath(os.path.join(self.output_dir, ".daedalus-build", hashlib.sha1("\0".join(key).encode()).hexdigest()[:16]))
+            os.makedirs(build_dir, exist_ok=True)
+            build["vvp"] = os.path.join(build_dir, "sim.vvp")
+            build_key = self.build_cache.key(self.tool_paths["iverilog"], self.sources, flags, build["vvp"], self.cwd) if self.build_cache else None
+            if build_key and self.build_cache.restore(build_key, build["vvp"]):
+                build["output"] = f"{build['vvp']} is up to date (编译缓存)\n"
+                build["step"] = {"returncode": 0, "wall": 0.0, "stopped": None}
+            else:
+                output = io.StringIO()
+                build["step"] = self._step([self.tool_paths["iverilog"], "-o", build["vvp"]] + flags + self.sources, self.cwd, output)
+                build["output"] = output.getvalue()
+                if build_key and build["step"] and build["step"].get("returncode") == 0 and not build["step"]["stopped"]:
+                    self.build_cache.store(build_key, build["vvp"])
+        finally:
+            build["done"].set()
+        return build
+
+    @staticmethod
+    def _step_passed(step, result, stage):
+        """Records a step in ``result``; returns whether the test may go on."""
+        if step is None:
+            return False # Stopped before it started
+        if step.get("error"):
+            result["status"], result["message"] = "ERROR", step["error"].strip()
+            return False
+        result[stage] = step["wall"]
+        if step["stopped"]:
+            result["status"] = "TIMEOUT" if step["stopped"] == "timeout" else "STOPPED"
+            return False
+        if step["returncode"] != 0:
+            result["status"] = "ERROR" if stage == "compile" else "FAIL"
+            result["message"] = f"{'编译' if stage == 'compile' else '仿真'}返回代码 {step['returncode']}"
+            return False
+        return True
+
+    def _step(self, command_list, cwd, log, check=False):
+        """Runs one step, writing its output to ``log``. Returns the CommandRunner stats plus
+        ``failures`` and ``metrics`` (failure lines and lines matching METRIC_RE, when ``check``),
+        ``{"error": message}`` if it could not be started, or None if the regression was stopped first."""
+        runner = CommandRunner()
+        with self._lock:
+            if self._stopped:
+                return None
+            self._active.add(runner)
+        log.write(f"$ {' '.join(command_list)}\n")
+        failures, metrics = [], {}
+        try:
+            runner.start(command_list, cwd=cwd, timeout=self.timeout)
+            while True:
+                kind, _, payload = runner.results.get()
+                if kind == "output":
+                    log.writelines(line for line, _ in payload)
+                    if check:
+                        for line, _ in payload:
+                            if self.FAIL_RE.search(line):
+                                failures.append(line)
+                            metric = self.METRIC_RE.match(line)
+                            if metric:
+                                metrics[metric.group(1)] = metric.group(2)
+                elif kind == "exit":
+                    payload["failures"] = failures
+                    payload["metrics"] = metrics
+                    return payload
+                else:
+                    log.write(payload)
+                    return {"error": payload}
+        finally:
+            log.flush()
+            with self._lock:
+                self._active.discard(runner)
+
+
+_SWEEP_AXIS_RE = re.compile(r"^(?:-D[A-Za-z_]\w*|-P[A-Za-z_][\w.$]*|\+[^\s=]+)$")
+
+
+def _expand_sweep(spec, mode):
+    """Expands a sweep spec into points, each ``{axis: value}`` in axis order.
+
+    An axis is ``-DNAME`` (a define), ``-Ptop.NAME`` (a parameter) or ``+name``
+    (a plusarg). In "grid" mode each line is ``axis = value value ...`` and
+    every combination is a point; in "list" mode each line is one point,
+    ``axis=value axis=value ...``. Blank lines and ``#`` comments are skipped.
+    Raises ValueError naming the line that cannot be read.
+    """
+    points, axes = [], []
+    for number, line in enumerate(spec.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        try:
+            if mode == "grid":
+                axis, equals, values = line.partition("=")
+                axis, values = axis.strip(), shlex.split(values)
+                if not equals or not values or not _SWEEP_AXIS_RE.match(axis) or axis in dict(axes):
+                    raise ValueError("应为 '轴 = 值 值 ...'，轴为 -DNAME、-Ptop.NAME 或 +name，且不能重复")
+                axes.append((axis, values))
+            else:
+                point = {}
+                for token in shlex.split(line):
+                    axis, _, value = token.partition("=")
+                    if not _SWEEP_AXIS_RE.match(axis):
+                        raise ValueError(f"无法识别 '{token}'")
+                    point[axis] = value
+                points.append(point)
+        except ValueError as e:
+            raise ValueError(f"第 {number} 行: {e}") from None
+    if mode == "grid":
+        names = [axis for axis, _ in axes]
+        points = [dict(zip(names, combination)) for combination in itertools.product(*(values for _, values in axes))]
+    return points
+
+
+def _sweep_test(name, top, point):
+    """The RegressionRunner test of one sweep point."""
+    test = {"name": name, "top": top, "defines": [], "parameters": [], "plusargs": []}
+    for axis, value in point.items():
+        if axis.startswith("-D"):
+            test["defines"].append(f"{axis[2:]}={value}" if value else axis[2:])
+        elif axis.startswith("-P"):
+            test["parameters"].append(f"{axis[2:]}={value}")
+        else:
+            test["plusargs"].append(f"{axis}={value}" if value else axis)
+    return test
+
+
+def _write_sweep_results(directory, top, points, results):
+    """Writes ``results.csv`` and ``results.json`` (one row per point) into ``directory``; returns their paths."""
+    axes = list(dict.fromkeys(axis for point in points for axis in point))
+    metrics = sorted({name for result in results for name in result.get("metrics", {})})
+    rows = []
+    for point, result in zip(points, results):
+        row = {"point": result["name"], **{axis: point.get(axis, "") for axis in axes}, "status": result["status"],
+               **{f"{stage}_s": None if result[stage] is None else round(result[stage], 3) for stage in ("compile", "simulate", "wall")},
+               **{name: result.get("metrics", {}).get(name, "") for name in metrics}, "message": result["message"]}
+        rows.append(row)
+    os.makedirs(directory, exist_ok=True)
+    csv_path, json_path = os.path.join(directory, "results.csv"), os.path.join(directory, "results.json")
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["point"] + axes + ["status", "compile_s", "simulate_s", "wall_s"] + metrics + ["message"])
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"top": top, "axes": axes, "metrics": metrics, "points": rows}, f, indent=2, ensure_ascii=False)
+    return csv_path, json_path
+
+
+def _map_search_dirs(flags, function):
+    """Returns ``flags`` with the directory of every -I and -y flag passed through ``function``."""
+    mapped, pending = [], False
+    for flag in flags:
+        if pending:
+            mapped.append(function(flag))
+            pending = False
+        elif flag in ("-I", "-y"):
+            mapped.append(flag)
+            pending = True
+        elif flag[:2] in ("-I", "-y"):
+            mapped.append(flag[:2] + function(flag[2:]))
+        else:
+            mapped.append(flag)
+    return mapped
+
+
+def _source_bundle(sources, flags):
+    """Describes everything a compile reads, so it can be rebuilt on another host.
+
+    Returns ``(files, rel_sources, rel_flags, rel_cwd)``: ``files`` maps the
+    path of every source, `include file and -y library file, relative to the
+    common root of all of them and of the current directory, to ``(abs_path,
+    sha1 hex)``; the sources, the -I and -y directories of the flags and the
+    current directory (where iverilog looks for includes first) are given
+    relative to that root. OSError propagates; ValueError if the flags read
+    a command file.
+    """
+    if _uses_command_file(flags):
+        raise ValueError("命令文件 (-c/-f) 中的源文件和选项无法发送到仿真农场")
+    cwd = os.getcwd()
+    include_dirs, library_dirs, suffixes = _iverilog_search_dirs(flags)
+    include_dirs = [os.path.abspath(directory) for directory in include_dirs]
+    library_dirs = [os.path.abspath(directory) for directory in library_dirs]
+    relative_include = _relative_include(flags)
+    library_files = [entry.path for library in library_dirs for entry in os.scandir(library)
+                     if entry.is_file() and os.path.splitext(entry.name)[1] in suffixes]
+    found = {}
+    stack = [os.path.abspath(path) for path in list(sources) + library_files]
+    while stack:
+        path = stack.pop()
+        if path in found:
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        found[path] = hashlib.sha1(data).hexdigest()
+        for name in _INCLUDE_RE.findall(data):
+            candidate = _find_include(name.decode("utf-8", "replace"), path, include_dirs, relative_include, cwd)
+            if candidate:
+                stack.append(candidate)
+    root = os.path.commonpath([os.path.dirname(path) for path in found] + include_dirs + library_dirs + [cwd])
+
+    def relative(path):
+        return os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/")
+    files = {relative(path): (path, digest) for path, digest in found.items()}
+    return files, [relative(path) for path in sources], _map_search_dirs(flags, relative), relative(cwd)
+
+
+def _farm_socket(address, listen=False):
+    """A socket connected to, or listening on, ``host:port`` or ``unix:/path``."""
+    if address.startswith("unix:"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        target = address[5:]
+        if listen:
+            try:
+                mode = os.lstat(target).st_mode
+            except FileNotFoundError:
+                mode = None
+            if mode is not None:
+                if not stat.S_ISSOCK(mode):
+                    sock.close()
+                    raise FileExistsError(f"{target} 已存在且不是套接字，不会删除它")
+                os.remove(target) # Left behind by a server that did not shut down cleanly
+    else:
+        host, _, port = address.rpartition(":")
+        target = (host or "127.0.0.1", int(port))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if listen:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if listen:
+        sock.bind(target)
+        sock.listen()
+    else:
+        sock.connect(target)
+    return sock
+
+
+class _FarmConnection:
+    """One end of a farm connection: newline-delimited JSON messages.
+
+    ``send`` only queues a message; a writer thread per connection does the
+    blocking socket writes. So any thread may send, even with a lock held or
+    from the thread that reads the connection, and two ends busy sending large
+    payloads to each other keep reading and cannot deadlock. A message may
+    be a callable that builds it on the writer thread (returning None to send
+    nothing), so a large file is only read when it is its turn to be sent.
+    A write error closes the connection, which the reader then sees as the end.
+    """
+
+    _CLOSE = object() # Queued by close(after_sending=True)
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._reader = sock.makefile("rb")
+        self._outgoing = queue.Queue()
+        self._closed = False
+        threading.Thread(target=self._write, name="farm-writer", daemon=True).start()
+
+    def send(self, message):
+        """Queues ``message`` (a dict, or a callable returning one); OSError once the connection is closed."""
+        if self._closed:
+            raise OSError("连接已关闭")
+        self._outgoing.put(message)
+
+    def _write(self):
+        while True:
+            message = self._outgoing.get()
+            if message is self._CLOSE or self._closed:
+                break
+            try:
+                if callable(message):
+                    message = message()
+                if message is not None:
+                    self.sock.sendall(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+            except OSError:
+                break
+        self.close()
+
+    def receive(self):
+        """The next message, or None once the other end has gone or sent something that is not a message."""
+        try:
+            line = self._reader.readline()
+            message = json.loads(line) if line else None
+        except (OSError, ValueError):
+            return None
+        return message if isinstance(message, dict) else None
+
+    def close(self, after_sending=False):
+        """Closes the connection, at once or (``after_sending``) once the queued messages are sent."""
+        if after_sending and not self._closed:
+            self._outgoing.put(self._CLOSE)
+            return
+        self._closed = True
+        self._outgoing.put(self._CLOSE) # Wakes the writer if it is idle
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def _safe_relative_path(path):
+    """``path`` if it is relative and stays inside the directory it is joined to, else ValueError."""
+    normalized = os.path.normpath(path)
+    if os.path.isabs(normalized) or normalized == ".." or normalized.startswith(".." + os.sep):
+        raise ValueError(f"不安全的路径: {path}")
+    return normalized
+
+
+class FarmServer:
+    """Hands regression and sweep jobs to worker processes on this or other hosts.
+
+    Workers (``python verilog_gui.py --worker ADDRESS``) connect over TCP
+    (``host:port``) or a Unix socket (``unix:/path``) and exchange
+    newline-delimited JSON messages. A job names its source bundle by a hash
+    of the bundle's file hashes; a worker asks for the files it does not
+    have yet, rebuilds the tree, runs the test through its own
+    RegressionRunner with its own tools, streams its run.log back while it
+    runs and sends the files of its test directory back at the end, into the
+    same per-test directories a local run would use.
+
+    Each worker is given up to PREFETCH jobs per slot, so its next job is
+    ready the moment one ends. Once the queue is empty, a worker with a free
+    slot steals a job that another worker was given but has not started.
+    Jobs of a worker that disconnects, or that fail on the worker's side
+    rather than in the test, are retried on other workers up to
+    MAX_ATTEMPTS times. There is no encryption; the optional token only
+    keeps strangers from joining, so bind to a trusted network.
+    """
+
+    PREFETCH = 2
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, address, token=""):
+        self.address = address
+        self.token = token
+        self._lock = threading.RLock()
+        self._queue = deque() # Job ids waiting for a worker, next first
+        self._jobs = {} # {job_id: job}
+        self._workers = {} # {name: worker}
+        self._blobs = {} # {sha1 hex: abs path} of every file of every submitted bundle
+        self._bundles = {} # {digest: bundle message}
+        self._listener = None
+        self._run_ids = itertools.count(1)
+
+    def start(self):
+        """Starts listening; OSError propagates (address in use, ...)."""
+        self._listener = _farm_socket(self.address, listen=True)
+        threading.Thread(target=self._accept, name="farm-accept", daemon=True).start()
+
+    def stop(self):
+        listener, self._listener = self._listener, None
+        if listener:
+            listener.close()
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker["conn"].close()
+
+    def slot_count(self):
+        with self._lock:
+            return sum(worker["slots"] for worker in self._workers.values())
+
+    def workers(self):
+        """Snapshot of the connected workers, for display."""
+        with self._lock:
+            return [{"name": worker["name"], "host": worker["host"], "slots": worker["slots"],
+                     "assigned": len(worker["assigned"]), "running": sum(1 for job_id in worker["assigned"] if self._jobs[job_id]["started"]),
+                     "done": worker["done"], "failed": worker["failed"]} for worker in self._workers.values()]
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def _accept(self):
+        listener = self._listener
+        while self._listener is listener:
+            try:
+                sock, peer = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(_FarmConnection(sock), peer), name="farm-connection", daemon=True).start()
+
+    def _serve(self, conn, peer):
+        hello = conn.receive()
+        if not hello or hello.get("type") != "hello":
+            conn.close()
+            return
+        # Compared as bytes: compare_digest refuses str with non-ASCII characters
+        if self.token and not hmac.compare_digest(str(hello.get("token", "")).encode("utf-8"), self.token.encode("utf-8")):
+            self._reject(conn, "token 不正确")
+            return
+        try:
+            slots = max(1, int(hello.get("slots") or 1))
+        except (TypeError, ValueError, OverflowError):
+            self._reject(conn, f"无效的槽位数: {hello.get('slots')!r}")
+            return
+        with self._lock:
+            name = base = str(hello.get("worker") or "worker")
+            suffix = 1
+            while name in self._workers:
+                suffix += 1
+                name = f"{base}#{suffix}"
+            worker = {"name": name, "conn": conn, "host": peer[0] if isinstance(peer, tuple) else "unix",
+                      "slots": slots, "assigned": [], "bundles": set(), "done": 0, "failed": 0}
+            self._workers[name] = worker
+            self._dispatch()
+        try:
+            while True:
+                message = conn.receive()
+                if message is None:
+                    break
+                self._handle(worker, message)
+        finally:
+            conn.close()
+            self._drop_worker(worker)
+
+    @staticmethod
+    def _reject(conn, reason):
+        try:
+            conn.send({"type": "reject", "reason": reason})
+        except OSError:
+            pass
+        conn.close(after_sending=True)
+
+    def _send(self, worker, message):
+        try:
+            worker["conn"].send(message)
+        except OSError:
+            pass # Closed; its reader sees the end and drops the worker
+
+    def _handle(self, worker, message):
+        kind = message.get("type")
+        job = self._jobs.get(message.get("job"))
+        if kind == "need":
+            for digest in message.get("hashes", []):
+                self._send_blob(worker, digest)
+        elif job is None or job["worker"] is not worker:
+            return # A job that was already given up on, or that was stolen from this worker
+        elif kind == "started":
+            job["started"] = True
+            try:
+                RegressionRunner.reset_job_directory(job["dir"])
+            except OSError as e: # submit() checked it; only a directory created since then gets here
+                print(f"无法准备 {job['dir']}: {e}")
+        elif kind == "log":
+            try:
+                with open(os.path.join(job["dir"], "run.log"), "a", encoding="utf-8") as f:
+                    f.write(message["data"])
+            except OSError:
+                pass # The directory could not be prepared; the result says so
+        elif kind == "artifact":
+            try:
+                path = os.path.join(job["dir"], _safe_relative_path(message["path"]))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(base64.b64decode(message["data"]))
+            except (OSError, ValueError) as e:
+                print(f"无法保存 {worker['name']} 发回的文件 {message.get('path')}: {e}")
+        elif kind == "released":
+            with self._lock:
+                self._unassign(job)
+                self._queue.appendleft(job["id"])
+                self._dispatch()
+        elif kind == "steal_failed":
+            job["stealing"] = None
+        elif kind == "result":
+            result = message["result"]
+            with self._lock:
+                self._unassign(job)
+                if message.get("retry"):
+                    worker["failed"] += 1
+                    self._retry(job, worker, result.get("message", ""))
+                else:
+                    worker["done"] += 1
+                    result["log"] = os.path.join(job["dir"], "run.log")
+                    self._finish(job, result)
+                self._dispatch()
+
+    def _send_blob(self, worker, digest):
+        self._send(worker, lambda: self._blob_message(digest)) # Read on the writer thread, when its turn comes
+
+    def _blob_message(self, digest):
+        with self._lock:
+            path = self._blobs.get(digest)
+        message = {"type": "blob", "hash": digest}
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if hashlib.sha1(data).hexdigest() != digest:
+                message["error"] = f"{path} 在提交后被修改"
+            else:
+                message["data"] = base64.b64encode(data).decode("ascii")
+        except (OSError, TypeError) as e:
+            message["error"] = f"无法读取 {path}: {e}"
+        return message
+
+    def _unassign(self, job):
+        worker = job["worker"]
+        if worker and job["id"] in worker["assigned"]:
+            worker["assigned"].remove(job["id"])
+        job["worker"], job["started"], job["stealing"] = None, False, None
+
+    def _drop_worker(self, worker):
+        with self._lock:
+            if self._workers.get(worker["name"]) is not worker:
+                return
+            del self._workers[worker["name"]]
+            for job_id in reversed(worker["assigned"]):
+                job = self._jobs[job_id]
+                started = job["started"]
+                self._unassign(job)
+                if started:
+                    self._retry(job, worker, f"worker {worker['name']} 断开连接")
+                else:
+                    self._queue.appendleft(job_id)
+            self._dispatch()
+
+    def _retry(self, job, worker, message):
+        job["attempts"] += 1
+        job["excluded"].add(worker["name"])
+        if job["run"].cancelled:
+            self._finish(job, self._stopped_result(job))
+        elif job["attempts"] >= self.MAX_ATTEMPTS:
+            self._finish(job, {**self._stopped_result(job), "status": "ERROR",
+                               "message": f"尝试 {job['attempts']} 次后仍失败: {message}"})
+        else:
+            self._queue.appendleft(job["id"])
+
+    @staticmethod
+    def _stopped_result(job):
+        return {"name": job["test"]["name"], "status": "STOPPED", "message": "", "compile": None, "simulate": None,
+                "wall": 0.0, "log": None, "metrics": {}}
+
+    def _dispatch(self):
+        """Gives queued jobs to the workers with the fewest, then lets idle workers steal. Called with the lock held."""
+        workers = sorted(self._workers.values(), key=lambda worker: len(worker["assigned"]) / worker["slots"])
+        for worker in workers:
+            capacity = worker["slots"] * self.PREFETCH
+            skipped = []
+            while self._queue and len(worker["assigned"]) < capacity:
+                job = self._jobs[self._queue.popleft()]
+                # A job that failed on this worker goes elsewhere, unless there is nowhere else
+                if worker["name"] in job["excluded"] and len(job["excluded"]) < len(self._workers):
+                    skipped.append(job["id"])
+                    continue
+                self._assign(job, worker)
+            self._queue.extendleft(reversed(skipped))
+        if self._queue:
+            return
+        for thief in workers:
+            stealing = sum(1 for job in self._jobs.values() if job["stealing"] == thief["name"])
+            idle = thief["slots"] - len(thief["assigned"]) - stealing
+            while idle > 0:
+                waiting = [(victim, [job_id for job_id in victim["assigned"]
+                                     if not self._jobs[job_id]["started"] and not self._jobs[job_id]["stealing"]])
+                           for victim in self._workers.values() if victim is not thief]
+                victim, unstarted = max(waiting, key=lambda item: len(item[1]), default=(None, []))
+                if not unstarted:
+                    return
+                job = self._jobs[unstarted[-1]]
+                job["stealing"] = thief["name"]
+                self._send(victim, {"type": "steal", "job": job["id"]})
+                idle -= 1
+
+    def _assign(self, job, worker):
+        job["worker"] = worker
+        worker["assigned"].append(job["id"])
+        bundle = job["bundle"]
+        if bundle not in worker["bundles"]:
+            worker["bundles"].add(bundle)
+            self._send(worker, self._bundles[bundle])
+        self._send(worker, {"type": "job", "job": job["id"], "run": job["run"].id, "bundle": bundle,
+                            "test": job["test"], "timeout": job["run"].timeout})
+
+    def submit(self, run, tests):
+        """Queues the tests of a FarmRun; OSError propagates if the sources cannot be read."""
+        for test in tests:
+            run.check_job_directory(run.job_directory(test["name"]))
+        files, sources, flags, cwd = _source_bundle(run.sources, run.flags)
+        manifest = {path: digest for path, (_, digest) in sorted(files.items())}
+        bundle = hashlib.sha1(json.dumps([manifest, sources, flags, cwd]).encode("utf-8")).hexdigest()
+        with self._lock:
+            run.id = next(self._run_ids)
+            for abs_path, digest in files.values():
+                self._blobs[digest] = abs_path
+            self._bundles[bundle] = {"type": "bundle", "bundle": bundle, "files": manifest, "sources": sources, "flags": flags, "cwd": cwd}
+            for index, test in enumerate(tests):
+                job_id = f"{run.id}.{index}"
+                self._jobs[job_id] = {"id": job_id, "run": run, "test": test, "bundle": bundle, "worker": None, "started": False,
+                                      "stealing": None, "attempts": 0, "excluded": set(),
+                                      "dir": run.job_directory(test["name"])}
+                self._queue.append(job_id)
+                run.pending.add(job_id)
+            self._dispatch()
+
+    def cancel(self, run):
+        with self._lock:
+            run.cancelled = True
+            for job_id in [job_id for job_id in self._queue if self._jobs[job_id]["run"] is run]:
+                self._queue.remove(job_id)
+                self._finish(self._jobs[job_id], self._stopped_result(self._jobs[job_id]))
+            for worker in self._workers.values():
+                if any(self._jobs[job_id]["run"] is run for job_id in worker["assigned"]):
+                    self._send(worker, {"type": "cancel", "run": run.id})
+
+    def _finish(self, job, result):
+        run = job["run"]
+        del self._jobs[job["id"]]
+        run.pending.discard(job["id"])
+        run.job_finished(result)
+        if not run.pending:
+            for worker in self._workers.values():
+                self._send(worker, {"type": "end_run", "run": run.id})
+
+
+class FarmRun(RegressionRunner):
+    """A regression or sweep run on a FarmServer instead of local processes.
+
+    Used like a RegressionRunner: same tests, same ``results`` messages, same
+    per-test directories under ``output_dir`` (filled with what the workers
+    send back) and the same merged log.
+    """
+
+    def __init__(self, server, sources, flags, output_dir, timeout=None, merged_log=None):
+        super().__init__({}, sources, flags, output_dir, workers=max(1, server.slot_count()), timeout=timeout, merged_log=merged_log)
+        self.server = server
+        self.id = None
+        self.pending = set()
+        self.cancelled = False
+        self._tests = []
+        self._finished = {}
+
+    def start(self, tests):
+        self._tests = list(tests)
+        threading.Thread(target=self._submit, name="farm-submit", daemon=True).start()
+
+    def _submit(self):
+        try:
+            self.server.submit(self, self._tests)
+        except (OSError, ValueError) as e:
+            message = str(e) if isinstance(e, FileExistsError) else f"无法打包源文件: {e}"
+            for test in self._tests:
+                self.job_finished({"name": test["name"], "status": "ERROR", "message": message, "compile": None,
+                                   "simulate": None, "wall": 0.0, "log": None, "metrics": {}})
+        if not self._tests:
+            self.results.put(("done", []))
+
+    def stop(self):
+        self.server.cancel(self)
+
+    def job_finished(self, result):
+        self._finished[result["name"]] = result
+        if self.merged_log:
+            self._merge_log(result)
+        self.results.put(("job", result))
+        if len(self._finished) == len(self._tests):
+            self.results.put(("done", [self._finished[test["name"]] for test in self._tests]))
+
+
+class FarmWorker:
+    """Runs farm jobs for a FarmServer: ``python verilog_gui.py --worker ADDRESS``.
+
+    Keeps files by content hash under ``workdir/blobs``, so a bundle only
+    transfers the files this worker has not seen, and rebuilds each bundle
+    once under ``workdir/bundles``; both may be shared by the workers of
+    one host, while tests run under ``workdir/runs/<name>``. Tests run in ``slots`` threads through
+    one RegressionRunner per farm run, which shares compiles between tests
+    with the same flags, with a local BuildCache behind it. Reconnects
+    whenever the server goes away.
+    """
+
+    RECONNECT_SECONDS = 2.0
+    LOG_STREAM_SECONDS = 0.5
+
+    def __init__(self, address, tool_paths, slots=None, name=None, workdir=None, token="", artifact_max_bytes=64 * 1024 * 1024):
+        self.address = address
+        self.tool_paths = tool_paths
+        self.slots = slots or os.cpu_count() or 1
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.workdir = os.path.abspath(workdir or os.path.join(_user_cache_dir(), "worker"))
+        self.token = token
+        self.artifact_max_bytes = artifact_max_bytes
+        self.build_cache = BuildCache(os.path.join(self.workdir, "builds"), 512 * 1024 * 1024)
+        self._bundles = {} # {digest: bundle message}
+        self._broken = {} # {blob hash: why the server could not send it}
+        self._materialize_lock = threading.Lock()
+        self._closed = False
+
+    def serve_forever(self):
+        os.makedirs(os.path.join(self.workdir, "blobs"), exist_ok=True)
+        while not self._closed:
+            try:
+                conn = _FarmConnection(_farm_socket(self.address))
+            except OSError:
+                time.sleep(self.RECONNECT_SECONDS)
+                continue
+            print(f"[{self.name}] 已连接到 {self.address} ({self.slots} 个槽位)")
+            self._session(conn)
+            if not self._closed:
+                print(f"[{self.name}] 与 {self.address} 的连接已断开，稍后重连")
+                time.sleep(self.RECONNECT_SECONDS)
+
+    def _session(self, conn):
+        # Run ids start again with every server, so the runs of earlier sessions are cleared first
+        shutil.rmtree(os.path.join(self.workdir, "runs", self.name), ignore_errors=True)
+        session = {"conn": conn, "pending": deque(), "cond": threading.Condition(), "runners": {}, "cancelled": set(),
+                   "ready": set(), "closed": False}
+        try:
+            conn.send({"type": "hello", "worker": self.name, "slots": self.slots, "token": self.token})
+        except OSError:
+            conn.close()
+            return
+        for index in range(self.slots):
+            threading.Thread(target=self._slot, args=(session,), name=f"farm-slot-{index}", daemon=True).start()
+        try:
+            while True:
+                message = conn.receive()
+                if message is None:
+                    break
+                if message.get("type") == "reject":
+                    print(f"[{self.name}] 服务器拒绝连接: {message.get('reason')}")
+                    self._closed = True
+                    break
+                try:
+                    self._handle(session, message)
+                except OSError:
+                    break # The connection closed under us
+        finally:
+            with session["cond"]:
+                session["closed"] = True
+                session["cond"].notify_all()
+            for runner in session["runners"].values():
+                runner.stop()
+            conn.close()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.workdir, "blobs", digest)
+
+    def _handle(self, session, message):
+        kind = message.get("type")
+        conn, cond = session["conn"], session["cond"]
+        if kind == "bundle":
+            self._bundles[message["bundle"]] = message
+            missing = sorted({digest for digest in message["files"].values() if not os.path.exists(self._blob_path(digest))})
+            for digest in missing:
+                self._broken.pop(digest, None) # Asked for again; the server may be able to read it now
+            if missing:
+                conn.send({"type": "need", "hashes": missing})
+        elif kind == "blob":
+            digest = message["hash"]
+            if message.get("error"):
+                self._broken[digest] = message["error"]
+            else:
+                data = base64.b64decode(message["data"])
+                if hashlib.sha1(data).hexdigest() == digest:
+                    tmp_path = self._blob_path(digest) + f".{threading.get_ident()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, self._blob_path(digest))
+                    self._broken.pop(digest, None)
+                else:
+                    self._broken[digest] = "传输的内容与哈希不符"
+            with cond:
+                cond.notify_all()
+        elif kind == "job":
+            with cond:
+                session["pending"].append(message)
+                cond.notify()
+        elif kind == "steal":
+            with cond:
+                job = next((job for job in session["pending"] if job["job"] == message["job"]), None)
+                if job:
+                    session["pending"].remove(job)
+            conn.send({"type": "released" if job else "steal_failed", "job": message["job"]})
+        elif kind == "cancel":
+            with cond:
+                dropped = [job for job in session["pending"] if job["run"] == message["run"]]
+                for job in dropped:
+                    session["pending"].remove(job)
+            for job in dropped:
+                conn.send({"type": "result", "job": job["job"], "result": FarmServer._stopped_result({"test": job["test"]})})
+            with cond:
+                session["cancelled"].add(message["run"])
+                runner = session["runners"].pop(message["run"], None)
+            if runner:
+                runner.stop()
+        elif kind == "end_run":
+            with cond:
+                session["runners"].pop(message["run"], None)
+            # Every job of the run has sent its results back, so its test directories are no longer needed
+            shutil.rmtree(os.path.join(self.workdir, "runs", self.name, str(message["run"])), ignore_errors=True)
+
+    def _ready(self, session, job):
+        """Whether every file of the job's bundle is here (or known to be unobtainable)."""
+        if job["bundle"] in session["ready"]:
+            return True
+        bundle = self._bundles.get(job["bundle"])
+        if bundle is None or not all(os.path.exists(self._blob_path(digest)) or digest in self._broken
+                                     for digest in bundle["files"].values()):
+            return False
+        session["ready"].add(job["bundle"])
+        return True
+
+    def _slot(self, session):
+        conn, cond = session["conn"], session["cond"]
+        while True:
+            with cond:
+                while True:
+                    if session["closed"]:
+                        return
+                    job = next((job for job in session["pending"] if self._ready(session, job)), None)
+                    if job:
+                        session["pending"].remove(job)
+                        break
+                    cond.wait()
+            try:
+                conn.send({"type": "started", "job": job["job"]})
+                retry = False
+                try:
+                    result, job_dir = self._run(session, job)
+                except Exception as e: # The worker's fault, not the test's: the server tries elsewhere
+                    result, job_dir, retry = {**FarmServer._stopped_result({"test": job["test"]}), "status": "ERROR",
+                                              "message": f"{self.name}: {type(e).__name__}: {e}"}, None, True
+                if job_dir:
+                    self._send_artifacts(conn, job["job"], job_dir, result)
+                conn.send({"type": "result", "job": job["job"], "result": result, "retry": retry})
+            except OSError:
+                return # Disconnected; the server gives the job to someone else
+
+    def _materialize(self, digest):
+        """The source tree of a bundle, hard-linked (or copied) from the blob store once."""
+        bundle = self._bundles[digest]
+        root = os.path.join(self.workdir, "bundles", digest)
+        with self._materialize_lock:
+            if not os.path.exists(root):
+                # Built aside and renamed into place, as other workers may share the directory
+                tmp_root = f"{root}.{os.getpid()}.tmp"
+                shutil.rmtree(tmp_root, ignore_errors=True)
+                for path, blob in bundle["files"].items():
+                    if blob in self._broken:
+                        raise ValueError(f"{path}: {self._broken[blob]}")
+                    target = os.path.join(tmp_root, _safe_relative_path(path))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    try:
+                        os.link(self._blob_path(blob), target)
+                    except OSError:
+                        shutil.copyfile(self._blob_path(blob), target)
+                include_dirs, library_dirs, _ = _iverilog_search_dirs(bundle["flags"])
+                for directory in include_dirs + library_dirs + [bundle["cwd"]]: # Search directories without files of their own still have to exist
+                    os.makedirs(os.path.join(tmp_root, _safe_relative_path(directory)), exist_ok=True)
+                try:
+                    os.rename(tmp_root, root)
+                except OSError: # Someone else was first
+                    shutil.rmtree(tmp_root, ignore_errors=True)
+        return root, bundle
+
+    def _run(self, session, job):
+        root, bundle = self._materialize(job["bundle"])
+        with session["cond"]:
+            runner = session["runners"].get(job["run"])
+            if runner is None:
+                runner = RegressionRunner(
+                    self.tool_paths, [os.path.join(root, _safe_relative_path(path)) for path in bundle["sources"]],
+                    _map_search_dirs(bundle["flags"], lambda path: os.path.join(root, _safe_relative_path(path))),
+                    os.path.join(self.workdir, "runs", self.name, str(job["run"])), workers=1, timeout=job["timeout"], build_cache=self.build_cache,
+                    cwd=os.path.join(root, _safe_relative_path(bundle["cwd"])))
+                if job["run"] in session["cancelled"]:
+                    runner.stop() # Cancelled while this job was being taken; it ends as stopped
+                else:
+                    session["runners"][job["run"]] = runner
+        job_dir = runner.job_directory(job["test"]["name"])
+        done = threading.Event()
+        streamer = threading.Thread(target=self._stream_log, args=(session["conn"], job["job"], os.path.join(job_dir, "run.log"), done),
+                                    name="farm-log", daemon=True)
+        streamer.start()
+        try:
+            result = runner.run_test(job["test"])
+        finally:
+            done.set()
+            streamer.join()
+        return result, job_dir
+
+    def _stream_log(self, conn, job_id, path, done):
+        """Sends what the test appends to its run.log every LOG_STREAM_SECONDS until ``done``."""
+        offset = 0
+        decoder = codecs.getincrementaldecoder("utf-8")("replace") # Splits a character across chunks correctly
+        while True:
+            finished = done.wait(self.LOG_STREAM_SECONDS)
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read()
+            except OSError:
+                data = b""
+            offset += len(data)
+            text = decoder.decode(data, final=finished)
+            if text:
+                try:
+                    conn.send({"type": "log", "job": job_id, "data": text})
+                except OSError:
+                    return
+            if finished:
+                return
+
+    def _send_artifacts(self, conn, job_id, job_dir, result):
+        """Sends every file the test left in its directory (the final run.log included).
+        Each file is read on the connection's writer thread, one at a time."""
+        def artifact(path, relative):
+            try:
+                with open(path, "rb") as f:
+                    return {"type": "artifact", "job": job_id, "path": relative, "data": base64.b64encode(f.read()).decode("ascii")}
+            except OSError:
+                return None
+
+        skipped = []
+        for directory, _, names in os.walk(job_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, job_dir).replace(os.sep, "/")
+                if os.path.getsize(path) > self.artifact_max_bytes:
+                    skipped.append(relative)
+                    continue
+                conn.send(lambda path=path, relative=relative: artifact(path, relative))
+        if skipped:
+            result["message"] = (result["message"] + " " if result["message"] else "") + f"(未传回过大的文件: {', '.join(skipped)})"
+
+
+def _worker_main(argv):
+    """Entry point of ``python verilog_gui.py --worker ADDRESS``."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="verilog_gui.py --worker", description="Daedalus 模拟农场 worker")
+    parser.add_argument("--worker", required=True, metavar="ADDRESS", help="服务器地址: host:port 或 unix:/path")
+    parser.add_argument("--slots", type=int, default=None, help="同时运行的测试数 (默认: CPU 数)")
+    parser.add_argument("--name", default=None, help="worker 名称 (默认: 主机名-进程号)")
+    parser.add_argument("--workdir", default=None, help="缓存和运行目录")
+    parser.add_argument("--token", default=os.environ.get("DAEDALUS_FARM_TOKEN", ""), help="与服务器约定的 token")
+    parser.add_argument("--artifact-max-mb", type=int, default=64, help="传回的单个文件的大小上限")
+    args = parser.parse_args(argv)
+    tool_paths, missing = find_tools(("iverilog", "vvp"))
+    if missing:
+        print("以下必要的工具未找到或未添加到系统环境变量中: " + ", ".join(missing))
+        return 1
+    worker = FarmWorker(args.worker, tool_paths, args.slots, args.name, args.workdir, args.token, args.artifact_max_mb * 1024 * 1024)
+    try:
+        worker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+TOOL_NAMES = {"iverilog": "Icarus Verilog (iverilog)", "vvp": "Icarus Verilog VVP", "gtkwave": "GTKWave"}
+
+
+def find_tools(commands=("iverilog", "vvp", "gtkwave")):
+    """Looks the tools up in PATH; returns ``({command: path}, [names of the missing ones])``."""
+    found, missing = {}, []
+    for command in commands:
+        path = shutil.which(command) # 在系统PATH中查找命令
+        if path:
+            found[command] = path
+        else:
+            missing.append(TOOL_NAMES[command])
+    return found, missing
+
+
+def _user_cache_dir():
+    """Per-user cache directory for Daedalus (LOCALAPPDATA on Windows, XDG elsewhere)."""
+    base = os.environ.get("LOCALAPPDATA") if os.name == "nt" else os.environ.get("XDG_CACHE_HOME")
+    return os.path.join(base or os.path.join(os.path.expanduser("~"), ".cache"), "daedalus")
+
+
+class TokenCache:
+    """On-disk cache of highlight spans and line states, keyed by buffer content.
+
+    Entries are gzipped JSON files named after a hash of the content, the
+    Pygments version, the cache format and the token type to tag mapping
+    (``tag_map``), so neither a lexer upgrade nor a changed tag table serves
+    stale tags. The directory is bounded to ``max_bytes``; hits refresh a
+    file's mtime and the least recently used files are evicted first.
+    """
+
+    FORMAT = 1
+
+    def __init__(self, directory, max_bytes, tag_map=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        mapping = sorted((str(token_type), tag) for token_type, tag in (tag_map or {}).items())
+        self._tag_digest = hashlib.sha256(json.dumps(mapping).encode()).hexdigest()
+
+    def key(self, text):
+        digest = hashlib.sha256(f"{pygments.__version__}\0{self.FORMAT}\0{self._tag_digest}\0".encode())
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json.gz")
+
+    def load(self, key):
+        """Returns ``(spans, states)`` for a cached buffer, or None on a miss.
+
+        A damaged entry (truncated, corrupt or of the wrong shape) counts as a
+        miss and is deleted, so the buffer is lexed and stored afresh.
+        """
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            tags = data["tags"]
+            flat = data["spans"]
+            spans = [(flat[i], flat[i + 1], tags[flat[i + 2]]) for i in range(0, len(flat), 3)]
+            stacks = [tuple(stack) for stack in data["stacks"]]
+            states = [(carry, stacks[stack_id]) for carry, stack_id in zip(data["carries"], data["stack_ids"])]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, zlib.error, KeyError, IndexError, TypeError):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path) # Mark as recently used
+        except OSError:
+            pass
+        return spans, states
+
+    def store(self, key, spans, states):
+        tag_ids, stack_ids = {}, {}
+        flat = []
+        for start, end, tag in spans:
+            flat.extend((start, end, tag_ids.setdefault(tag, len(tag_ids))))
+        data = {
+            "tags": list(tag_ids),
+            "spans": flat,
+            "carries": [carry for carry, _ in states],
+            "stack_ids": [stack_ids.setdefault(stack, len(stack_ids)) for _, stack in states],
+            "stacks": [list(stack) for stack in stack_ids],
+        }
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+        except OSError as e:
+            print(f"写入高亮缓存失败: {e}")
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json.gz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+_INCLUDE_RE = re.compile(rb'^[ \t]*`include[ \t]+"([^"\n]+)"', re.MULTILINE)
+
+
+def _iverilog_search_dirs(flags):
+    """The `include search path (-I) and library directories/suffixes (-y/-Y) named in iverilog flags."""
+    include_dirs, library_dirs, suffixes = [], [], []
+    targets = {"-I": include_dirs, "-y": library_dirs, "-Y": suffixes}
+    pending = None
+    for flag in flags:
+        if pending is not None:
+            pending.append(flag)
+            pending = None
+        elif flag in targets:
+            pending = targets[flag]
+        elif flag[:2] in targets:
+            targets[flag[:2]].append(flag[2:])
+    return include_dirs, library_dirs, suffixes or [".v"]
+
+
+def _uses_command_file(flags):
+    """Whether iverilog flags read a command file (-c/-f), whose sources and options are not followed."""
+    return any(flag[:2] in ("-c", "-f") for flag in flags)
+
+
+def _relative_include(flags):
+    """Whether -grelative-include is in effect (the last -g[no-]relative-include wins)."""
+    relative = False
+    for flag in flags:
+        if flag in ("-grelative-include", "-gno-relative-include"):
+            relative = flag == "-grelative-include"
+    return relative
+
+
+def _find_include(name, including_file, include_dirs, relative, cwd):
+    """Resolves `include "name" like iverilog: the working directory, then the including
+    file's directory with -grelative-include, then the -I directories. None if not found."""
+    directories = [cwd] + ([os.path.dirname(including_file)] if relative else []) + include_dirs
+    for directory in directories:
+        candidate = os.path.abspath(os.path.join(cwd, directory, name))
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+class BuildCache:
+    """Content-addressed cache of compiled ``.vvp`` files.
+
+    The key hashes the content of every source, of every file they
+    `include (recursively, resolved like iverilog does, see _find_include)
+    and of the -y library files, together with the flags, the working
+    directory, the output name and the iverilog version. Compiles reading a
+    command file (-c/-f) are not cached. File digests
+    are memoised by mtime and size, so checking an unchanged project only
+    costs a stat per file. Entries are ``<key>.vvp`` files bounded to
+    ``max_bytes``, least recently used first out.
+    """
+
+    FORMAT = 1
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files = {} # {abs_path: (mtime_ns, size, digest, includes)}
+        self._versions = {} # {tool_path: ((mtime_ns, size), version)}
+        self._outputs = {} # {abs_output: (mtime_ns, size, key)} of outputs this cache wrote or checked
+        self._lock = threading.Lock() # The build pipeline checks inputs on a worker thread
+
+    def _file(self, path):
+        """Returns ``(digest, includes)`` of a file, reading it only when its stat changed; OSError propagates."""
+        st = os.stat(path)
+        entry = self._files.get(path)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2], entry[3]
+        with open(path, "rb") as f:
+            data = f.read()
+        includes = tuple(name.decode("utf-8", "replace") for name in _INCLUDE_RE.findall(data))
+        self._files[path] = (st.st_mtime_ns, st.st_size, hashlib.sha1(data).digest(), includes)
+        return self._files[path][2], includes
+
+    def tool_version(self, tool_path):
+        """``iverilog -V`` first line, re-queried only when the executable changes."""
+        try:
+            st = os.stat(tool_path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        cached = self._versions.get(tool_path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        try:
+            result = subprocess.run([tool_path, "-V"], capture_output=True, text=True, errors="replace", timeout=10)
+            version = (result.stdout or result.stderr).splitlines()[0] if (result.stdout or result.stderr) else ""
+        except (OSError, subprocess.SubprocessError):
+            version = ""
+        self._versions[tool_path] = (stamp, version)
+        return version
+
+    def key(self, tool_path, sources, flags, output, cwd=None):
+        """Hex key of a compile run in ``cwd`` (default: the current directory), or None if an
+        input cannot be read or the compile reads a command file (then the compile just runs)."""
+        if _uses_command_file(flags):
+            return None
+        cwd = os.path.abspath(cwd or os.getcwd())
+        with self._lock:
+            return self._key(tool_path, sources, flags, output, cwd)
+
+    def _key(self, tool_path, sources, flags, output, cwd):
+        include_dirs, library_dirs, suffixes = _iverilog_search_dirs(flags)
+        relative = _relative_include(flags)
+        digest = hashlib.sha256(f"{self.FORMAT}\0{self.tool_version(tool_path)}\0{output}\0{cwd}\0".encode())
+        digest.update("\0".join(flags).encode() + b"\1")
+        try:
+            library_files = sorted(entry.path for library in library_dirs for entry in os.scandir(os.path.join(cwd, library))
+                                   if entry.is_file() and os.path.splitext(entry.name)[1] in suffixes)
+        except OSError:
+            return None
+        seen = set()
+        stack = [os.path.abspath(os.path.join(cwd, path)) for path in reversed(list(sources) + library_files)]
+        while stack:
+            path = stack.pop()
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                file_digest, includes = self._file(path)
+            except OSError:
+                return None
+            digest.update(path.encode("utf-8", "surrogatepass") + b"\0" + file_digest)
+            for name in reversed(includes):
+                candidate = _find_include(name, path, include_dirs, relative, cwd)
+                if candidate:
+                    stack.append(candidate)
+                else:
+                    # A missing include is part of the key too, so creating it later is a change
+                    digest.update(b"missing\0" + name.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".vvp")
+
+    def restore(self, key, output):
+        """Puts the cached result of ``key`` at ``output``; returns False on a miss.
+        An output this cache already wrote for the same key is left alone."""
+        with self._lock:
+            return self._restore(key, os.path.abspath(output))
+
+    def _restore(self, key, output):
+        try:
+            st = os.stat(output)
+            if self._outputs.get(output) == (st.st_mtime_ns, st.st_size, key):
+                return True
+        except OSError:
+            pass
+        path = self._path(key)
+        try:
+            tmp_path = f"{output}.{os.getpid()}.tmp"
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, output)
+            os.utime(path) # Mark as recently used
+            st = os.stat(output)
+        except OSError:
+            return False
+        self._outputs[output] = (st.st_mtime_ns, st.st_size, key)
+        return True
+
+    def store(self, key, output):
+        """Keeps a freshly compiled ``output`` under ``key``."""
+        output = os.path.abspath(output)
+        with self._lock:
+            self._store(key, output)
+
+    def _store(self, key, output):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+            shutil.copyfile(output, tmp_path)
+            os.replace(tmp_path, self._path(key))
+            st = os.stat(output)
+            self._outputs[output] = (st.st_mtime_ns, st.st_size, key)
+            self._evict()
+        except OSError as e:
+            print(f"写入编译缓存失败: {e}")
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".vvp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class EditorHighlightState:
+    """Highlighting bookkeeping for one editor, shared by the Tk thread and the worker.
+
+    The Tk thread owns ``generation`` and ``debounce_job`` and adds to
+    ``acked``; the worker owns the highlighter, ``text_generation`` and
+    ``pending``. Single attribute and set operations are atomic under the GIL.
+    """
+
+    def __init__(self, highlighter, text_widget, viewport_only=False):
+        self.highlighter = highlighter
+        self.text_widget = text_widget
+        self.viewport_only = viewport_only # Large-file mode: only visible lines are ever lexed
+        self.viewport_lines = None # (first, last) Tk lines last requested in viewport-only mode
+        self.generation = 0 # Bumped by the Tk thread on every possible buffer change
+        self.text_generation = 0 # Generation of the snapshot the highlighter currently holds
+        self.pending = [] # (seq, start, end) ranges sent to Tk but not acknowledged yet
+        self.acked = set() # Seqs of payloads the Tk thread applied
+        self.cache_fill = None # (cache key, spans) collected by an unedited lazy first pass
+        self.started = False
+        self.closed = False
+        self.debounce_job = None
+
+    @property
+    def done(self):
+        return self.started and self.highlighter.done
+
+
+class HighlightWorker:
+    """Runs all lexing for the editors on one background thread.
+
+    Jobs are coalesced per editor: a newer buffer snapshot replaces an older
+    one that has not started yet. Each finished job puts
+    ``(state, generation, seq, payload)`` on ``results``, where ``payload``
+    is a list of ``(start_index, end_index, {tag: [indices]})`` ready for Tk.
+    The Tk thread acknowledges applied payloads through ``state.acked``. A
+    payload it drops as stale is always followed by a newer snapshot, and
+    the update job re-lexes every unacknowledged range, so no range is
+    left untagged.
+    """
+
+    PAYLOAD_SPANS = 20000 # Large results are split so the Tk thread can apply them in slices
+
+    def __init__(self, slice_seconds=0.02, token_cache=None):
+        self.slice_seconds = slice_seconds
+        self.token_cache = token_cache
+        self.results = queue.Queue()
+        self._jobs = {} # {state: {kind: args}}
+        self._running = False
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="highlight-worker", daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        return bool(self._jobs) or self._running or not self.results.empty()
+
+    def submit(self, state, kind, args=()):
+        """Queues ``kind`` ("update", "provisional", "step" or "snippet") for an editor."""
+        with self._condition:
+            self._jobs.setdefault(state, {})[kind] = args
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._jobs:
+                    self._condition.wait()
+                state = next(iter(self._jobs))
+                jobs = self._jobs.pop(state)
+                self._running = True
+            try:
+                if not state.closed:
+                    self._process(state, jobs)
+            except Exception as e:
+                print(f"Highlight worker error: {e}")
+            finally:
+                self._running = False
+            if not state.closed and state.started and not state.highlighter.done and not state.viewport_only:
+                time.sleep(0.005) # Let the Tk thread have the GIL between slices
+                self.submit(state, "step")
+
+    def _process(self, state, jobs):
+        highlighter = state.highlighter
+        if "snippet" in jobs:
+            # Viewport-only mode: lex the visible text from the root state, untracked
+            generation, first_line, snippet = jobs["snippet"]
+            snippet_highlighter = IncrementalHighlighter(highlighter.lexer, highlighter.tag_for_token)
+            snippet_highlighter.first_line = first_line
+            start, end, spans = snippet_highlighter.reset(snippet)
+            payload = [(snippet_highlighter.index(start), snippet_highlighter.index(end), snippet_highlighter.tag_ranges(spans))]
+            self._seq += 1
+            self.results.put((state, generation, self._seq, payload))
+            return
+        results = []
+        unacked = []
+        for entry in state.pending:
+            if entry[0] in state.acked:
+                state.acked.discard(entry[0])
+            else:
+                unacked.append(entry)
+        state.pending = unacked
+        if "update" in jobs:
+            generation, content, lazy = jobs["update"]
+            if not state.started:
+                state.started = True
+                key = self.token_cache.key(content) if self.token_cache else None
+                cached = self.token_cache.load(key) if key else None
+                if cached:
+                    spans, states = cached
+                    highlighter.restore(content, states)
+                    results.append((0, len(content), spans))
+                elif lazy:
+                    highlighter.begin(content)
+                    if key:
+                        state.cache_fill = (key, [])
+                else:
+                    result = highlighter.reset(content)
+                    results.append(result)
+                    if key:
+                        self.token_cache.store(key, result[2], highlighter.states)
+            else:
+                result = highlighter.update(content)
+                if result:
+                    results.append(result)
+                if highlighter.last_edit:
+                    state.cache_fill = None # Only an unedited file is worth caching
+                # Unacknowledged payloads belong to older snapshots, so the Tk
+                # thread drops them: shift their ranges with the edit and lex
+                # them again. Ranges past the lazy frontier are recoloured by
+                # the next viewport request instead.
+                for _, start, end in state.pending:
+                    start, end = highlighter.map_range(start, end)
+                    if not any(r[0] <= start and end <= r[1] for r in results):
+                        extra = highlighter.relex_range(start, end)
+                        if extra:
+                            results.append(extra)
+                if state.pending:
+                    highlighter.provisional_lines = None
+                state.pending = []
+            state.text_generation = generation
+        if not state.started:
+            return
+        if "provisional" in jobs:
+            first_line, last_line, force = jobs["provisional"]
+            result = highlighter.provisional(first_line, last_line, force)
+            if result:
+                results.append(result)
+        if "step" in jobs and "update" not in jobs:
+            result = highlighter.lex_step(self.slice_seconds)
+            if result:
+                results.append(result)
+                if state.cache_fill:
+                    state.cache_fill[1].extend(result[2])
+                    if highlighter.done:
+                        self.token_cache.store(state.cache_fill[0], state.cache_fill[1], highlighter.states)
+                        state.cache_fill = None
+
+        chunk_size = self.PAYLOAD_SPANS
+        for start, end, spans in results:
+            for i in range(0, max(len(spans), 1), chunk_size):
+                chunk = spans[i:i + chunk_size]
+                chunk_start = start if i == 0 else chunk[0][0]
+                chunk_end = end if i + chunk_size >= len(spans) else spans[i + chunk_size][0]
+                self._seq += 1
+                state.pending.append((self._seq, chunk_start, chunk_end))
+                payload = [(highlighter.index(chunk_start), highlighter.index(chunk_end), highlighter.tag_ranges(chunk))]
+                self.results.put((state, state.text_generation, self._seq, payload))
+
+
+class LineNumberGutter:
+    """Line-number canvas for an editor that reuses its text items.
+
+    Redraws are skipped while the first visible line, its pixel offset and
+    the canvas height are unchanged. Otherwise the pooled items are only
+    moved and relabelled where needed, and surplus items are hidden rather
+    than deleted.
+    """
+
+    def __init__(self, canvas, text_widget):
+        self.canvas = canvas
+        self.text_widget = text_widget
+        self.items = [] # Canvas text item ids, reused across redraws
+        self.labels = [] # Current (text, y, visible) of each item
+        self._last_view = None
+
+    def redraw(self, force=False):
+        text_widget = self.text_widget
+        height = self.canvas.winfo_height()
+        # Get the first visible line number
+        first_visible_line = int(text_widget.index("@0,0").split(".")[0])
+        first_dline = text_widget.dlineinfo(f"{first_visible_line}.0")
+        view = (first_visible_line, first_dline[1] if first_dline else None, height)
+        if not force and view == self._last_view:
+            return
+        self._last_view = view
+        # Get the last visible line number at the bottom edge of the gutter
+        last_visible_line = int(text_widget.index(f"@0,{height}").split(".")[0])
+
+        used = 0
+        for line_number in range(first_visible_line, last_visible_line + 1):
+            dline = first_dline if line_number == first_visible_line else text_widget.dlineinfo(f"{line_number}.0")
+            if dline is None: # Line is not visible or doesn't exist
+                continue
+            label = (str(line_number), dline[1], True)
+            if used == len(self.items):
+                self.items.append(self.canvas.create_text(2, label[1], anchor="nw", text=label[0], fill="gray"))
+                self.labels.append(label)
+            elif self.labels[used] != label:
+                item = self.items[used]
+                text, y, visible = self.labels[used]
+                if y != label[1]:
+                    self.canvas.coords(item, 2, label[1])
+                if text != label[0]:
+                    self.canvas.itemconfigure(item, text=label[0])
+                if not visible:
+                    self.canvas.itemconfigure(item, state="normal")
+                self.labels[used] = label
+            used += 1
+
+        for index in range(used, len(self.items)):
+            text, y, visible = self.labels[index]
+            if visible:
+                self.canvas.itemconfigure(self.items[index], state="hidden")
+                self.labels[index] = (text, y, False)
+
+
+# Editor defaults; overridable through the "editor" section of config.json
+DEFAULT_EDITOR_SETTINGS = {
+    "lazy_highlight_lines": 10000, # Files with more lines are highlighted viewport-first
+    "highlight_margin_lines": 100, # Lines coloured above and below the viewport in lazy mode
+    "highlight_slice_ms": 20, # Time budget of each background lexing slice in lazy mode
+    "highlight_debounce_ms": 80, # Typing pause before the buffer is snapshotted for lexing
+    "token_cache_mb": 256, # Size bound of the on-disk highlight cache; 0 disables it
+    "build_cache_mb": 512, # Size bound of the on-disk cache of compiled .vvp files; 0 disables it
+    "large_file_mb": 32, # Files at least this big are streamed in and only highlighted on screen
+    "large_file_chunk_kb": 4096, # Bytes inserted per event-loop slice while streaming a large file
+    "watch_debounce_ms": 300, # Quiet period after source files change on disk before the hierarchy is refreshed
+    "log_flush_ms": 50, # Interval at which the output of a running command is moved into the console
+    "log_flush_max_lines": 20000, # Most output lines inserted per interval, so a flood of output cannot stall the GUI
+    "console_max_lines": 10000, # Lines the console keeps; the full output of a run is in its log file
+    "regression_workers": 0, # Tests compiled and simulated at once by the regression runner; 0 means one per CPU
+    "farm_address": "127.0.0.1:7878", # Where the simulation farm server listens: host:port, or unix:/path
+}
+
 
 class VerilogGUI:
     def __init__(self, master):
@@ -24,6 +3465,7 @@ class VerilogGUI:
         self.verilog_files = []
         self.project_path = ""
         self.config_file_path = "config.json"
+        self.editor_settings = dict(DEFAULT_EDITOR_SETTINGS)
 
         # Load window state on startup
         self.load_window_state()
@@ -49,13 +3491,12 @@ class VerilogGUI:
 
         # Dictionary to keep track of opened editor tabs: {file_path: (tab_frame, text_widget)}
         self.open_editors = {}
-
-        # --- GUI Elements ---
-        self.create_widgets()
-
-        # --- NEW: Create hierarchy viewer specific widgets and initial build ---
-        self._create_hierarchy_viewer_widgets()
-
+        # Line-number gutter per editor: {text_widget: LineNumberGutter}
+        self.gutters = {}
+        # Editors still streaming in a large file; they must not be saved yet
+        self.loading_editors = set()
+        # Highlighting state per editor: {text_widget: EditorHighlightState}
+        self.highlight_states = {}
         # Define Pygments token type to Tkinter tag name and color mapping
         # These tags will be configured on each editor's ScrolledText widget
         self.pygments_tag_styles = {
@@ -74,6 +3515,84 @@ class VerilogGUI:
             Token.Name.Class: {"tag": "class", "foreground": "#0000FF"}, # Blue for classes
             Token.Text: {"tag": "text", "foreground": "black"}, # Fallback for plain text
         }
+        self._highlight_tags = [style_config["tag"] for style_config in self.pygments_tag_styles.values()]
+        self._token_tags = {} # Memoized token type -> tag name lookups
+        # Cached spans name tags, so the mapping that produced them is part of the cache key
+        token_cache = None
+        if self.editor_settings["token_cache_mb"] > 0:
+            token_cache = TokenCache(os.path.join(_user_cache_dir(), "tokens"), self.editor_settings["token_cache_mb"] * 1024 * 1024,
+                                     {token_type: style["tag"] for token_type, style in self.pygments_tag_styles.items()})
+        self.highlight_worker = HighlightWorker(self.editor_settings["highlight_slice_ms"] / 1000, token_cache)
+        self._highlight_poll_job = None
+        # Project-wide find/replace; its thread pool is only started by the first search
+        self.project_search = ProjectSearch()
+        # Per-file hierarchy parse results, so a rebuild only re-parses changed files; persisted in the
+        # project's symbol index once a project file exists
+        self.symbol_index = SymbolIndex()
+        self.parse_cache = ParseCache(self.symbol_index)
+        self.hierarchy_parser = HierarchyParser(self.parse_cache)
+        self._hierarchy_poll_job = None
+        self.design_modules = {}
+        # Tree items are keyed by instance path; what each shows is kept here so a refresh can compare
+        # the new model with the displayed items without asking Tk
+        self._hierarchy_specs = {} # {item: (item, text, values, kind, key)}
+        self._hierarchy_nodes = {} # {module_name: {items showing that module}}
+        self._hierarchy_filled = set() # Items whose children have been inserted
+        self.design_hierarchy = DesignHierarchy({})
+        # iverilog/vvp runs; their output is read on a background thread and shown in batches
+        self.command_runner = CommandRunner()
+        # Compiled outputs by a hash of their inputs, so an unchanged project is not compiled again
+        self.build_cache = None
+        if self.editor_settings["build_cache_mb"] > 0:
+            self.build_cache = BuildCache(os.path.join(_user_cache_dir(), "builds"), self.editor_settings["build_cache_mb"] * 1024 * 1024)
+        self._command_poll_job = None
+        self._command_running = False
+        self._command_done = None # Called with whether the command succeeded
+        self.run_log = None # RunLog with the complete output of the last run
+        self._command_list = None
+        self._command_timeout = None
+        # Build pipeline (Run): the stage being worked on, or None when idle
+        self._pipeline_stage = None
+        self._simulated = {} # {abs_vcd: stamp of the .vvp and vvp that produced it}
+        self._gtkwave_processes = {} # {abs_vcd: Popen of the GTKWave showing it}
+        # Regression: the project's testbenches, each with its own top, defines and plusargs
+        self.regression_tests = [] # [{"name", "top", "defines": [...], "parameters": [...], "plusargs": [...]}]
+        self.regression_dir = "regression"
+        self.regression_runner = None
+        self.regression_log = None # RunLog with the merged output of the last regression
+        self._regression_dialog = None
+        self._regression_started = 0.0
+        # Parameter sweep: its settings are kept with the project
+        self.sweep_settings = {"top": "", "mode": "grid", "spec": "", "dir": "sweep"}
+        self.sweep_runner = None
+        self.sweep_log = None # RunLog with the merged output of the last sweep
+        self._sweep = None # {"points", "top", "started"} of the running sweep
+        self._sweep_dialog = None
+        # Simulation farm: the job server regressions and sweeps can be sent to, and the local workers started for it
+        self.farm_server = None
+        self.farm_processes = []
+        self.use_farm = tk.BooleanVar(value=False)
+        self._farm_dialog = None
+        self.run_history = [] # Resource use of past runs, kept next to the project file once there is one
+        self._console_trimmed = 0 # Lines dropped from the top of the console
+        # Source files changed on disk by any program (or saved here) are re-parsed on their own
+        self.file_watcher = FileWatcher()
+        self._watch_changes = set()
+        self._watch_debounce_job = None
+        self._incremental_generation = None # Parser run that only re-parses _incremental_touched
+        self._incremental_touched = set()
+        self.search_frame = None
+        self._search_poll_job = None
+        self._search_pending = None # [kind, generation, files still outstanding]
+        self._search_totals = [0, 0]
+        self._search_started = 0.0
+
+        # --- GUI Elements ---
+        self.create_widgets()
+
+        # --- NEW: Create hierarchy viewer specific widgets and initial build ---
+        self._create_hierarchy_viewer_widgets()
+
 
         # --- Environment Check on startup ---
         self.check_dependencies()
@@ -134,6 +3653,9 @@ class VerilogGUI:
         cmd_frame = ttk.Frame(self.console_frame)
         cmd_frame.pack(fill="x")
 
+        self.run_btn = ttk.Button(cmd_frame, text="Run (Compile → Simulate → View)", command=self.run_pipeline)
+        self.run_btn.pack(side=tk.LEFT, expand=True, fill="x", padx=5)
+
         self.compile_btn = ttk.Button(cmd_frame, text="Compile (iverilog)", command=self.compile_verilog)
         self.compile_btn.pack(side=tk.LEFT, expand=True, fill="x", padx=5)
 
@@ -146,6 +3668,9 @@ class VerilogGUI:
         self.clean_btn = ttk.Button(cmd_frame, text="Clean Project", command=self.clean_project)
         self.clean_btn.pack(side=tk.LEFT, expand=True, fill="x", padx=5)
 
+        self.stop_btn = ttk.Button(cmd_frame, text="Stop", command=self.stop_command, state=tk.DISABLED)
+        self.stop_btn.pack(side=tk.LEFT, expand=True, fill="x", padx=5)
+
         # Frame for Advanced Options
         adv_frame = ttk.LabelFrame(self.console_frame, text="Advanced Options")
         adv_frame.pack(fill="x", padx=10, pady=5)
@@ -154,6 +3679,10 @@ class VerilogGUI:
         self.iverilog_flags_entry = ttk.Entry(adv_frame)
         self.iverilog_flags_entry.pack(side=tk.LEFT, fill="x", expand=True, padx=5)
 
+        ttk.Label(adv_frame, text="Timeout (s):").pack(side=tk.LEFT, padx=5)
+        self.run_timeout_entry = ttk.Entry(adv_frame, width=8) # Empty or 0: no timeout
+        self.run_timeout_entry.pack(side=tk.LEFT, padx=5)
+
         # Frame for information output
         log_frame = ttk.LabelFrame(self.console_frame, text="Command Output & Log")
         log_frame.pack(fill="both", expand=True)
@@ -165,6 +3694,8 @@ class VerilogGUI:
         self.output_log_widget.tag_config("ERROR", foreground="red")
         self.output_log_widget.tag_config("WARNING", foreground="orange")
         self.output_log_widget.tag_config("CMD", foreground="blue")
+        self.output_log_widget.tag_config("ELIDED", foreground="gray")
+        self.output_log_widget.tag_config("PASS", foreground="green")
 
         # Menu Bar for project management
         menubar = tk.Menu(self.master)
@@ -184,6 +3715,21 @@ class VerilogGUI:
         menubar.add_cascade(label="Edit", menu=edit_menu)
         edit_menu.add_command(label="Find...", command=self.find_text)
         edit_menu.add_command(label="Replace...", command=self.replace_text)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Find in Project...", command=self.open_project_search)
+        edit_menu.add_command(label="Go to Definition", accelerator="F12", command=self.go_to_definition)
+        edit_menu.add_command(label="Find References", accelerator="Shift+F12", command=self.find_references)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Search Run Log...", command=self.open_run_log)
+        edit_menu.add_command(label="Run History...", command=self.show_run_history)
+
+        run_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Run", menu=run_menu)
+        run_menu.add_command(label="Run (Compile → Simulate → View)", command=self.run_pipeline)
+        run_menu.add_command(label="Regression...", command=self.open_regression)
+        run_menu.add_command(label="Parameter Sweep...", command=self.open_sweep)
+        run_menu.add_separator()
+        run_menu.add_command(label="Simulation Farm...", command=self.open_farm)
 
         # Menu for Code Templates
         template_menu = tk.Menu(menubar, tearoff=0)
@@ -194,23 +3740,10 @@ class VerilogGUI:
 
     def check_dependencies(self):
         """检查iverilog, vvp, gtkwave是否存在于PATH中"""
-        dependencies = {
-            "Icarus Verilog (iverilog)": "iverilog",
-            "Icarus Verilog VVP": "vvp",
-            "GTKWave": "gtkwave"
-        }
-        
-        missing = []
-        found_paths = {}
-        
-        for name, cmd in dependencies.items():
-            path = shutil.which(cmd) # 在系统PATH中查找命令
-            if path:
-                self.output_log_widget.insert(tk.END, f"找到 {name} at: {path}\n")
-                found_paths[cmd] = path
-            else:
-                missing.append(name)
-                
+        found_paths, missing = find_tools()
+        for cmd, path in found_paths.items():
+            self.output_log_widget.insert(tk.END, f"找到 {TOOL_NAMES[cmd]} at: {path}\n")
+
         if missing:
             messagebox.showerror(
                 "依赖缺失",
@@ -218,6 +3751,7 @@ class VerilogGUI:
             )
             self.output_log_widget.insert(tk.END, "\n--- 依赖缺失，部分功能可能无法使用 ---\n")
             # Disable buttons if dependencies are missing
+            self.run_btn.config(state=tk.DISABLED)
             self.compile_btn.config(state=tk.DISABLED)
             self.simulate_btn.config(state=tk.DISABLED)
             self.view_wave_btn.config(state=tk.DISABLED)
@@ -227,87 +3761,992 @@ class VerilogGUI:
         self.output_log_widget.insert(tk.END, "\n--- 环境检查成功，所有依赖工具均已找到！ ---\n")
         self.tool_paths = found_paths
         # Enable buttons if dependencies are found
+        self.run_btn.config(state=tk.NORMAL)
         self.compile_btn.config(state=tk.NORMAL)
         self.simulate_btn.config(state=tk.NORMAL)
         self.view_wave_btn.config(state=tk.NORMAL)
         return found_paths
 
-    def run_command(self, command_list):
-        """执行一个命令并将其输出实时显示在GUI的文本框中"""
-        self.output_log_widget.delete('1.0', tk.END) # 清空上次的输出
-        self.output_log_widget.insert(tk.END, f"正在执行命令: {' '.join(command_list)}\n\n", "CMD") # Tag the command line as CMD
-        self.output_log_widget.update()
+    def run_command(self, command_list, on_done=None, clear=True):
+        """执行一个命令并将其输出实时显示在GUI的文本框中。
+        The command runs without blocking the GUI; ``on_done(success)`` is called when it ends.
+        ``clear=False`` keeps the console, for the later steps of the build pipeline.
+        Returns False if another command is still running."""
+        if self._command_running:
+            messagebox.showinfo("提示", "已有命令正在运行，请等待其结束。")
+            return False
+        if clear:
+            self.output_log_widget.delete('1.0', tk.END) # 清空上次的输出
+        header = f"正在执行命令: {' '.join(command_list)}\n\n"
+        self.output_log_widget.insert(tk.END, header, "CMD") # Tag the command line as CMD
+        if self.run_log:
+            self.run_log.close()
+        try:
+            self.run_log = RunLog(os.path.join(_user_cache_dir(), "logs"))
+            self.run_log.append([header])
+        except OSError as e:
+            self.run_log = None
+            self.output_log_widget.insert(tk.END, f"Warning: 无法创建运行日志文件: {e}\n", "WARNING")
+        self._command_running = True
+        self._command_done = on_done
+        self._command_list = list(command_list)
+        self.stop_btn.config(state=tk.NORMAL)
+        self._command_timeout = self._run_timeout()
+        self.command_runner.start(command_list, log=self.run_log, timeout=self._command_timeout)
+        if self._command_poll_job is None:
+            self._command_poll_job = self.master.after(self.editor_settings["log_flush_ms"], self._poll_command_output)
+        return True
+
+    def _poll_command_output(self):
+        """Moves the queued output of the running command into the console with a single insert."""
+        self._command_poll_job = None
+        runner = self.command_runner
+        budget = self.editor_settings["log_flush_max_lines"]
+        lines, finished = [], None
+        while budget > 0:
+            try:
+                kind, run_id, payload = runner.results.get_nowait()
+            except queue.Empty:
+                break
+            if run_id != runner.run_id:
+                continue
+            if kind != "output":
+                finished = (kind, payload)
+                break
+            lines.extend(payload)
+            budget -= len(payload)
+
+        if lines:
+            # Consecutive lines with the same tag become one (chars, tags) pair of the insert
+            args, run, run_tag = [], [], None
+            for line, tag in lines:
+                if tag != run_tag and run:
+                    args += ["".join(run), run_tag or ()]
+                    run = []
+                run_tag = tag
+                run.append(line)
+            args += ["".join(run), run_tag or ()]
+            self.output_log_widget.insert(tk.END, *args)
+            self._trim_console()
+            self.output_log_widget.see(tk.END) # 滚动到底部
+
+        if finished:
+            self._finish_command(*finished)
+        else:
+            self._command_poll_job = self.master.after(self.editor_settings["log_flush_ms"], self._poll_command_output)
+
+    def _trim_console(self):
+        """Keeps only the last console_max_lines lines in the console, with a note on top saying where the rest is."""
+        widget = self.output_log_widget
+        limit = self.editor_settings["console_max_lines"]
+        note = widget.tag_ranges("ELIDED")
+        if int(widget.index("end-1c").split(".")[0]) - (1 if note else 0) <= limit:
+            return
+        if note:
+            widget.delete(*note[:2])
+        else:
+            self._console_trimmed = 0 # The console was cleared since the last note
+        excess = int(widget.index("end-1c").split(".")[0]) - limit
+        widget.delete("1.0", f"{excess + 1}.0")
+        self._console_trimmed += excess
+        where = f"完整日志: {self.run_log.path} (Edit > Search Run Log...)" if self.run_log else ""
+        widget.insert("1.0", f"… 控制台只保留最后 {limit} 行，前 {self._console_trimmed} 行已移出。{where}\n", "ELIDED")
+
+    def _run_timeout(self):
+        """The wall-clock limit of a run in seconds, or None."""
+        try:
+            timeout = float(self.run_timeout_entry.get() or 0)
+        except ValueError:
+            self.output_log_widget.insert(tk.END, f"Warning: 无效的超时时间 '{self.run_timeout_entry.get()}'，将不限制运行时间。\n", "WARNING")
+            return None
+        return timeout if timeout > 0 else None
+
+    def stop_command(self):
+        """Stops the running command and everything it started."""
+        if self._command_running:
+            self.output_log_widget.insert(tk.END, "\n--- 正在停止命令… ---\n", "WARNING")
+            self.command_runner.stop()
+
+    def _finish_command(self, kind, payload):
+        self._command_running = False
+        self.stop_btn.config(state=tk.DISABLED)
+        if kind == "exit":
+            success = payload["returncode"] == 0 and not payload["stopped"]
+            if payload["stopped"] == "timeout":
+                footer = f"\n--- 运行超时 ({self._command_timeout:g} s)，已终止 ---\n"
+            elif payload["stopped"]:
+                footer = "\n--- 命令已停止 ---\n"
+            elif success:
+                footer = "\n--- 命令执行成功 ---\n"
+            else:
+                footer = f"\n--- 命令执行失败 (返回代码: {payload['returncode']}) ---\n"
+            footer += f"--- {_format_run_stats(payload)} ---\n"
+            self._record_run(payload)
+        else: # The command could not be started
+            success = False
+            footer = payload
+        self.output_log_widget.insert(tk.END, footer)
+        self.output_log_widget.see(tk.END)
+        if self.run_log:
+            self.run_log.append(footer.splitlines(keepends=True))
+            self.run_log.close()
+        callback, self._command_done = self._command_done, None
+        if callback:
+            callback(success)
+
+    RUN_HISTORY_LIMIT = 1000 # Runs kept in memory and shown
+
+    def _run_history_path(self, project_path=None):
+        project_path = project_path or self.project_path
+        return os.path.splitext(project_path)[0] + ".runs.jsonl" if project_path else None
+
+    def _record_run(self, stats):
+        """Adds a finished run to the history, appending it to the project's history file."""
+        entry = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "tool": os.path.basename(self._command_list[0]),
+                 "command": " ".join(self._command_list), **stats}
+        self.run_history.append(entry)
+        del self.run_history[:-self.RUN_HISTORY_LIMIT]
+        path = self._run_history_path()
+        if path:
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except OSError as e:
+                self.output_log_widget.insert(tk.END, f"Warning: 无法写入运行历史 {path}: {e}\n", "WARNING")
+
+    def _load_run_history(self):
+        self.run_history = []
+        path = self._run_history_path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.run_history.append(json.loads(line))
+                    except ValueError:
+                        continue # A line cut short by a crash
+        except OSError as e:
+            self.output_log_widget.insert(tk.END, f"Warning: 无法读取运行历史 {path}: {e}\n", "WARNING")
+        del self.run_history[:-self.RUN_HISTORY_LIMIT]
+
+    def show_run_history(self):
+        """Lists past runs with their resource use; the last column compares the wall time with the previous run of the same tool."""
+        dialog = tk.Toplevel(self.master)
+        dialog.title("运行历史")
+        dialog.geometry("900x400")
+        columns = ("time", "tool", "result", "wall", "user", "sys", "rss", "change")
+        headings = ("时间", "工具", "结果", "墙钟时间", "用户 CPU", "系统 CPU", "峰值内存", "较上次")
+        table = ttk.Treeview(dialog, columns=columns, show="headings")
+        for column, heading in zip(columns, headings):
+            table.heading(column, text=heading)
+            table.column(column, width=150 if column == "time" else 90, anchor="w" if column in ("time", "tool", "result") else "e")
+        scrollbar = ttk.Scrollbar(dialog, orient="vertical", command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
+        table.pack(fill="both", expand=True)
+
+        def seconds(value):
+            return "-" if value is None else f"{value:.2f} s"
+
+        previous_wall = {}
+        rows = []
+        for entry in self.run_history:
+            wall = entry.get("wall")
+            earlier = previous_wall.get(entry.get("command"))
+            change = f"{(wall - earlier) / earlier:+.0%}" if wall and earlier else ""
+            if not entry.get("stopped") and entry.get("returncode") == 0:
+                previous_wall[entry.get("command")] = wall # Only completed runs are a baseline
+            result = entry.get("stopped") or ("成功" if entry.get("returncode") == 0 else f"失败 ({entry.get('returncode')})")
+            rss = entry.get("max_rss")
+            rows.append((entry.get("time", ""), entry.get("tool", ""), result, seconds(wall), seconds(entry.get("user")),
+                         seconds(entry.get("sys")), "-" if rss is None else f"{rss / 2**20:.1f} MB", change))
+        for row in reversed(rows): # Newest first
+            table.insert("", "end", values=row)
+
+    RUN_LOG_PAGE_LINES = 500
+    RUN_LOG_MAX_MATCHES = 5000
+
+    def open_run_log(self, run_log=None):
+        """Searches the complete log of the last run (or ``run_log``) and pages any part of it into view."""
+        run_log = run_log or self.run_log
+        if run_log is None:
+            messagebox.showinfo("提示", "还没有运行过命令。")
+            return
+        page_lines = self.RUN_LOG_PAGE_LINES
+
+        dialog = tk.Toplevel(self.master)
+        dialog.title(f"运行日志 - {os.path.basename(run_log.path)}")
+        dialog.geometry("900x600")
+
+        search_bar = ttk.Frame(dialog)
+        search_bar.pack(fill="x", padx=5, pady=5)
+        ttk.Label(search_bar, text="查找:").pack(side=tk.LEFT)
+        search_entry = ttk.Entry(search_bar, width=30)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_bar, text="正则表达式", variable=regex_var).pack(side=tk.LEFT)
+        ttk.Label(search_bar, text="转到行:").pack(side=tk.LEFT, padx=(15, 0))
+        line_entry = ttk.Entry(search_bar, width=10)
+        line_entry.pack(side=tk.LEFT, padx=5)
+        status_label = ttk.Label(search_bar, text="")
+        status_label.pack(side=tk.RIGHT)
+
+        panes = ttk.PanedWindow(dialog, orient=tk.VERTICAL)
+        panes.pack(fill="both", expand=True, padx=5)
+        match_list = tk.Listbox(panes, height=8)
+        page_text = scrolledtext.ScrolledText(panes, wrap=tk.NONE)
+        page_text.tag_config("ERROR", foreground="red")
+        page_text.tag_config("WARNING", foreground="orange")
+        page_text.tag_config("current_line", background="lightblue")
+        panes.add(match_list, weight=1)
+        panes.add(page_text, weight=4)
+
+        nav_bar = ttk.Frame(dialog)
+        nav_bar.pack(fill="x", padx=5, pady=5)
+        position_label = ttk.Label(nav_bar, text="")
+        state = {"first": 0, "matches": []}
+
+        def show_page(first, current=None):
+            first = max(0, min(first, run_log.line_count - page_lines))
+            state["first"] = first
+            lines = run_log.read_lines(first, page_lines)
+            page_text.config(state=tk.NORMAL)
+            page_text.delete("1.0", tk.END)
+            if lines:
+                args = []
+                for line in lines:
+                    args += [line, _log_line_tag(line) or ()]
+                page_text.insert("1.0", *args)
+            if current is not None:
+                row = current - first + 1
+                page_text.tag_add("current_line", f"{row}.0", f"{row + 1}.0")
+                page_text.see(f"{row}.0")
+            page_text.config(state=tk.DISABLED)
+            position_label.config(text=f"第 {first + 1}-{first + len(lines)} 行，共 {run_log.line_count} 行")
+
+        def go_to_line(line):
+            show_page(line - page_lines // 2, line)
+
+        def run_search(event=None):
+            term = search_entry.get()
+            if not term:
+                return
+            try:
+                pattern = _compile_search_pattern(term, regex_var.get())
+            except re.error as e:
+                status_label.config(text=f"正则表达式错误: {e}")
+                return
+            match_list.delete(0, tk.END)
+            status_label.config(text="正在搜索…")
+            found = queue.Queue()
+
+            def search():
+                try:
+                    found.put(run_log.search(pattern, self.RUN_LOG_MAX_MATCHES))
+                except Exception as e: # Shown in the status label, not left on "正在搜索…"
+                    found.put(e)
+            # Large logs take a moment; the search runs on the memory-mapped file in the background
+            threading.Thread(target=search, daemon=True).start()
+
+            def poll_search():
+                if not dialog.winfo_exists():
+                    return
+                try:
+                    matches = found.get_nowait()
+                except queue.Empty:
+                    dialog.after(50, poll_search)
+                    return
+                if isinstance(matches, Exception):
+                    status_label.config(text=f"搜索失败: {matches}")
+                    return
+                state["matches"] = matches
+                match_list.insert(tk.END, *[f"{line + 1}: {text[:300]}" for line, text in matches])
+                capped = " (已达上限)" if len(matches) >= self.RUN_LOG_MAX_MATCHES else ""
+                status_label.config(text=f"找到 {len(matches)} 行{capped}")
+
+            poll_search()
+
+        def on_match_selected(event):
+            selection = match_list.curselection()
+            if selection:
+                go_to_line(state["matches"][selection[0]][0])
+
+        def on_line_entered(event):
+            try:
+                go_to_line(int(line_entry.get()) - 1)
+            except ValueError:
+                pass
+
+        ttk.Button(search_bar, text="搜索", command=run_search).pack(side=tk.LEFT, padx=5)
+        ttk.Button(nav_bar, text="开头", command=lambda: show_page(0)).pack(side=tk.LEFT)
+        ttk.Button(nav_bar, text="上一页", command=lambda: show_page(state["first"] - page_lines)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(nav_bar, text="下一页", command=lambda: show_page(state["first"] + page_lines)).pack(side=tk.LEFT)
+        ttk.Button(nav_bar, text="末尾", command=lambda: show_page(run_log.line_count)).pack(side=tk.LEFT, padx=5)
+        position_label.pack(side=tk.RIGHT)
+        search_entry.bind("<Return>", run_search)
+        line_entry.bind("<Return>", on_line_entered)
+        match_list.bind("<<ListboxSelect>>", on_match_selected)
+
+        show_page(run_log.line_count) # Start at the end, where a run's result is
+        search_entry.focus_set()
+
+    def launch_gtkwave(self, gtkwave_path, vcd_file_path):
+        """启动GTKWave来查看VCD文件"""
+        if not os.path.exists(vcd_file_path):
+            self.output_log_widget.insert(tk.END, f"\n错误: VCD文件 '{vcd_file_path}' 不存在。请先进行仿真。\n")
+            return
+
+        gtkw_file_path = self.gtkw_file_entry.get()
+        command = [gtkwave_path, vcd_file_path]
+
+        # 如果用户指定了 .gtkw 文件并且它存在，就添加到命令中
+        if gtkw_file_path and os.path.exists(gtkw_file_path):
+            self.output_log_widget.insert(tk.END, f"找到 GTKWave 配置文件: {gtkw_file_path}\n")
+            command.append(gtkw_file_path)
+        else:
+            self.output_log_widget.insert(tk.END, "未找到 GTKWave 配置文件，将使用默认视图。\n")
+
+        self.output_log_widget.insert(tk.END, f"\n正在启动 GTKWave 加载 {vcd_file_path}...\n")
+        try:
+            # 使用Popen启动一个独立的进程，我们的GUI不用等它
+            process = subprocess.Popen(command,
+                                       creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
+            self._gtkwave_processes[os.path.abspath(vcd_file_path)] = process
+        except FileNotFoundError:
+            self.output_log_widget.insert(tk.END, f"\n错误: GTKWave 未在 '{gtkwave_path}' 找到。\n")
+        except Exception as e:
+            self.output_log_widget.insert(tk.END, f"\n启动 GTKWave 失败: {e}\n")
+
+    def run_pipeline(self):
+        """Run: compile → simulate → view, redoing only the stages whose inputs changed.
+
+        The compile inputs are hashed on a worker thread (through the build cache), the
+        simulation is redone when the .vvp or vvp changed since the waveform was written,
+        and GTKWave is only started when it is not already showing the waveform.
+        """
+        if self._pipeline_stage or self._command_running:
+            messagebox.showinfo("提示", "已有命令正在运行，请等待其结束。")
+            return
+        settings = self._compile_settings()
+        if not settings:
+            return
+        if not self.vcd_output_entry.get():
+            messagebox.showerror("错误", "请指定波形文件名 (.vcd)。")
+            return
+        output_vvp, extra_flags = settings
+        self._pipeline_stage = "compile"
+        self._check_build_inputs(output_vvp, extra_flags, "Run: ", lambda build_key, up_to_date: self._pipeline_compile(
+            output_vvp, extra_flags, build_key, up_to_date))
+
+    def _check_build_inputs(self, output_vvp, extra_flags, prefix, then):
+        """Hashes the compile inputs through the build cache on a worker thread, restoring a
+        cached output if there is one, then calls ``then(build_key, up_to_date)`` on the Tk thread."""
+        # The single-step buttons would take the console while the inputs are checked
+        for button in (self.run_btn, self.compile_btn, self.simulate_btn):
+            button.config(state=tk.DISABLED)
+        self.output_log_widget.delete('1.0', tk.END)
+        self.output_log_widget.insert(tk.END, f"--- {prefix}检查编译输入… ---\n", "CMD")
+        tool, sources, cache = self.tool_paths['iverilog'], list(self.verilog_files), self.build_cache
+        results = queue.Queue()
+
+        def check_inputs():
+            build_key = cache.key(tool, sources, extra_flags, output_vvp) if cache else None
+            results.put((build_key, bool(build_key) and cache.restore(build_key, output_vvp)))
+
+        def poll():
+            try:
+                build_key, up_to_date = results.get_nowait()
+            except queue.Empty:
+                self.master.after(20, poll)
+                return
+            then(build_key, up_to_date)
+        threading.Thread(target=check_inputs, name="build-inputs", daemon=True).start()
+        self.master.after(20, poll)
+
+    def _pipeline_compile(self, output_vvp, extra_flags, build_key, up_to_date):
+        if not self._compile(output_vvp, extra_flags, build_key, up_to_date, clear=False,
+                             on_done=lambda success: self._pipeline_simulate(output_vvp) if success else self._end_pipeline("编译")):
+            self._end_pipeline("编译")
+
+    def _pipeline_simulate(self, output_vvp):
+        self._pipeline_stage = "simulate"
+        vcd_file = self.vcd_output_entry.get()
+        if self._simulation_up_to_date(output_vvp, vcd_file):
+            self.output_log_widget.insert(tk.END, f"\n--- {vcd_file} is up to date (设计未改变，跳过仿真) ---\n")
+            self._pipeline_view(vcd_file)
+            return
+
+        def simulated(success):
+            if not success:
+                self._end_pipeline("仿真")
+            elif not os.path.exists(vcd_file):
+                self.output_log_widget.insert(tk.END, f"\nWarning: 仿真没有生成 '{vcd_file}'，请检查测试平台中的 $dumpfile。\n", "WARNING")
+                self._end_pipeline()
+            else:
+                self._pipeline_view(vcd_file)
+        if not self._simulate(output_vvp, on_done=simulated, clear=False):
+            self._end_pipeline("仿真")
+
+    def _pipeline_view(self, vcd_file):
+        self._pipeline_stage = "view"
+        process = self._gtkwave_processes.get(os.path.abspath(vcd_file))
+        if process and process.poll() is None:
+            self.output_log_widget.insert(tk.END, f"\n--- GTKWave 已在显示 {vcd_file}；波形更新后请在 GTKWave 中使用 File > Reload Waveform ---\n")
+        else:
+            self.launch_gtkwave(self.tool_paths['gtkwave'], vcd_file)
+        self._end_pipeline()
+
+    def _end_pipeline(self, failed_stage=None):
+        if failed_stage:
+            self.output_log_widget.insert(tk.END, f"\n--- Run: {failed_stage}失败，后续步骤未执行 ---\n", "ERROR")
+        self._pipeline_stage = None
+        for button in (self.run_btn, self.compile_btn, self.simulate_btn):
+            button.config(state=tk.NORMAL)
+        self.output_log_widget.see(tk.END)
+
+    REGRESSION_COLUMNS = ("top", "defines", "parameters", "plusargs", "status", "compile", "simulate", "wall", "message")
+
+    def open_regression(self):
+        """Regression window: the project's testbenches, run concurrently, with a pass/fail table."""
+        if self._regression_dialog and self._regression_dialog["window"].winfo_exists():
+            self._regression_dialog["window"].lift()
+            return
+        dialog = tk.Toplevel(self.master)
+        dialog.title("回归测试")
+        dialog.geometry("1000x450")
+
+        toolbar = ttk.Frame(dialog)
+        toolbar.pack(fill="x", padx=5, pady=5)
+        ttk.Button(toolbar, text="添加...", command=lambda: self._edit_regression_test(None)).pack(side=tk.LEFT)
+        ttk.Button(toolbar, text="编辑...", command=lambda: self._edit_regression_test(table.focus() or None)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="删除", command=self._remove_regression_tests).pack(side=tk.LEFT)
+        ttk.Button(toolbar, text="添加层次中的顶层模块", command=self._add_regression_tops).pack(side=tk.LEFT, padx=5)
+        ttk.Label(toolbar, text="输出目录:").pack(side=tk.LEFT, padx=(15, 0))
+        dir_entry = ttk.Entry(toolbar, width=20)
+        dir_entry.insert(0, self.regression_dir)
+        dir_entry.pack(side=tk.LEFT, padx=5)
+        stop_button = ttk.Button(toolbar, text="停止", command=self.stop_regression, state=tk.DISABLED)
+        stop_button.pack(side=tk.RIGHT)
+        run_button = ttk.Button(toolbar, text="运行全部", command=lambda: self.run_regression(self.regression_tests))
+        run_button.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(toolbar, text="运行所选", command=lambda: self.run_regression(
+            [test for test in self.regression_tests if test["name"] in table.selection()])).pack(side=tk.RIGHT)
+
+        headings = ("Top", "Defines", "Parameters", "Plusargs", "结果", "编译", "仿真", "总用时", "信息")
+        table = ttk.Treeview(dialog, columns=self.REGRESSION_COLUMNS, selectmode="extended")
+        table.heading("#0", text="测试")
+        table.column("#0", width=140)
+        for column, heading in zip(self.REGRESSION_COLUMNS, headings):
+            table.heading(column, text=heading)
+            table.column(column, width=70 if column in ("status", "compile", "simulate", "wall") else 120,
+                         anchor="e" if column in ("compile", "simulate", "wall") else "w")
+        table.tag_configure("PASS", foreground="green")
+        for status in ("FAIL", "ERROR", "TIMEOUT"):
+            table.tag_configure(status, foreground="red")
+        table.tag_configure("STOPPED", foreground="orange")
+        scrollbar = ttk.Scrollbar(dialog, orient="vertical", command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        table.bind("<Double-1>", lambda e: self._edit_regression_test(table.identify_row(e.y) or None))
+
+        status_bar = ttk.Frame(dialog)
+        status_bar.pack(side=tk.BOTTOM, fill="x", padx=5, pady=5)
+        summary_label = ttk.Label(status_bar, text="")
+        summary_label.pack(side=tk.LEFT)
+        ttk.Button(status_bar, text="搜索合并日志...", command=lambda: self.open_run_log(self.regression_log) if self.regression_log
+                   else messagebox.showinfo("提示", "还没有运行过回归测试。", parent=dialog)).pack(side=tk.RIGHT)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
+        table.pack(fill="both", expand=True, padx=(5, 0))
+
+        self._regression_dialog = {"window": dialog, "table": table, "dir_entry": dir_entry, "summary": summary_label,
+                                   "run_button": run_button, "stop_button": stop_button}
+        self._refresh_regression_table()
+        if self.regression_runner:
+            run_button.config(state=tk.DISABLED)
+            stop_button.config(state=tk.NORMAL)
+
+    def _refresh_regression_table(self):
+        table = self._regression_dialog["table"]
+        table.delete(*table.get_children())
+        for test in self.regression_tests:
+            table.insert("", "end", iid=test["name"], text=test["name"],
+                         values=(test["top"], " ".join(test.get("defines", [])), " ".join(test.get("parameters", [])),
+                                 " ".join(test.get("plusargs", [])), "", "", "", "", ""))
+
+    def _edit_regression_test(self, name):
+        """Adds a test (``name`` None) or edits the test ``name`` through a small form."""
+        test = next((test for test in self.regression_tests if test["name"] == name), None)
+        form = tk.Toplevel(self._regression_dialog["window"])
+        form.title("编辑测试" if test else "添加测试")
+        form.transient(self._regression_dialog["window"])
+        fields = (("name", "名称:"), ("top", "顶层模块 (-s):"), ("defines", "Defines (如 WIDTH=8 DEBUG):"),
+                  ("parameters", "Parameters (-P, 如 tb.N=4):"), ("plusargs", "Plusargs (如 +seed=1):"))
+        entries = {}
+        for row, (key, label) in enumerate(fields):
+            ttk.Label(form, text=label).grid(row=row, column=0, sticky="w", padx=5, pady=2)
+            entry = ttk.Entry(form, width=50)
+            value = (test or {}).get(key, "")
+            entry.insert(0, " ".join(value) if isinstance(value, list) else value)
+            entry.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
+            entries[key] = entry
+
+        def accept():
+            try:
+                # Keys the form does not show survive an edit
+                edited = {**(test or {}), "name": entries["name"].get().strip(), "top": entries["top"].get().strip(),
+                          "defines": shlex.split(entries["defines"].get()), "parameters": shlex.split(entries["parameters"].get()),
+                          "plusargs": shlex.split(entries["plusargs"].get())}
+            except ValueError as e:
+                messagebox.showerror("错误", f"无法解析参数: {e}", parent=form)
+                return
+            if not edited["name"] or not edited["top"]:
+                messagebox.showerror("错误", "请填写名称和顶层模块。", parent=form)
+                return
+            # Names are compared as directory names, so "a b" and "a_b" cannot share one
+            directory = RegressionRunner.job_directory_name(edited["name"])
+            other = next((other for other in self.regression_tests
+                          if other is not test and RegressionRunner.job_directory_name(other["name"]) == directory), None)
+            if other:
+                messagebox.showerror("错误", f"'{edited['name']}' 与已有测试 '{other['name']}' 使用同一个目录 '{directory}'，请换一个名称。", parent=form)
+                return
+            if test:
+                self.regression_tests[self.regression_tests.index(test)] = edited
+            else:
+                self.regression_tests.append(edited)
+            form.destroy()
+            self._refresh_regression_table()
+
+        buttons = ttk.Frame(form)
+        buttons.grid(row=len(fields), column=0, columnspan=2, pady=5)
+        ttk.Button(buttons, text="确定", command=accept).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="取消", command=form.destroy).pack(side=tk.LEFT, padx=5)
+        form.grid_columnconfigure(1, weight=1)
+        entries["name"].focus_set()
+
+    def _remove_regression_tests(self):
+        selected = set(self._regression_dialog["table"].selection())
+        self.regression_tests = [test for test in self.regression_tests if test["name"] not in selected]
+        self._refresh_regression_table()
+
+    def _add_regression_tops(self):
+        """Adds a test for every top-level module of the hierarchy that has none yet."""
+        known = {test["top"] for test in self.regression_tests}
+        directories = {RegressionRunner.job_directory_name(test["name"]) for test in self.regression_tests}
+        for top in self.design_hierarchy.tops:
+            if top not in known and RegressionRunner.job_directory_name(top) not in directories:
+                self.regression_tests.append({"name": top, "top": top, "defines": [], "parameters": [], "plusargs": []})
+        self._refresh_regression_table()
+
+    def run_regression(self, tests):
+        if self.regression_runner:
+            messagebox.showinfo("提示", "回归测试正在运行，请等待其结束。", parent=self._regression_dialog["window"])
+            return
+        if not tests:
+            messagebox.showinfo("提示", "没有要运行的测试。", parent=self._regression_dialog["window"])
+            return
+        collisions = RegressionRunner.shared_directories(test["name"] for test in tests)
+        if collisions: # Only possible with tests loaded from a project file edited by hand
+            messagebox.showerror("错误", "以下测试会使用同一个目录，请重命名: " + ", ".join(collisions), parent=self._regression_dialog["window"])
+            return
+        if not self._farm_enabled() and (not self.tool_paths.get('iverilog') or not self.tool_paths.get('vvp')):
+            messagebox.showerror("错误", "iverilog 或 vvp 未找到。请检查环境设置。")
+            return
+        if not self.verilog_files:
+            messagebox.showerror("错误", "请选择至少一个 Verilog 源文件进行编译。")
+            return
+        try:
+            flags = shlex.split(self.iverilog_flags_entry.get())
+        except ValueError as e:
+            messagebox.showerror("错误", f"无法解析编译选项: {e}")
+            return
+        self.regression_dir = self._regression_dialog["dir_entry"].get().strip() or "regression"
+        if self.regression_log:
+            self.regression_log.close()
+        try:
+            self.regression_log = RunLog(os.path.join(_user_cache_dir(), "logs"))
+        except OSError as e:
+            self.regression_log = None
+            self.output_log_widget.insert(tk.END, f"Warning: 无法创建合并日志文件: {e}\n", "WARNING")
+        self.regression_runner = self._test_runner(flags, self.regression_dir, self.regression_log)
+        table = self._regression_dialog["table"]
+        for test in tests:
+            table.set(test["name"], "status", "排队")
+            for column in ("compile", "simulate", "wall", "message"):
+                table.set(test["name"], column, "")
+            table.item(test["name"], tags=())
+        self._regression_dialog["run_button"].config(state=tk.DISABLED)
+        self._regression_dialog["stop_button"].config(state=tk.NORMAL)
+        self._regression_dialog["summary"].config(text=f"正在运行 {len(tests)} 个测试 (最多 {self.regression_runner.workers} 个同时运行)…")
+        self.output_log_widget.insert(tk.END, f"\n--- 回归测试: {len(tests)} 个测试，输出目录 {os.path.abspath(self.regression_dir)} ---\n", "CMD")
+        self._regression_started = time.perf_counter()
+        self.regression_runner.start(tests)
+        self.master.after(100, self._poll_regression, self.regression_runner)
+
+    def stop_regression(self):
+        if self.regression_runner:
+            self.regression_runner.stop()
+
+    def _poll_regression(self, runner):
+        if runner is not self.regression_runner:
+            return
+        dialog = self._regression_dialog if self._regression_dialog and self._regression_dialog["window"].winfo_exists() else None
+
+        def seconds(value):
+            return "-" if value is None else f"{value:.2f}"
+
+        while True:
+            try:
+                kind, payload = runner.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "job":
+                tag = "PASS" if payload["status"] == "PASS" else "ERROR"
+                self.output_log_widget.insert(tk.END, f"{payload['status']:<8} {payload['name']} ({payload['wall']:.2f} s) {payload['message']}\n", tag)
+                if dialog and dialog["table"].exists(payload["name"]):
+                    row = payload["name"]
+                    dialog["table"].item(row, tags=(payload["status"],))
+                    for column, value in (("status", payload["status"]), ("compile", seconds(payload["compile"])),
+                                          ("simulate", seconds(payload["simulate"])), ("wall", seconds(payload["wall"])),
+                                          ("message", payload["message"])):
+                        dialog["table"].set(row, column, value)
+            else:
+                self._finish_regression(payload, dialog)
+                return
+        self.output_log_widget.see(tk.END)
+        self.master.after(100, self._poll_regression, runner)
+
+    def _finish_regression(self, results, dialog):
+        self.regression_runner = None
+        if self.regression_log:
+            self.regression_log.close()
+        passed = sum(1 for result in results if result["status"] == "PASS")
+        summary = (f"{passed}/{len(results)} 通过，用时 {time.perf_counter() - self._regression_started:.2f} s"
+                   f" (累计 {sum(result['wall'] for result in results):.2f} s)")
+        self.output_log_widget.insert(tk.END, f"--- 回归测试结束: {summary} ---\n", "PASS" if passed == len(results) else "ERROR")
+        if self.regression_log:
+            self.output_log_widget.insert(tk.END, f"合并日志: {self.regression_log.path}\n")
+        self.output_log_widget.see(tk.END)
+        if dialog:
+            dialog["summary"].config(text=summary)
+            dialog["run_button"].config(state=tk.NORMAL)
+            dialog["stop_button"].config(state=tk.DISABLED)
+
+    def _farm_enabled(self):
+        return self.farm_server is not None and self.use_farm.get()
+
+    def _test_runner(self, flags, output_dir, merged_log):
+        """The runner for a regression or sweep: the simulation farm when it is in use, else local processes."""
+        if self._farm_enabled():
+            return FarmRun(self.farm_server, self.verilog_files, flags, output_dir, timeout=self._run_timeout(), merged_log=merged_log)
+        return RegressionRunner(self.tool_paths, self.verilog_files, flags, output_dir, workers=self.editor_settings["regression_workers"],
+                                timeout=self._run_timeout(), build_cache=self.build_cache, merged_log=merged_log)
+
+    SWEEP_EXAMPLE = "# 网格: 每行一个轴，所有组合各为一个点\n-DWIDTH = 8 16 32\n+seed = 1 2 3\n"
+
+    def open_sweep(self):
+        """Parameter sweep window: expands a grid or list of -D/-P/+plusarg values into jobs and runs them in parallel."""
+        if self._sweep_dialog and self._sweep_dialog["window"].winfo_exists():
+            self._sweep_dialog["window"].lift()
+            return
+        settings = self.sweep_settings
+        dialog = tk.Toplevel(self.master)
+        dialog.title("参数扫描")
+        dialog.geometry("1000x600")
+
+        options = ttk.Frame(dialog)
+        options.pack(fill="x", padx=5, pady=5)
+        ttk.Label(options, text="顶层模块 (-s):").pack(side=tk.LEFT)
+        top_box = ttk.Combobox(options, width=20, values=self.design_hierarchy.tops)
+        top_box.set(settings["top"] or (self.design_hierarchy.tops[0] if self.design_hierarchy.tops else ""))
+        top_box.pack(side=tk.LEFT, padx=5)
+        mode_var = tk.StringVar(value=settings["mode"])
+        ttk.Radiobutton(options, text="网格", variable=mode_var, value="grid").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Radiobutton(options, text="列表 (每行一个点)", variable=mode_var, value="list").pack(side=tk.LEFT)
+        ttk.Label(options, text="输出目录:").pack(side=tk.LEFT, padx=(15, 0))
+        dir_entry = ttk.Entry(options, width=20)
+        dir_entry.insert(0, settings["dir"])
+        dir_entry.pack(side=tk.LEFT, padx=5)
+        stop_button = ttk.Button(options, text="停止", command=self.stop_sweep, state=tk.DISABLED)
+        stop_button.pack(side=tk.RIGHT)
+        run_button = ttk.Button(options, text="运行", command=self.run_sweep)
+        run_button.pack(side=tk.RIGHT, padx=5)
+
+        panes = ttk.PanedWindow(dialog, orient=tk.VERTICAL)
+        panes.pack(fill="both", expand=True, padx=5)
+        spec_text = scrolledtext.ScrolledText(panes, height=8, wrap=tk.NONE)
+        spec_text.insert("1.0", settings["spec"] or self.SWEEP_EXAMPLE)
+        table_frame = ttk.Frame(panes)
+        table = ttk.Treeview(table_frame, columns=("point", "status", "compile", "simulate", "wall", "metrics", "message"), show="headings")
+        for column, heading, width in (("point", "点", 260), ("status", "结果", 70), ("compile", "编译", 70), ("simulate", "仿真", 70),
+                                       ("wall", "总用时", 70), ("metrics", "METRIC", 160), ("message", "信息", 200)):
+            table.heading(column, text=heading)
+            table.column(column, width=width, anchor="e" if column in ("compile", "simulate", "wall") else "w")
+        table.tag_configure("PASS", foreground="green")
+        for status in ("FAIL", "ERROR", "TIMEOUT"):
+            table.tag_configure(status, foreground="red")
+        table.tag_configure("STOPPED", foreground="orange")
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
+        table.pack(fill="both", expand=True)
+        panes.add(spec_text, weight=1)
+        panes.add(table_frame, weight=3)
+
+        status_bar = ttk.Frame(dialog)
+        status_bar.pack(fill="x", padx=5, pady=5)
+        summary_label = ttk.Label(status_bar, text="")
+        summary_label.pack(side=tk.LEFT)
+        ttk.Button(status_bar, text="搜索合并日志...", command=lambda: self.open_run_log(self.sweep_log) if self.sweep_log
+                   else messagebox.showinfo("提示", "还没有运行过参数扫描。", parent=dialog)).pack(side=tk.RIGHT)
+
+        def remember(*_):
+            settings.update(top=top_box.get().strip(), mode=mode_var.get(), spec=spec_text.get("1.0", "end-1c"),
+                            dir=dir_entry.get().strip() or "sweep")
+
+        def preview(*_):
+            remember()
+            if self._sweep:
+                return
+            try:
+                summary_label.config(text=f"{len(_expand_sweep(settings['spec'], settings['mode']))} 个点")
+            except ValueError as e:
+                summary_label.config(text=str(e))
+        spec_text.bind("<KeyRelease>", preview)
+        mode_var.trace_add("write", preview)
+        for widget in (top_box, dir_entry):
+            widget.bind("<FocusOut>", remember)
+        top_box.bind("<<ComboboxSelected>>", remember)
+
+        self._sweep_dialog = {"window": dialog, "table": table, "summary": summary_label, "remember": remember,
+                              "run_button": run_button, "stop_button": stop_button}
+        if self._sweep:
+            run_button.config(state=tk.DISABLED)
+            stop_button.config(state=tk.NORMAL)
+        else:
+            preview()
 
+    def run_sweep(self):
+        dialog = self._sweep_dialog
+        dialog["remember"]()
+        settings = self.sweep_settings
+        if self.sweep_runner:
+            return
+        if not self._farm_enabled() and (not self.tool_paths.get('iverilog') or not self.tool_paths.get('vvp')):
+            messagebox.showerror("错误", "iverilog 或 vvp 未找到。请检查环境设置。")
+            return
+        if not self.verilog_files:
+            messagebox.showerror("错误", "请选择至少一个 Verilog 源文件进行编译。")
+            return
+        if not settings["top"]:
+            messagebox.showerror("错误", "请指定顶层模块。", parent=dialog["window"])
+            return
         try:
-            # Popen允许我们非阻塞地读取输出
-            process = subprocess.Popen(
-                command_list,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT, # 将错误输出重定向到标准输出
-                text=True,
-                encoding='utf-8',
-                # Windows下不显示控制台窗口
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            
-            # 实时读取输出并插入到文本框
-            while True:
-                line = process.stdout.readline()
-                if not line:
-                    break
+            points = _expand_sweep(settings["spec"], settings["mode"])
+            flags = shlex.split(self.iverilog_flags_entry.get())
+        except ValueError as e:
+            messagebox.showerror("错误", f"无法解析扫描设置: {e}", parent=dialog["window"])
+            return
+        if not points:
+            messagebox.showinfo("提示", "扫描没有任何点。", parent=dialog["window"])
+            return
+        width = len(str(len(points) - 1))
+        tests = [_sweep_test(f"p{index:0{width}d}", settings["top"], point) for index, point in enumerate(points)]
+        if self.sweep_log:
+            self.sweep_log.close()
+        try:
+            self.sweep_log = RunLog(os.path.join(_user_cache_dir(), "logs"))
+        except OSError as e:
+            self.sweep_log = None
+            self.output_log_widget.insert(tk.END, f"Warning: 无法创建合并日志文件: {e}\n", "WARNING")
+        self.sweep_runner = self._test_runner(flags, settings["dir"], self.sweep_log)
+        self._sweep = {"points": points, "top": settings["top"], "dir": settings["dir"], "started": time.perf_counter()}
+        table = dialog["table"]
+        table.delete(*table.get_children())
+        for test, point in zip(tests, points):
+            label = " ".join(f"{axis}={value}" if value else axis for axis, value in point.items())
+            table.insert("", "end", iid=test["name"], values=(f"{test['name']}: {label}", "排队", "", "", "", "", ""))
+        compiles = len({tuple(RegressionRunner.compile_flags(test)) for test in tests})
+        dialog["run_button"].config(state=tk.DISABLED)
+        dialog["stop_button"].config(state=tk.NORMAL)
+        dialog["summary"].config(text=f"正在运行 {len(tests)} 个点 ({compiles} 次编译，最多 {self.sweep_runner.workers} 个同时运行)…")
+        self.output_log_widget.insert(tk.END, f"\n--- 参数扫描: {len(tests)} 个点，{compiles} 次编译，输出目录 {os.path.abspath(settings['dir'])} ---\n", "CMD")
+        self.sweep_runner.start(tests)
+        self.master.after(100, self._poll_sweep, self.sweep_runner)
+
+    def stop_sweep(self):
+        if self.sweep_runner:
+            self.sweep_runner.stop()
+
+    def _poll_sweep(self, runner):
+        if runner is not self.sweep_runner:
+            return
+        dialog = self._sweep_dialog if self._sweep_dialog and self._sweep_dialog["window"].winfo_exists() else None
 
-                # Simple check for keywords and apply tags
-                if "error" in line.lower():
-                    self.output_log_widget.insert(tk.END, line, "ERROR")
-                elif "warning" in line.lower():
-                    self.output_log_widget.insert(tk.END, line, "WARNING")
-                else:
-                    self.output_log_widget.insert(tk.END, line)
+        def seconds(value):
+            return "-" if value is None else f"{value:.2f}"
 
-                self.output_log_widget.see(tk.END) # 滚动到底部
-                self.output_log_widget.update_idletasks() # Use update_idletasks for better responsiveness
-                
-            process.wait() # 等待进程结束
-            
-            if process.returncode == 0:
-                self.output_log_widget.insert(tk.END, "\n--- 命令执行成功 ---\n")
-                return True
+        while True:
+            try:
+                kind, payload = runner.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "job":
+                if dialog and dialog["table"].exists(payload["name"]):
+                    row = payload["name"]
+                    dialog["table"].item(row, tags=(payload["status"],))
+                    metrics = " ".join(f"{name}={value}" for name, value in payload["metrics"].items())
+                    for column, value in (("status", payload["status"]), ("compile", seconds(payload["compile"])),
+                                          ("simulate", seconds(payload["simulate"])), ("wall", seconds(payload["wall"])),
+                                          ("metrics", metrics), ("message", payload["message"])):
+                        dialog["table"].set(row, column, value)
             else:
-                self.output_log_widget.insert(tk.END, f"\n--- 命令执行失败 (返回代码: {process.returncode}) ---\n")
-                return False
+                self._finish_sweep(payload, dialog)
+                return
+        self.master.after(100, self._poll_sweep, runner)
+
+    def _finish_sweep(self, results, dialog):
+        sweep, self._sweep, self.sweep_runner = self._sweep, None, None
+        if self.sweep_log:
+            self.sweep_log.close()
+        passed = sum(1 for result in results if result["status"] == "PASS")
+        summary = f"{passed}/{len(results)} 通过，用时 {time.perf_counter() - sweep['started']:.2f} s"
+        self.output_log_widget.insert(tk.END, f"--- 参数扫描结束: {summary} ---\n", "PASS" if passed == len(results) else "ERROR")
+        try:
+            csv_path, json_path = _write_sweep_results(sweep["dir"], sweep["top"], sweep["points"], results)
+            self.output_log_widget.insert(tk.END, f"结果表: {os.path.abspath(csv_path)}\n        {os.path.abspath(json_path)}\n")
+        except OSError as e:
+            self.output_log_widget.insert(tk.END, f"Warning: 无法写入扫描结果: {e}\n", "WARNING")
+        if self.sweep_log:
+            self.output_log_widget.insert(tk.END, f"合并日志: {self.sweep_log.path}\n")
+        self.output_log_widget.see(tk.END)
+        if dialog:
+            dialog["summary"].config(text=summary)
+            dialog["run_button"].config(state=tk.NORMAL)
+            dialog["stop_button"].config(state=tk.DISABLED)
 
-        except FileNotFoundError:
-            self.output_log_widget.insert(tk.END, f"错误: 命令 '{command_list[0]}' 未找到。请确保它已安装并位于系统PATH中。\n")
-            return False
-        except Exception as e:
-            self.output_log_widget.insert(tk.END, f"发生未知错误: {e}\n")
-            return False
+    FARM_WORKER_COLUMNS = ("host", "slots", "assigned", "running", "done", "failed")
 
-    def launch_gtkwave(self, gtkwave_path, vcd_file_path):
-        """启动GTKWave来查看VCD文件"""
-        if not os.path.exists(vcd_file_path):
-            self.output_log_widget.insert(tk.END, f"\n错误: VCD文件 '{vcd_file_path}' 不存在。请先进行仿真。\n")
+    def open_farm(self):
+        """Simulation farm window: the job server, local workers and the workers connected to it."""
+        if self._farm_dialog and self._farm_dialog["window"].winfo_exists():
+            self._farm_dialog["window"].lift()
             return
-
-        gtkw_file_path = self.gtkw_file_entry.get()
-        command = [gtkwave_path, vcd_file_path]
-
-        # 如果用户指定了 .gtkw 文件并且它存在，就添加到命令中
-        if gtkw_file_path and os.path.exists(gtkw_file_path):
-            self.output_log_widget.insert(tk.END, f"找到 GTKWave 配置文件: {gtkw_file_path}\n")
-            command.append(gtkw_file_path)
+        dialog = tk.Toplevel(self.master)
+        dialog.title("模拟农场")
+        dialog.geometry("800x400")
+
+        server_bar = ttk.Frame(dialog)
+        server_bar.pack(fill="x", padx=5, pady=5)
+        ttk.Label(server_bar, text="地址:").pack(side=tk.LEFT)
+        address_entry = ttk.Entry(server_bar, width=24)
+        address_entry.insert(0, self.farm_server.address if self.farm_server else self.editor_settings["farm_address"])
+        address_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(server_bar, text="Token:").pack(side=tk.LEFT)
+        token_entry = ttk.Entry(server_bar, width=16, show="*")
+        token_entry.insert(0, self.farm_server.token if self.farm_server else os.environ.get("DAEDALUS_FARM_TOKEN", ""))
+        token_entry.pack(side=tk.LEFT, padx=5)
+        server_button = ttk.Button(server_bar, command=lambda: self.stop_farm_server() if self.farm_server
+                                   else self.start_farm_server(address_entry.get().strip(), token_entry.get()))
+        server_button.pack(side=tk.LEFT, padx=5)
+
+        worker_bar = ttk.Frame(dialog)
+        worker_bar.pack(fill="x", padx=5)
+        ttk.Label(worker_bar, text="本地 worker 数:").pack(side=tk.LEFT)
+        count_box = ttk.Spinbox(worker_bar, from_=1, to=64, width=5)
+        count_box.set(2)
+        count_box.pack(side=tk.LEFT, padx=5)
+        local_button = ttk.Button(worker_bar, text="启动本地 worker", command=lambda: self.start_local_workers(count_box.get()))
+        local_button.pack(side=tk.LEFT)
+        ttk.Checkbutton(worker_bar, text="回归测试和参数扫描在模拟农场上运行", variable=self.use_farm).pack(side=tk.LEFT, padx=15)
+
+        headings = ("主机", "槽位", "已分配", "运行中", "完成", "失败")
+        table = ttk.Treeview(dialog, columns=self.FARM_WORKER_COLUMNS)
+        table.heading("#0", text="Worker")
+        table.column("#0", width=180)
+        for column, heading in zip(self.FARM_WORKER_COLUMNS, headings):
+            table.heading(column, text=heading)
+            table.column(column, width=120 if column == "host" else 70, anchor="w" if column == "host" else "e")
+        status_label = ttk.Label(dialog, text="")
+        status_label.pack(side=tk.BOTTOM, fill="x", padx=5, pady=5)
+        table.pack(fill="both", expand=True, padx=5, pady=5)
+
+        self._farm_dialog = {"window": dialog, "table": table, "status": status_label, "server_button": server_button,
+                             "local_button": local_button, "address_entry": address_entry, "token_entry": token_entry}
+        self._poll_farm()
+
+    def _poll_farm(self):
+        """Refreshes the farm window twice a second while it is open."""
+        dialog = self._farm_dialog
+        if not dialog or not dialog["window"].winfo_exists():
+            return
+        server = self.farm_server
+        running = server is not None
+        dialog["server_button"].config(text="停止服务器" if running else "启动服务器")
+        dialog["local_button"].config(state=tk.NORMAL if running else tk.DISABLED)
+        for entry in (dialog["address_entry"], dialog["token_entry"]):
+            entry.config(state=tk.DISABLED if running else tk.NORMAL)
+        workers = server.workers() if running else []
+        table = dialog["table"]
+        names = {worker["name"] for worker in workers}
+        table.delete(*[item for item in table.get_children() if item not in names])
+        for worker in workers:
+            values = tuple(worker[column] for column in self.FARM_WORKER_COLUMNS)
+            if table.exists(worker["name"]):
+                table.item(worker["name"], values=values)
+            else:
+                table.insert("", "end", iid=worker["name"], text=worker["name"], values=values)
+        if running:
+            dialog["status"].config(text=f"正在监听 {server.address} | {len(workers)} 个 worker，{sum(worker['slots'] for worker in workers)} 个槽位"
+                                         f" | 队列中 {server.queued} 个任务 | 远程 worker: python verilog_gui.py --worker {server.address}")
         else:
-            self.output_log_widget.insert(tk.END, "未找到 GTKWave 配置文件，将使用默认视图。\n")
+            dialog["status"].config(text="服务器未运行")
+        self.master.after(500, self._poll_farm)
 
-        self.output_log_widget.insert(tk.END, f"\n正在启动 GTKWave 加载 {vcd_file_path}...\n")
+    def start_farm_server(self, address, token):
+        server = FarmServer(address, token)
         try:
-            # 使用Popen启动一个独立的进程，我们的GUI不用等它
-            subprocess.Popen(command,
-                             creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-        except FileNotFoundError:
-            self.output_log_widget.insert(tk.END, f"\n错误: GTKWave 未在 '{gtkwave_path}' 找到。\n")
-        except Exception as e:
-            self.output_log_widget.insert(tk.END, f"\n启动 GTKWave 失败: {e}\n")
+            server.start()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"无法在 {address} 启动模拟农场服务器: {e}")
+            return
+        self.farm_server = server
+        self.output_log_widget.insert(tk.END, f"\n--- 模拟农场服务器正在监听 {address} ---\n", "CMD")
+
+    def stop_farm_server(self):
+        """Stops the farm server and the local workers started for it."""
+        for process in self.farm_processes:
+            if process.poll() is None:
+                process.terminate()
+        self.farm_processes = []
+        if self.farm_server:
+            self.farm_server.stop()
+            self.farm_server = None
+            self.use_farm.set(False)
+            self.output_log_widget.insert(tk.END, "\n--- 模拟农场服务器已停止 ---\n", "CMD")
+
+    def start_local_workers(self, count):
+        """Starts ``count`` worker processes on this machine, sharing its CPUs between them."""
+        try:
+            count = max(1, int(count))
+        except ValueError:
+            return
+        if not self.farm_server:
+            return
+        slots = max(1, (os.cpu_count() or 1) // count)
+        # A frozen build is its own interpreter
+        command = [sys.executable] if getattr(sys, "frozen", False) else [sys.executable, os.path.abspath(__file__)]
+        env = dict(os.environ, DAEDALUS_FARM_TOKEN=self.farm_server.token)
+        for index in range(count):
+            name = f"local-{len(self.farm_processes) + 1}"
+            try:
+                self.farm_processes.append(subprocess.Popen(
+                    command + ["--worker", self.farm_server.address, "--slots", str(slots), "--name", name],
+                    env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0))
+            except OSError as e:
+                messagebox.showerror("错误", f"无法启动本地 worker: {e}")
+                return
+        self.output_log_widget.insert(tk.END, f"已启动 {count} 个本地 worker，每个 {slots} 个槽位。\n")
 
     def clean_project(self):
         self.output_log_widget.delete('1.0', tk.END) # Clear previous log
@@ -416,26 +4855,66 @@ class VerilogGUI:
             self.file_listbox.selection_set(item_id)
             self.file_listbox.focus(item_id)
 
-    def compile_verilog(self):
+    def _compile_settings(self):
+        """Validates the compile inputs; returns ``(output_vvp, extra_flags)`` or None after reporting the problem."""
         if not self.tool_paths.get('iverilog'):
             messagebox.showerror("错误", "iverilog 未找到。请检查环境设置。")
-            return
+            return None
         if not self.verilog_files:
             messagebox.showerror("错误", "请选择至少一个 Verilog 源文件进行编译。")
-            return
+            return None
 
         output_vvp = self.vvp_output_entry.get()
         if not output_vvp:
             messagebox.showerror("错误", "请指定编译输出文件名 (.vvp)。")
-            return
+            return None
 
         extra_flags = []
         flags_str = self.iverilog_flags_entry.get()
         if flags_str:
             extra_flags = shlex.split(flags_str)
+        return output_vvp, extra_flags
 
+    def compile_verilog(self):
+        if self._pipeline_stage or self._command_running:
+            messagebox.showinfo("提示", "已有命令正在运行，请等待其结束。")
+            return
+        settings = self._compile_settings()
+        if not settings:
+            return
+        output_vvp, extra_flags = settings
+        self._pipeline_stage = "check" # Keeps Run and the other steps out until the inputs are checked
+
+        def checked(build_key, up_to_date):
+            self._end_pipeline()
+            self._compile(output_vvp, extra_flags, build_key, up_to_date, clear=False)
+        self._check_build_inputs(output_vvp, extra_flags, "", checked)
+
+    def _compile(self, output_vvp, extra_flags, build_key, up_to_date, on_done=None, clear=True):
+        """Runs iverilog unless the build cache already put an up-to-date output in place.
+        Returns False (and ``on_done`` is never called) if another command is still running."""
         compile_cmd = [self.tool_paths['iverilog'], '-o', output_vvp] + extra_flags + self.verilog_files
-        self.run_command(compile_cmd)
+        if up_to_date:
+            if clear:
+                self.output_log_widget.delete('1.0', tk.END)
+            self.output_log_widget.insert(tk.END, f"正在执行命令: {' '.join(compile_cmd)}\n\n", "CMD")
+            self.output_log_widget.insert(tk.END, f"--- {output_vvp} is up to date (输入未改变，已使用编译缓存) ---\n")
+            if on_done:
+                on_done(True)
+            return True
+
+        def compiled(success):
+            if success and build_key:
+                tool, sources, cache = self.tool_paths['iverilog'], list(self.verilog_files), self.build_cache
+
+                def store():
+                    # A source saved while iverilog ran may or may not be in the output; only cache a consistent one
+                    if cache.key(tool, sources, extra_flags, output_vvp) == build_key:
+                        cache.store(build_key, output_vvp)
+                threading.Thread(target=store, name="build-cache-store", daemon=True).start()
+            if on_done:
+                on_done(success)
+        return self.run_command(compile_cmd, on_done=compiled, clear=clear)
 
     def simulate_verilog(self):
         if not self.tool_paths.get('vvp'):
@@ -451,8 +4930,44 @@ class VerilogGUI:
         # We assume the testbench generates the VCD file named in vcd_output_entry
         # If the user's testbench doesn't generate this specific name, they need to adjust it
         # For simple cases, vvp simulation will implicitly create vcd if $dumpfile is used.
+        self._simulate(output_vvp)
+
+    def _simulation_stamp(self, output_vvp):
+        """What a simulation result depends on: the compiled design and the vvp executable."""
+        stamp = []
+        for path in (output_vvp, self.tool_paths['vvp']):
+            try:
+                st = os.stat(path)
+                stamp.append((os.path.abspath(path), st.st_mtime_ns, st.st_size))
+            except OSError:
+                return None
+        return tuple(stamp)
+
+    def _simulation_up_to_date(self, output_vvp, vcd_file):
+        """Whether ``vcd_file`` came from simulating the current ``output_vvp``.
+        Without a record from this session, a waveform newer than the design counts (make semantics)."""
+        stamp = self._simulation_stamp(output_vvp)
+        try:
+            vcd_mtime = os.stat(vcd_file).st_mtime_ns
+        except OSError:
+            return False
+        recorded = self._simulated.get(os.path.abspath(vcd_file))
+        if recorded is not None:
+            return stamp is not None and recorded == stamp
+        return stamp is not None and vcd_mtime >= stamp[0][1]
+
+    def _simulate(self, output_vvp, on_done=None, clear=True):
+        """Runs vvp; returns False (and ``on_done`` is never called) if another command is still running."""
+        stamp = self._simulation_stamp(output_vvp)
+        vcd_file = self.vcd_output_entry.get()
+
+        def simulated(success):
+            if success and vcd_file and os.path.exists(vcd_file):
+                self._simulated[os.path.abspath(vcd_file)] = stamp
+            if on_done:
+                on_done(success)
         simulate_cmd = [self.tool_paths['vvp'], output_vvp]
-        self.run_command(simulate_cmd)
+        return self.run_command(simulate_cmd, on_done=simulated, clear=clear)
 
     def view_waveform(self):
         if not self.tool_paths.get('gtkwave'):
@@ -478,13 +4993,20 @@ class VerilogGUI:
                 data = json.load(f)
             
             self.project_path = project_file
-            self.verilog_files = data.get('verilog_files', [])
+            self.verilog_files = data.get('source_files', data.get('verilog_files', []))
+            self._open_symbol_index(SymbolIndex.path_for_project(project_file))
             self.vvp_output_entry.delete(0, tk.END)
-            self.vvp_output_entry.insert(0, data.get('vvp_output', "design.vvp"))
+            self.vvp_output_entry.insert(0, data.get('output_vvp', data.get('vvp_output', "design.vvp")))
             self.vcd_output_entry.delete(0, tk.END)
-            self.vcd_output_entry.insert(0, data.get('vcd_output', "wave.vcd"))
+            self.vcd_output_entry.insert(0, data.get('output_vcd', data.get('vcd_output', "wave.vcd")))
             self.gtkw_file_entry.delete(0, tk.END)
             self.gtkw_file_entry.insert(0, data.get('gtkw_file', "wave.gtkw"))
+            self.run_timeout_entry.delete(0, tk.END)
+            self.run_timeout_entry.insert(0, data.get('run_timeout', ""))
+            self.regression_tests = data.get('regression_tests', [])
+            self.regression_dir = data.get('regression_dir', "regression")
+            self.sweep_settings = {"top": "", "mode": "grid", "spec": "", "dir": "sweep", **data.get('sweep', {})}
+            self._load_run_history()
 
             # Clear and repopulate Treeview
             for item in self.file_listbox.get_children():
@@ -509,12 +5031,21 @@ class VerilogGUI:
                 "source_files": self.verilog_files,
                 "output_vvp": self.vvp_output_entry.get(),
                 "output_vcd": self.vcd_output_entry.get(),
-                "gtkw_file": self.gtkw_file_entry.get()
+                "gtkw_file": self.gtkw_file_entry.get(),
+                "run_timeout": self.run_timeout_entry.get(),
+                "regression_tests": self.regression_tests,
+                "regression_dir": self.regression_dir,
+                "sweep": self.sweep_settings
             }
             try:
                 with open(project_file, 'w', encoding='utf-8') as f:
                     json.dump(project_data, f, indent=2)
+                if self._run_history_path(project_file) != self._run_history_path():
+                    # The history goes along with the project
+                    with open(self._run_history_path(project_file), "w", encoding="utf-8") as f:
+                        f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.run_history)
                 self.project_path = project_file
+                self.symbol_index.save_as(SymbolIndex.path_for_project(project_file))
                 self.output_log_widget.insert(tk.END, f"\n项目保存成功到: {os.path.basename(project_file)}\n")
             except Exception as e:
                 messagebox.showerror("错误", f"保存项目失败: {e}")
@@ -532,10 +5063,29 @@ class VerilogGUI:
         self.vcd_output_entry.insert(0, "wave.vcd")
         self.gtkw_file_entry.delete(0, tk.END)
         self.gtkw_file_entry.insert(0, "wave.gtkw")
+        self.run_timeout_entry.delete(0, tk.END)
+        self.regression_tests = []
+        self.regression_dir = "regression"
+        self.sweep_settings = {"top": "", "mode": "grid", "spec": "", "dir": "sweep"}
         self.project_path = ""
+        self.run_history = []
+        self._open_symbol_index(":memory:")
+        self._build_hierarchy_viewer()
         self.output_log_widget.insert(tk.END, "\n--- 新项目已创建，所有设置已清空 ---\n")
         messagebox.showinfo("新建项目", "新项目已成功创建。")
 
+    def _open_symbol_index(self, path):
+        """Switches the parse cache to the symbol index at ``path`` (":memory:" for an unsaved project)."""
+        self.hierarchy_parser.generation += 1 # A running parse must not write into the old index
+        old_index = self.symbol_index
+        try:
+            self.symbol_index = SymbolIndex(path)
+        except (sqlite3.Error, OSError) as e:
+            self.output_log_widget.insert(tk.END, f"Warning: 无法打开符号索引 {path}: {e}，将使用内存索引。\n", "WARNING")
+            self.symbol_index = SymbolIndex()
+        self.parse_cache.attach(self.symbol_index)
+        old_index.close()
+
     def load_window_state(self):
         """从配置文件加载窗口大小和位置"""
         if os.path.exists(self.config_file_path):
@@ -545,6 +5095,7 @@ class VerilogGUI:
                 geometry = config.get('geometry')
                 if geometry:
                     self.master.geometry(geometry)
+                self.editor_settings.update(config.get('editor', {}))
             except Exception as e:
                 print(f"加载窗口状态失败: {e}")
                 # Fallback to default if loading fails
@@ -556,7 +5107,9 @@ class VerilogGUI:
     def save_window_state(self):
         """保存当前窗口的大小和位置到配置文件"""
         geometry = self.master.geometry()
-        config = {'geometry': geometry}
+        # Only what differs from the defaults, so changed defaults still reach existing configs
+        editor = {key: value for key, value in self.editor_settings.items() if DEFAULT_EDITOR_SETTINGS.get(key) != value}
+        config = {'geometry': geometry, 'editor': editor}
         try:
             with open(self.config_file_path, 'w') as f:
                 json.dump(config, f)
@@ -586,6 +5139,14 @@ class VerilogGUI:
 
         # If user chose "No", we just proceed to close.
         self.save_window_state()
+        self.command_runner.stop()
+        for runner in (self.regression_runner, self.sweep_runner):
+            if runner:
+                runner.stop()
+        self.stop_farm_server()
+        self.file_watcher.stop()
+        self.hierarchy_parser.shutdown()
+        self.symbol_index.close()
         self.master.destroy()
 
     def open_file_in_editor(self, event):
@@ -628,84 +5189,161 @@ class VerilogGUI:
         text_line_frame = ttk.Frame(editor_frame)
         text_line_frame.pack(expand=True, fill="both")
         
-        self.linenumbers = tk.Canvas(text_line_frame, width=30, background="#f0f0f0", highlightthickness=0)
-        self.linenumbers.pack(side=tk.LEFT, fill="y")
+        linenumbers = tk.Canvas(text_line_frame, width=30, background="#f0f0f0", highlightthickness=0)
+        linenumbers.pack(side=tk.LEFT, fill="y")
 
         text_widget = scrolledtext.ScrolledText(text_line_frame, wrap=tk.WORD, undo=True)
         text_widget.pack(side=tk.LEFT, expand=True, fill="both")
+        self.gutters[text_widget] = LineNumberGutter(linenumbers, text_widget)
 
         # Configure Pygments related tags
         for token_type, style_config in self.pygments_tag_styles.items():
             text_widget.tag_config(style_config["tag"], **{k: v for k, v in style_config.items() if k != "tag"})
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            text_widget.insert(tk.END, content)
-            text_widget.edit_modified(False) # Reset modified flag after loading
-            self._apply_syntax_highlighting(text_widget) # Apply initial highlighting
-            self._update_line_numbers(text_widget, self.linenumbers) # Initial line number update
+            file_size = os.path.getsize(file_path)
+            if file_size >= self.editor_settings["large_file_mb"] * 1024 * 1024:
+                # Large file: stream it in from a memory map and only ever highlight what is on screen
+                self.highlight_states[text_widget] = EditorHighlightState(
+                    IncrementalHighlighter(VerilogLexer(), self._tag_for_token), text_widget, viewport_only=True)
+                self._start_large_file_load(editor_frame, text_widget, file_path, file_size)
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                text_widget.insert(tk.END, content)
+                text_widget.edit_reset() # Loading the file is not an undoable edit
+                text_widget.edit_modified(False) # Reset modified flag after loading
+                self._apply_syntax_highlighting(text_widget, debounce=False) # Apply initial highlighting
+            self._update_line_numbers(text_widget) # Initial line number update
             self._check_editor_modified_status(text_widget, file_path) # Initial status check
         except Exception as e:
             messagebox.showerror("错误", f"无法打开文件 {os.path.basename(file_path)}: {e}")
+            self.gutters.pop(text_widget, None)
             editor_frame.destroy() # Clean up the frame if opening fails
             return None # Indicate failure
 
         # Bind key release event for real-time highlighting and line numbers
-        text_widget.bind("<KeyRelease>", lambda event, tw=text_widget, ln=self.linenumbers, fp=file_path: self._handle_editor_content_change(event, tw, ln, fp))
-        text_widget.bind("<Configure>", lambda event, tw=text_widget, ln=self.linenumbers, fp=file_path: self._update_line_numbers(tw, ln)) # Configure also updates line numbers
-        text_widget.bind("<MouseWheel>", lambda event, tw=text_widget, ln=self.linenumbers, fp=file_path: self._update_line_numbers(tw, ln))
-        text_widget.bind("<Button-4>", lambda event, tw=text_widget, ln=self.linenumbers, fp=file_path: self._update_line_numbers(tw, ln)) # For Linux scroll up
-        text_widget.bind("<Button-5>", lambda event, tw=text_widget, ln=self.linenumbers, fp=file_path: self._update_line_numbers(tw, ln)) # For Linux scroll down
+        text_widget.bind("<KeyRelease>", lambda event, tw=text_widget, fp=file_path: self._handle_editor_content_change(event, tw, fp))
+        text_widget.bind("<Configure>", lambda event, tw=text_widget: self._update_line_numbers(tw)) # Configure also updates line numbers
         text_widget.bind("<<Modified>>", lambda event, tw=text_widget, fp=file_path: self._check_editor_modified_status(tw, fp)) # Bind to the <<Modified>> event
+        text_widget.bind("<F12>", lambda event, tw=text_widget: self.go_to_definition(tw) or "break")
+        text_widget.bind("<Shift-F12>", lambda event, tw=text_widget: self.find_references(tw) or "break")
 
-        # Link text widget scroll to line numbers scroll
-        text_widget.config(yscrollcommand=lambda *args: self._on_text_scroll(text_widget, self.linenumbers, *args))
+        # Link text widget scroll to line numbers scroll. This fires after every view
+        # change (wheel, scrollbar, keyboard), so no separate wheel bindings are needed.
+        text_widget.config(yscrollcommand=lambda *args: self._on_text_scroll(text_widget, *args))
 
         # Create a context menu for the editor
         context_menu = tk.Menu(text_widget, tearoff=0)
-        context_menu.add_command(label="剪切", command=lambda: text_widget.event_generate("<<Cut>>"))
+
+        def edit(virtual_event):
+            # No <KeyRelease> follows a menu command, so the change is reported here
+            text_widget.event_generate(virtual_event)
+            self._handle_editor_content_change(None, text_widget, self._editor_file_path(text_widget))
+        context_menu.add_command(label="剪切", command=lambda: edit("<<Cut>>"))
         context_menu.add_command(label="复制", command=lambda: text_widget.event_generate("<<Copy>>"))
-        context_menu.add_command(label="粘贴", command=lambda: text_widget.event_generate("<<Paste>>"))
+        context_menu.add_command(label="粘贴", command=lambda: edit("<<Paste>>"))
         context_menu.add_separator()
         context_menu.add_command(label="全选", command=lambda: text_widget.event_generate("<<SelectAll>>"))
+        context_menu.add_separator()
+        context_menu.add_command(label="转到定义", accelerator="F12", command=lambda: self.go_to_definition(text_widget))
+        context_menu.add_command(label="查找引用", accelerator="Shift+F12", command=lambda: self.find_references(text_widget))
         context_menu.add_separator() # Add separator before Close Tab
         context_menu.add_command(label="关闭当前标签页", command=lambda: self.close_tab_by_widget(text_widget)) # Add close tab to context menu
 
         def show_context_menu(event):
+            text_widget.mark_set(tk.INSERT, f"@{event.x},{event.y}") # Symbol actions act on the clicked word
             context_menu.tk_popup(event.x_root, event.y_root)
 
         text_widget.bind("<Button-3>", show_context_menu) # Bind right-click
 
         return editor_frame, text_widget # Return both the frame and the text widget
 
-    def _handle_editor_content_change(self, event, text_widget, linenumbers_canvas, file_path):
+    def _start_large_file_load(self, editor_frame, text_widget, file_path, file_size):
+        """Feeds a memory-mapped file into the editor in chunks, one per event-loop slice.
+
+        Only one chunk is ever decoded at a time and undo is off while loading,
+        so peak memory stays close to what the text widget itself holds.
+        """
+        progress_frame = ttk.Frame(editor_frame)
+        progress_frame.pack(side=tk.BOTTOM, fill="x")
+        progress_label = ttk.Label(progress_frame, text=f"正在加载 {os.path.basename(file_path)}...")
+        progress_label.pack(side=tk.LEFT, padx=5)
+        progress_bar = ttk.Progressbar(progress_frame, maximum=file_size, mode="determinate")
+        progress_bar.pack(side=tk.LEFT, fill="x", expand=True, padx=5, pady=2)
+
+        f = open(file_path, 'rb')
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if file_size else b""
+        except Exception:
+            f.close()
+            raise
+        text_widget.config(undo=False, state=tk.DISABLED) # Read-only until fully loaded
+        self.loading_editors.add(text_widget)
+        chunk_size = self.editor_settings["large_file_chunk_kb"] * 1024
+
+        def finish(error=None, closed=False):
+            self.loading_editors.discard(text_widget)
+            if file_size:
+                mapped.close()
+            f.close()
+            if closed:
+                return
+            progress_frame.destroy()
+            text_widget.config(undo=True, state=tk.NORMAL)
+            text_widget.edit_reset()
+            text_widget.edit_modified(False)
+            if error is not None:
+                messagebox.showerror("错误", f"无法打开文件 {os.path.basename(file_path)}: {error}")
+                self.close_tab_by_widget(text_widget)
+                return
+            self._check_editor_modified_status(text_widget, file_path)
+            self.output_log_widget.insert(tk.END, f"\n大文件已加载 (仅高亮可见区域): {os.path.basename(file_path)}\n")
+
+        def load_chunk(position=0):
+            if text_widget not in self.gutters: # Tab closed while loading
+                finish(closed=True)
+                return
+            try:
+                # Cut chunks at newlines so no UTF-8 sequence is ever split
+                end = mapped.find(b"\n", min(position + chunk_size, file_size))
+                end = file_size if end == -1 else end + 1
+                chunk = mapped[position:end].decode('utf-8')
+                text_widget.config(state=tk.NORMAL)
+                text_widget.insert(tk.END, chunk)
+                text_widget.config(state=tk.DISABLED)
+                text_widget.edit_modified(False) # A partly loaded buffer must never look unsaved
+            except Exception as e:
+                finish(e)
+                return
+            progress_bar["value"] = end
+            progress_label.config(text=f"正在加载 {os.path.basename(file_path)}... {end * 100 // max(file_size, 1)}%")
+            if end == 0 or end >= file_size:
+                finish()
+            else:
+                text_widget.after(1, load_chunk, end)
+            if position == 0:
+                self._highlight_viewport(text_widget, force=True)
+
+        text_widget.after(1, load_chunk)
+
+    def _handle_editor_content_change(self, event, text_widget, file_path):
         # Call syntax highlighting
         self._apply_syntax_highlighting(text_widget)
-        # Call line number update
-        self._update_line_numbers(text_widget, linenumbers_canvas)
+        # Call line number update; edits can re-wrap lines without moving the view
+        self._update_line_numbers(text_widget, force=True)
         # Call modified status check
         self._check_editor_modified_status(text_widget, file_path)
 
-    def _on_text_scroll(self, text_widget, linenumbers_canvas, *args):
-        text_widget.yview(*args) # Apply scroll to text widget
-        self._update_line_numbers(text_widget, linenumbers_canvas) # Update line numbers
-
-    def _update_line_numbers(self, text_widget, linenumbers_canvas):
-        linenumbers_canvas.delete("all")
-
-        # Get the first visible line number
-        first_visible_line = int(text_widget.index("@0,0").split(".")[0])
-        # Get the last visible line number by checking the yview
-        last_visible_line = int(text_widget.index(f"@0,{linenumbers_canvas.winfo_height()}").split(".")[0]) + 1 # +1 to ensure last line is checked
+    def _on_text_scroll(self, text_widget, *args):
+        text_widget.vbar.set(*args) # Keep the ScrolledText scrollbar in sync (this replaces its yscrollcommand)
+        self._update_line_numbers(text_widget) # Update line numbers
+        self._highlight_viewport(text_widget) # Colour newly exposed lines of lazily highlighted files
 
-        for line_number in range(first_visible_line, last_visible_line):
-            dline = text_widget.dlineinfo(f"{line_number}.0")
-            if dline is None: # Line is not visible or doesn't exist
-                continue
-            
-            y = dline[1] # Y-coordinate of the line
-            linenumbers_canvas.create_text(2, y, anchor="nw", text=str(line_number), fill="gray")
+    def _update_line_numbers(self, text_widget, force=False):
+        gutter = self.gutters.get(text_widget)
+        if gutter:
+            gutter.redraw(force)
 
     def _check_editor_modified_status(self, text_widget, file_path):
         is_modified = text_widget.edit_modified()
@@ -725,31 +5363,96 @@ class VerilogGUI:
             if current_tab_text != expected_tab_text:
                 self.notebook.tab(tab_index, text=expected_tab_text)
 
-    def _apply_syntax_highlighting(self, text_widget):
-        # Clear all existing tags
-        for tag_name in text_widget.tag_names():
-            if tag_name not in ("sel", "error", "warning", "cmd", "match"): # Exclude built-in selection and my log/find tags
-                text_widget.tag_remove(tag_name, "1.0", tk.END)
-
-        content = text_widget.get("1.0", tk.END + "-1c") # Get all text, excluding the final newline
-        lexer = VerilogLexer() # Initialize Verilog Lexer
-
-        offset = 0
-        for token_type, value in lexer.get_tokens_unprocessed(content):
-            tag_config = self.pygments_tag_styles.get(token_type)
-            # Try to find a more general tag if specific one not found
-            if not tag_config:
-                # Walk up the token hierarchy to find a matching tag
-                current_type = token_type
-                while current_type.parent and not tag_config:
-                    current_type = current_type.parent
-                    tag_config = self.pygments_tag_styles.get(current_type)
-            
-            if tag_config: # Apply tag if found
-                start_index = text_widget.index(f"1.0 + {offset}c")
-                end_index = text_widget.index(f"1.0 + {offset + len(value)}c")
-                text_widget.tag_add(tag_config["tag"], start_index, end_index)
-            offset += len(value)
+    def _tag_for_token(self, token_type):
+        """Returns the tag name for a Pygments token type, or None if it is not styled."""
+        if token_type in self._token_tags:
+            return self._token_tags[token_type]
+        tag_config = self.pygments_tag_styles.get(token_type)
+        # Walk up the token hierarchy to find a matching tag
+        current_type = token_type
+        while current_type.parent and not tag_config:
+            current_type = current_type.parent
+            tag_config = self.pygments_tag_styles.get(current_type)
+        tag = tag_config["tag"] if tag_config else None
+        self._token_tags[token_type] = tag
+        return tag
+
+    def _apply_syntax_highlighting(self, text_widget, debounce=True):
+        """Requests highlighting of the editor's current contents.
+
+        Bursts of calls are coalesced over the debounce window, then the buffer
+        is snapshotted and lexed on the highlight worker thread;
+        _drain_highlight_results applies the resulting tags on the Tk thread.
+        """
+        state = self.highlight_states.get(text_widget)
+        if state is None:
+            state = EditorHighlightState(IncrementalHighlighter(VerilogLexer(), self._tag_for_token), text_widget)
+            self.highlight_states[text_widget] = state
+        state.generation += 1 # Results for older snapshots are stale from now on
+        if state.debounce_job:
+            text_widget.after_cancel(state.debounce_job)
+        delay = self.editor_settings["highlight_debounce_ms"] if debounce else 0
+        state.debounce_job = text_widget.after(delay, self._submit_highlight, state)
+
+    def _submit_highlight(self, state):
+        state.debounce_job = None
+        if state.viewport_only:
+            self._highlight_viewport(state.text_widget, force=True)
+            return
+        content = state.text_widget.get("1.0", tk.END + "-1c") # Get all text, excluding the final newline
+        # Large file: colour what is on screen first, lex the rest in background slices
+        lazy = content.count("\n") >= self.editor_settings["lazy_highlight_lines"]
+        self.highlight_worker.submit(state, "update", (state.generation, content, lazy))
+        if not state.done:
+            self._highlight_viewport(state.text_widget, force=True) # Edited lines may lie past the lexed frontier
+        self._poll_highlight_results()
+
+    def _highlight_viewport(self, text_widget, force=False):
+        """In lazy mode, colours the visible lines plus a margin ahead of the sequential pass."""
+        state = self.highlight_states.get(text_widget)
+        if state is None or state.done:
+            return
+        # Same visible-range logic as _update_line_numbers
+        first_visible_line = int(text_widget.index("@0,0").split(".")[0])
+        last_visible_line = int(text_widget.index(f"@0,{text_widget.winfo_height()}").split(".")[0])
+        margin = self.editor_settings["highlight_margin_lines"]
+        if state.viewport_only:
+            first_line, last_line = max(first_visible_line - margin, 1), last_visible_line + margin
+            covered = state.viewport_lines
+            if not force and covered and covered[0] <= first_visible_line and last_visible_line <= covered[1]:
+                return
+            state.viewport_lines = (first_line, last_line)
+            snippet = text_widget.get(f"{first_line}.0", f"{last_line}.end")
+            self.highlight_worker.submit(state, "snippet", (state.generation, first_line, snippet))
+            self._poll_highlight_results()
+            return
+        self.highlight_worker.submit(state, "provisional", (max(first_visible_line - 1 - margin, 0), last_visible_line - 1 + margin, force))
+        self._poll_highlight_results()
+
+    def _poll_highlight_results(self):
+        if self._highlight_poll_job is None:
+            self._highlight_poll_job = self.master.after(15, self._drain_highlight_results)
+
+    def _drain_highlight_results(self):
+        """Applies finished highlight payloads whose snapshot is still current."""
+        self._highlight_poll_job = None
+        deadline = time.perf_counter() + 0.03 # Leave the event loop room between big payloads
+        while time.perf_counter() < deadline:
+            try:
+                state, generation, seq, payload = self.highlight_worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if state.closed or generation != state.generation:
+                continue # Typed since the snapshot: the worker re-lexes these ranges with the next one
+            text_widget = state.text_widget
+            for start_index, end_index, ranges in payload:
+                for tag_name in self._highlight_tags:
+                    text_widget.tag_remove(tag_name, start_index, end_index)
+                for tag_name, indices in ranges.items():
+                    text_widget.tag_add(tag_name, *indices)
+            state.acked.add(seq)
+        if self.highlight_worker.busy:
+            self._poll_highlight_results()
 
     def find_text(self):
         current_text_widget = self._get_current_editor_widget()
@@ -814,67 +5517,101 @@ class VerilogGUI:
         replace_entry = ttk.Entry(replace_dialog, width=30)
         replace_entry.grid(row=1, column=1, padx=5, pady=5)
 
-        def find_next_occurrence_replace():
+        options_frame = ttk.Frame(replace_dialog)
+        options_frame.grid(row=2, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+        regex_var = tk.BooleanVar(value=False)
+        whole_word_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="正则表达式", variable=regex_var).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text="全词匹配", variable=whole_word_var).pack(side=tk.LEFT, padx=(10, 0))
+
+        def compile_pattern():
             search_term = search_entry.get()
-            if not search_term: return
+            if not search_term: return None
+            try:
+                return _compile_search_pattern(search_term, regex_var.get(), whole_word_var.get())
+            except re.error as e:
+                messagebox.showerror("正则表达式错误", f"无效的正则表达式: {e}", parent=replace_dialog)
+                return None
+
+        def find_next_occurrence_replace():
+            pattern = compile_pattern()
+            if not pattern: return
 
             # Clear previous highlights
             current_text_widget.tag_remove("match", "1.0", tk.END)
 
-            start_pos = current_text_widget.search(search_term, current_text_widget.index(tk.INSERT), stopindex=tk.END, nocase=True)
+            content = current_text_widget.get("1.0", "end-1c")
+            match = pattern.search(content, len(current_text_widget.get("1.0", tk.INSERT)))
+            if match and match.start() == match.end() and match.end() < len(content):
+                match = pattern.search(content, match.end() + 1) # Step over empty matches so the search advances
             
-            if start_pos:
-                end_pos = f"{start_pos}+{len(search_term)}c"
+            if match and match.start() != match.end():
+                start_pos = current_text_widget.index(f"1.0+{match.start()}c")
+                end_pos = current_text_widget.index(f"1.0+{match.end()}c")
                 current_text_widget.tag_add("match", start_pos, end_pos)
                 current_text_widget.tag_config("match", background="yellow", foreground="black")
                 current_text_widget.see(start_pos)
                 current_text_widget.mark_set(tk.INSERT, end_pos) # Move cursor to end of found text
             else:
-                messagebox.showinfo("查找", f"未找到 \"{search_term}\"。")
+                messagebox.showinfo("查找", f"未找到 \"{search_entry.get()}\"。")
                 current_text_widget.mark_set(tk.INSERT, "1.0") # Reset search to beginning
         
         def replace_current_occurrence():
-            search_term = search_entry.get()
-            replace_term = replace_entry.get()
-            if not search_term: return
+            pattern = compile_pattern()
+            if not pattern: return
             
             # Check if there's an active selection from find_next_occurrence_replace
             current_selection = current_text_widget.tag_ranges("match")
             if current_selection:
-                # If there's a selection, replace it
-                start = current_selection[0]
+                # If there's a selection, replace it (expanding group references in regex mode)
+                start = current_text_widget.index(current_selection[0])
                 end = current_selection[1]
+                found = current_text_widget.get(start, end)
+                match = pattern.fullmatch(found)
+                replace_term = replace_entry.get()
+                if match and regex_var.get():
+                    try:
+                        replace_term = match.expand(replace_term)
+                    except (re.error, IndexError) as e:
+                        messagebox.showerror("正则表达式错误", f"无效的替换模板: {e}", parent=replace_dialog)
+                        return
                 current_text_widget.delete(start, end)
                 current_text_widget.insert(start, replace_term)
                 current_text_widget.tag_remove("match", "1.0", tk.END) # Clear highlight after replace
                 current_text_widget.mark_set(tk.INSERT, f"{start}+{len(replace_term)}c")
+                self._handle_editor_content_change(None, current_text_widget, self._editor_file_path(current_text_widget))
                 find_next_occurrence_replace() # Find next after replacing
             else:
                 # If no active selection, just find the next one
                 find_next_occurrence_replace()
 
         def replace_all_occurrences():
-            search_term = search_entry.get()
-            replace_term = replace_entry.get()
-            if not search_term: return
+            pattern = compile_pattern()
+            if not pattern: return
+            if current_text_widget in self.loading_editors:
+                messagebox.showinfo("提示", "文件仍在加载中，请稍后再替换。", parent=replace_dialog)
+                return
 
+            started = time.perf_counter()
             current_text_widget.tag_remove("match", "1.0", tk.END) # Clear all highlights
 
-            # Start search from beginning of document
-            start_pos = "1.0"
-            count = 0
-            while True:
-                start_pos = current_text_widget.search(search_term, start_pos, stopindex=tk.END, nocase=True)
-                if not start_pos: break
+            # One pass over a snapshot of the buffer; only the span between the first
+            # and last match is written back, as a single edit and a single undo step.
+            content = current_text_widget.get("1.0", "end-1c")
+            try:
+                result = _replace_all(content, pattern, replace_entry.get(), regex_var.get())
+            except (re.error, IndexError) as e:
+                messagebox.showerror("正则表达式错误", f"无效的替换模板: {e}", parent=replace_dialog)
+                return
+            if not result:
+                messagebox.showinfo("替换完成", f"未找到 \"{search_entry.get()}\"。", parent=replace_dialog)
+                return
+            count, start, end, new_text = result
+            self._apply_replacement(current_text_widget, start, end, new_text)
+            current_text_widget.see(tk.INSERT)
 
-                end_pos = f"{start_pos}+{len(search_term)}c"
-                current_text_widget.delete(start_pos, end_pos)
-                current_text_widget.insert(start_pos, replace_term)
-                
-                # Move search start past the newly inserted text to avoid infinite loop
-                start_pos = current_text_widget.index(f"{start_pos}+{len(replace_term)}c")
-                count += 1
-            messagebox.showinfo("替换完成", f"已替换 {count} 处。")
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            messagebox.showinfo("替换完成", f"已替换 {count} 处，用时 {elapsed_ms:.0f} 毫秒。", parent=replace_dialog)
 
         ttk.Button(replace_dialog, text="查找下一个", command=find_next_occurrence_replace).grid(row=0, column=2, padx=5, pady=5)
         ttk.Button(replace_dialog, text="替换", command=replace_current_occurrence).grid(row=1, column=2, padx=5, pady=5)
@@ -883,6 +5620,262 @@ class VerilogGUI:
         replace_dialog.protocol("WM_DELETE_WINDOW", replace_dialog.destroy)
         self.master.wait_window(replace_dialog)
 
+    def open_project_search(self):
+        """Shows the project search tab, creating it on first use."""
+        if self.search_frame is None:
+            self._create_project_search_widgets()
+        self.notebook.select(self.search_frame)
+        self.project_search_entry.focus_set()
+
+    def _create_project_search_widgets(self):
+        self.search_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.search_frame, text="项目搜索")
+
+        form = ttk.Frame(self.search_frame)
+        form.pack(fill="x", padx=5, pady=5)
+        ttk.Label(form, text="查找内容:").grid(row=0, column=0, sticky="w", padx=5, pady=2)
+        self.project_search_entry = ttk.Entry(form)
+        self.project_search_entry.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        self.project_search_entry.bind("<Return>", lambda event: self.run_project_search())
+        ttk.Button(form, text="搜索", command=self.run_project_search).grid(row=0, column=2, padx=5, pady=2)
+        ttk.Label(form, text="替换为:").grid(row=1, column=0, sticky="w", padx=5, pady=2)
+        self.project_replace_entry = ttk.Entry(form)
+        self.project_replace_entry.grid(row=1, column=1, sticky="ew", padx=5, pady=2)
+        ttk.Button(form, text="全部替换", command=self.run_project_replace).grid(row=1, column=2, padx=5, pady=2)
+        form.grid_columnconfigure(1, weight=1)
+
+        options_frame = ttk.Frame(self.search_frame)
+        options_frame.pack(fill="x", padx=10)
+        self.project_regex_var = tk.BooleanVar(value=False)
+        self.project_whole_word_var = tk.BooleanVar(value=False)
+        self.project_match_case_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="正则表达式", variable=self.project_regex_var).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text="全词匹配", variable=self.project_whole_word_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Checkbutton(options_frame, text="区分大小写", variable=self.project_match_case_var).pack(side=tk.LEFT, padx=(10, 0))
+        self.project_search_status = ttk.Label(options_frame, text="")
+        self.project_search_status.pack(side=tk.RIGHT)
+
+        results_frame = ttk.Frame(self.search_frame)
+        results_frame.pack(fill="both", expand=True, padx=5, pady=5)
+        self.search_results_tree = ttk.Treeview(results_frame, columns=("Line", "Text"), show="tree headings")
+        self.search_results_tree.heading("#0", text="文件")
+        self.search_results_tree.heading("Line", text="行")
+        self.search_results_tree.heading("Text", text="内容")
+        self.search_results_tree.column("Line", width=60, stretch=False, anchor="e")
+        v_scrollbar = ttk.Scrollbar(results_frame, orient="vertical", command=self.search_results_tree.yview)
+        self.search_results_tree.configure(yscrollcommand=v_scrollbar.set)
+        v_scrollbar.pack(side=tk.RIGHT, fill="y")
+        self.search_results_tree.pack(side=tk.LEFT, expand=True, fill="both")
+        self.search_results_tree.bind("<<TreeviewSelect>>", self._on_search_result_select)
+
+    def _project_search_pattern(self):
+        search_term = self.project_search_entry.get()
+        if not search_term:
+            return None
+        try:
+            return _compile_search_pattern(search_term, self.project_regex_var.get(), self.project_whole_word_var.get(),
+                                           ignore_case=not self.project_match_case_var.get())
+        except re.error as e:
+            messagebox.showerror("正则表达式错误", f"无效的正则表达式: {e}")
+            return None
+
+    def run_project_search(self):
+        """Searches every project file in parallel; matches stream into the results tree."""
+        pattern = self._project_search_pattern()
+        if not pattern:
+            return
+        if not self.verilog_files:
+            messagebox.showinfo("提示", "项目中没有Verilog文件。")
+            return
+        # Open editors are searched as shown, including unsaved edits
+        buffers = {path: text_widget.get("1.0", "end-1c") for path, (_, text_widget) in self.open_editors.items()
+                   if path in self.verilog_files and text_widget not in self.loading_editors}
+        self.search_results_tree.delete(*self.search_results_tree.get_children())
+        generation = self.project_search.search(list(self.verilog_files), pattern, buffers)
+        self._start_project_search_poll("search", generation, len(self.verilog_files))
+
+    def run_project_replace(self):
+        """Replaces in every project file; files open in an editor are changed in the buffer, not on disk."""
+        pattern = self._project_search_pattern()
+        if not pattern:
+            return
+        if not self.verilog_files:
+            messagebox.showinfo("提示", "项目中没有Verilog文件。")
+            return
+        if not messagebox.askyesno("全部替换", f"将在项目的 {len(self.verilog_files)} 个文件中替换 \"{self.project_search_entry.get()}\"，"
+                                               "未打开的文件会直接写回磁盘。是否继续？"):
+            return
+
+        replace_term = self.project_replace_entry.get()
+        use_regex = self.project_regex_var.get()
+        self.search_results_tree.delete(*self.search_results_tree.get_children())
+        self._search_started = time.perf_counter()
+        self._search_totals = [0, 0] # [replacements, files changed]
+        disk_files = []
+        for file_path in self.verilog_files:
+            text_widget = self.open_editors.get(file_path, (None, None))[1]
+            if text_widget is None:
+                disk_files.append(file_path)
+                continue
+            if text_widget in self.loading_editors:
+                self.output_log_widget.insert(tk.END, f"Warning: {os.path.basename(file_path)} 仍在加载中，已跳过。\n", "WARNING")
+                continue
+            try:
+                result = _replace_all(text_widget.get("1.0", "end-1c"), pattern, replace_term, use_regex)
+            except (re.error, IndexError) as e:
+                messagebox.showerror("正则表达式错误", f"无效的替换模板: {e}")
+                return
+            if result:
+                self._apply_replacement(text_widget, *result[1:])
+                self._add_replace_result(file_path, result[0])
+        generation = self.project_search.replace(disk_files, pattern, replace_term, use_regex)
+        self._start_project_search_poll("replace", generation, len(disk_files), reset=False)
+
+    def _start_project_search_poll(self, kind, generation, file_count, reset=True):
+        if reset:
+            self._search_started = time.perf_counter()
+            self._search_totals = [0, 0] # [matches, files with matches] or [replacements, files changed]
+        self._search_pending = [kind, generation, file_count]
+        if self._search_poll_job is None:
+            self._search_poll_job = self.master.after(30, self._poll_project_search)
+        self._update_project_search_status()
+
+    def _poll_project_search(self):
+        self._search_poll_job = None
+        kind, generation, remaining = self._search_pending
+        if generation != self.project_search.generation:
+            return # Superseded, e.g. by a symbol query shown in the same tree
+        deadline = time.perf_counter() + 0.03
+        while remaining and time.perf_counter() < deadline:
+            try:
+                result_generation, file_path, result, error = self.project_search.results.get_nowait()
+            except queue.Empty:
+                break
+            if result_generation != generation:
+                continue # Left over from an abandoned run
+            remaining -= 1
+            if error:
+                self.output_log_widget.insert(tk.END, f"Warning: 搜索文件 {os.path.basename(file_path)} 失败: {error}\n", "WARNING")
+            elif kind == "search":
+                self._add_search_results(file_path, result)
+            else:
+                self._add_replace_result(file_path, result)
+        self._search_pending[2] = remaining
+        self._update_project_search_status()
+        if remaining:
+            self._search_poll_job = self.master.after(30, self._poll_project_search)
+        elif kind == "replace" and self._search_totals[1]:
+            self._build_hierarchy_viewer() # Sources changed on disk
+
+    def _add_search_results(self, file_path, matches):
+        if not matches:
+            return
+        self._search_totals[0] += len(matches)
+        self._search_totals[1] += 1
+        count_text = f"{len(matches)}+" if len(matches) >= ProjectSearch.MAX_MATCHES_PER_FILE else str(len(matches))
+        file_node = self.search_results_tree.insert("", "end", text=f"{os.path.basename(file_path)} ({count_text})",
+                                                    values=("", file_path, file_path, 0, 0), open=True)
+        for line, column, line_text in matches:
+            self.search_results_tree.insert(file_node, "end", text="", values=(line, line_text.strip(), file_path, line, column))
+
+    def _add_replace_result(self, file_path, count):
+        if not count:
+            return # Files without a match are not touched
+        self._search_totals[0] += count
+        self._search_totals[1] += 1
+        self.search_results_tree.insert("", "end", text=os.path.basename(file_path), values=("", f"已替换 {count} 处", file_path, 0, 0))
+
+    def _update_project_search_status(self):
+        kind, _, remaining = self._search_pending
+        total, files = self._search_totals
+        elapsed = time.perf_counter() - self._search_started
+        if kind == "search":
+            summary = f"{files} 个文件中找到 {total} 处"
+        else:
+            summary = f"已在 {files} 个文件中替换 {total} 处"
+        status = f"{summary}，剩余 {remaining} 个文件…" if remaining else f"{summary}，用时 {elapsed:.2f} 秒"
+        self.project_search_status.config(text=status)
+
+    def _symbol_at_cursor(self, text_widget):
+        if text_widget is None:
+            text_widget = self._get_current_editor_widget()
+            if not text_widget:
+                messagebox.showinfo("提示", "请先打开一个文件，并将光标放在模块名上。")
+                return None
+        word = text_widget.get("insert wordstart", "insert wordend").strip()
+        return word if re.fullmatch(r"[a-zA-Z_][\w$]*", word) else None
+
+    def go_to_definition(self, text_widget=None):
+        """Jumps to the definition of the module named under the cursor, looked up in the symbol index."""
+        module_name = self._symbol_at_cursor(text_widget)
+        if not module_name:
+            return
+        definitions = self.symbol_index.definitions(module_name)
+        if not definitions:
+            messagebox.showinfo("转到定义", f"符号索引中没有模块 \"{module_name}\" 的定义。")
+        elif len(definitions) == 1:
+            self._jump_to_location(*definitions[0])
+        else:
+            self._show_symbol_results(f"模块 {module_name} 有 {len(definitions)} 处定义",
+                                      [(file_path, line, f"module {module_name}") for file_path, line in definitions])
+
+    def find_references(self, text_widget=None):
+        """Lists every instance of the module named under the cursor, looked up in the symbol index."""
+        module_name = self._symbol_at_cursor(text_widget)
+        if not module_name:
+            return
+        references = self.symbol_index.references(module_name)
+        self._show_symbol_results(f"模块 {module_name} 有 {len(references)} 处引用",
+                                  [(file_path, line, f"{module_name} {instance_name}  (位于 {parent_module})")
+                                   for file_path, line, instance_name, parent_module in references])
+
+    def _show_symbol_results(self, summary, rows):
+        """Shows ``[(file_path, line, text)]`` rows, grouped by file, in the project search tab."""
+        self.open_project_search()
+        self.project_search.cancel()
+        self.project_search.generation += 1 # Drop results of a search still streaming in
+        self.search_results_tree.delete(*self.search_results_tree.get_children())
+        by_file = {}
+        for file_path, line, text in rows:
+            by_file.setdefault(file_path, []).append((line, 0, text))
+        for file_path, matches in by_file.items():
+            file_node = self.search_results_tree.insert("", "end", text=f"{os.path.basename(file_path)} ({len(matches)})",
+                                                        values=("", file_path, file_path, 0, 0), open=True)
+            for line, column, text in matches:
+                self.search_results_tree.insert(file_node, "end", text="", values=(line, text, file_path, line, column))
+        self.project_search_status.config(text=summary)
+
+    def _on_search_result_select(self, event):
+        """Jumps to the selected match using the same navigation as the hierarchy viewer."""
+        selected_item_id = self.search_results_tree.focus()
+        if not selected_item_id:
+            return
+        item_values = self.search_results_tree.item(selected_item_id, "values")
+        # item_values will contain (Line, Text, FullPath, LineNumber, Column)
+        if len(item_values) >= 5:
+            self._jump_to_location(item_values[2], max(int(item_values[3]), 1), int(item_values[4]))
+
+    def _apply_replacement(self, text_widget, start, end, new_text):
+        """Writes a Replace All result back as one edit and one undo step, then refreshes the editor once."""
+        start_pos = text_widget.index(f"1.0+{start}c")
+        end_pos = text_widget.index(f"1.0+{end}c")
+        text_widget.config(autoseparators=False)
+        try:
+            text_widget.edit_separator()
+            text_widget.delete(start_pos, end_pos)
+            text_widget.insert(start_pos, new_text)
+            text_widget.edit_separator()
+        finally:
+            text_widget.config(autoseparators=True)
+        text_widget.mark_set(tk.INSERT, start_pos)
+        self._handle_editor_content_change(None, text_widget, self._editor_file_path(text_widget))
+
+    def _editor_file_path(self, text_widget):
+        for file_path, (_, widget) in self.open_editors.items():
+            if widget is text_widget:
+                return file_path
+        return None
+
     def _get_current_editor_widget(self):
         # Get the currently selected tab
         selected_tab_id = self.notebook.select()
@@ -978,6 +5971,7 @@ end
         template_content = templates.get(template_type)
         if template_content:
             current_text_widget.insert(tk.INSERT, template_content)
+            self._handle_editor_content_change(None, current_text_widget, self._editor_file_path(current_text_widget))
         else:
             messagebox.showerror("错误", "未知模板类型。")
 
@@ -1001,15 +5995,25 @@ end
                 messagebox.showerror("错误", "无法找到当前编辑器的文件路径。")
                 return
 
+        if text_widget in self.loading_editors:
+            messagebox.showinfo("提示", f"文件 {os.path.basename(file_path)} 仍在加载中，请稍后再保存。")
+            return
+
         try:
-            content = text_widget.get("1.0", tk.END + "-1c") # Get all text, excluding the final newline
             with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+                # Write in blocks of lines so a huge buffer never exists as one Python string
+                last_line = int(text_widget.index(tk.END + "-1c").split(".")[0])
+                for block_start in range(1, last_line + 1, 10000):
+                    block_end = f"{block_start + 10000}.0" if block_start + 10000 <= last_line else tk.END + "-1c"
+                    f.write(text_widget.get(f"{block_start}.0", block_end))
             text_widget.edit_modified(False) # Reset modified flag
             self._check_editor_modified_status(text_widget, file_path) # Update tab title (remove asterisk)
             self.output_log_widget.insert(tk.END, f"\n文件已保存: {os.path.basename(file_path)}\n")
         except Exception as e:
             messagebox.showerror("保存失败", f"无法保存文件 {os.path.basename(file_path)}: {e}")
+            return
+        # Don't wait for the watcher (which may be polling) to notice our own save
+        self._sources_changed([file_path])
 
     def close_current_tab(self):
         """关闭当前激活的编辑器标签页。"""
@@ -1041,68 +6045,42 @@ end
         if file_to_close and frame_to_close:
             self.notebook.forget(frame_to_close) # 从 Notebook 中移除标签页
             del self.open_editors[file_to_close] # 从我们的追踪字典中删除
-
-    def _parse_verilog_files(self):
+            self.gutters.pop(text_widget_to_close, None)
+            highlight_state = self.highlight_states.pop(text_widget_to_close, None)
+            if highlight_state:
+                highlight_state.closed = True # The worker drops its remaining jobs
+                if highlight_state.debounce_job:
+                    text_widget_to_close.after_cancel(highlight_state.debounce_job)
+
+    def _merge_parsed_files(self, parsed, errors):
         """
-        Parses all Verilog files to build a model of the design hierarchy.
-        This version uses a state machine approach for better accuracy.
+        Merges per-file parse results, in project file order, into the model of the
+        design hierarchy. Returns ``(design_modules, design_hierarchy)``.
         """
-        # Regex for module definition (captures module name)
-        module_re = re.compile(r"^\s*module\s+([a-zA-Z_][\w]*)", re.MULTILINE)
-        # Regex for instance (captures module type and instance name)
-        instance_re = re.compile(r"^\s*([a-zA-Z_][\w]*)\s+(?:#\s*\(.*\)\s*)?([a-zA-Z_][\w]*)\s*\(", re.MULTILINE)
-        # Regex for endmodule
-        endmodule_re = re.compile(r"^\s*endmodule", re.MULTILINE)
-
         # Data structures to hold parsed information
         self.design_modules = {} # We'll store this on self for later use (e.g., jump to definition)
-        all_instance_types = set()
         
         for file_path in self.verilog_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                lines = content.splitlines()
-                current_module_name = None
-                
-                for i, line in enumerate(lines):
-                    if current_module_name is None:
-                        # Not inside a module, look for a new module definition
-                        match = module_re.match(line)
-                        if match:
-                            current_module_name = match.group(1)
-                            if current_module_name not in self.design_modules:
-                                self.design_modules[current_module_name] = {
-                                    "file_path": file_path,
-                                    "definition_line": i + 1, # Line numbers are 1-based
-                                    "instances": []
-                                }
-                    else:
-                        # We are inside a module definition
-                        # Look for instances
-                        inst_match = instance_re.match(line)
-                        if inst_match:
-                            inst_type, inst_name = inst_match.groups()
-                            
-                            # A simple check to avoid keywords
-                            if inst_type and inst_type.lower() not in ["input", "output", "inout", "reg", "wire", "always", "initial", "assign", "parameter", "localparam", "function", "task"]:
-                                self.design_modules[current_module_name]["instances"].append({
-                                    "type": inst_type,
-                                    "name": inst_name,
-                                    "file_path": file_path, # Instance is in the file of the current module
-                                    "line": i + 1
-                                })
-                                all_instance_types.add(inst_type)
-                        
-                        # Look for the end of the module
-                        elif endmodule_re.match(line):
-                            current_module_name = None # We have exited the module scope
-
-            except Exception as e:
-                self.output_log_widget.insert(tk.END, f"Warning: 解析文件 {os.path.basename(file_path)} 失败: {e}\n", "WARNING")
+            if file_path in errors:
+                self.output_log_widget.insert(tk.END, f"Warning: 解析文件 {os.path.basename(file_path)} 失败: {errors[file_path]}\n", "WARNING")
+                continue
 
-        return self.design_modules, all_instance_types
+            for module in parsed.get(file_path, ()):
+                # The first definition of a module wins; a redefinition's instances are merged into it
+                details = self.design_modules.setdefault(module["name"], {
+                    "file_path": file_path,
+                    "definition_line": module["definition_line"],
+                    "instances": []
+                })
+                details["instances"].extend(module["instances"])
+
+        self.parse_cache.retain(self.verilog_files)
+        old_cycles = self.design_hierarchy.cycles
+        self.design_hierarchy = DesignHierarchy(self.design_modules)
+        if self.design_hierarchy.cycles != old_cycles:
+            for cycle in self.design_hierarchy.cycles:
+                self.output_log_widget.insert(tk.END, f"Warning: 检测到循环例化: {' → '.join(cycle)}\n", "WARNING")
+        return self.design_modules, self.design_hierarchy
 
     def _create_hierarchy_viewer_widgets(self):
         """Creates the Treeview and its scrollbars for the hierarchy viewer."""
@@ -1112,6 +6090,10 @@ end
         self.hierarchy_tree.heading("Location", text="文件")
         self.hierarchy_tree.pack(expand=True, fill="both")
 
+        # Parse progress, shown above the tree only while a background parse runs
+        self.hierarchy_progress = ttk.Progressbar(self.hierarchy_frame, mode="determinate")
+        self.hierarchy_progress_label = ttk.Label(self.hierarchy_frame, text="")
+
         # Add scrollbars
         h_scrollbar = ttk.Scrollbar(self.hierarchy_frame, orient="horizontal", command=self.hierarchy_tree.xview)
         v_scrollbar = ttk.Scrollbar(self.hierarchy_frame, orient="vertical", command=self.hierarchy_tree.yview)
@@ -1121,107 +6103,368 @@ end
 
         # Bind selection event to jump to code
         self.hierarchy_tree.bind("<<TreeviewSelect>>", self._on_hierarchy_select) # NEW: Bind selection event
+        # Instances are only inserted when their parent is expanded
+        self.hierarchy_tree.bind("<<TreeviewOpen>>", self._on_hierarchy_open)
+
+        hierarchy_menu = tk.Menu(self.hierarchy_tree, tearoff=0)
+        hierarchy_menu.add_command(label="展开到深度...", command=self.expand_hierarchy_to_depth)
+        hierarchy_menu.add_command(label="全部折叠", command=self.collapse_hierarchy)
+        hierarchy_menu.add_separator()
+        hierarchy_menu.add_command(label="层次统计", command=self.show_hierarchy_statistics)
+
+        def show_hierarchy_menu(event):
+            item = self.hierarchy_tree.identify_row(event.y)
+            if item and item not in self.hierarchy_tree.selection():
+                self.hierarchy_tree.selection_set(item)
+            hierarchy_menu.tk_popup(event.x_root, event.y_root)
+
+        self.hierarchy_tree.bind("<Button-3>", show_hierarchy_menu)
 
         # Initial build of hierarchy
         self._build_hierarchy_viewer()
+        self.master.after(200, self._poll_file_watcher)
 
     def _build_hierarchy_viewer(self):
-        """Builds the design hierarchy in the Treeview using parsed data."""
-        # Clear existing items
-        self.hierarchy_tree.delete(*self.hierarchy_tree.get_children())
-        
+        """Starts parsing the project files in the background; the Treeview is rebuilt once when all results are in."""
+        self.file_watcher.set_paths(self.verilog_files)
+        self._incremental_generation = None
         if not self.verilog_files:
             # Optionally show a message if no files are added
             # self.hierarchy_tree.insert("", "end", text="请添加Verilog文件以查看层次", values=("", ""), open=False)
+            self.hierarchy_parser.generation += 1 # Abandon a parse still running
+            self._hide_hierarchy_progress()
+            self.hierarchy_tree.delete(*self.hierarchy_tree.get_children())
+            self.design_modules = {}
+            self.design_hierarchy = DesignHierarchy({})
+            self._hierarchy_specs, self._hierarchy_nodes, self._hierarchy_filled = {}, {}, set()
             return
 
-        # 1. Parse all files to get the design structure
-        modules, all_instance_types = self._parse_verilog_files()
-        
-        # 2. Find top-level modules (those that are defined but never instantiated as a component)
-        # A module is top-level if it's defined but not in the set of all instantiated module types.
-        top_level_modules = set(modules.keys()) - all_instance_types
-        
-        # If no explicit top-level modules are found (e.g., all modules instantiate each other in a cycle, or only one module),
-        # consider all defined modules as top-level for display purposes.
-        if not top_level_modules and modules:
-            top_level_modules = set(modules.keys())
-            self.output_log_widget.insert(tk.END, "提示: 未检测到明确的顶层模块，将显示所有已定义的模块。\n", "WARNING")
-
-
-        # 3. Build the tree recursively for each top-level module
-        for top_module_name in sorted(list(top_level_modules)):
-            module_details = modules.get(top_module_name)
-            if module_details: # Ensure the module actually exists in our parsed data
-                self._populate_tree_recursive(
-                    parent_node_id="",
-                    module_name=top_module_name,
-                    instance_name=top_module_name, # For top-level, the instance name is effectively its own module name
-                    all_modules=modules,
-                    # For top-level modules, their 'instance_info' is their own definition details
-                    instance_info={"file_path": module_details["file_path"], "line": module_details["definition_line"]}
-                )
-
-    def _populate_tree_recursive(self, parent_node_id, module_name, instance_name, all_modules, instance_info=None):
-        """Recursively populates the hierarchy Treeview.
-        Stores file_path and line_number in item values for navigation.
+        self.parse_cache.set_defines(self._project_defines())
+        self.hierarchy_parser.start(self.verilog_files)
+        if self._hierarchy_poll_job is None:
+            self._hierarchy_poll_job = self.master.after(50, self._poll_hierarchy_parser)
+
+    def _project_defines(self):
+        """Macro names passed to iverilog with -D, used to evaluate `ifdef while parsing the hierarchy."""
+        try:
+            flags = shlex.split(self.iverilog_flags_entry.get())
+        except ValueError:
+            return ()
+        defines = []
+        for i, flag in enumerate(flags):
+            if flag == "-D" and i + 1 < len(flags):
+                defines.append(flags[i + 1].split("=", 1)[0])
+            elif flag.startswith("-D") and len(flag) > 2:
+                defines.append(flag[2:].split("=", 1)[0])
+        return tuple(defines)
+
+    def _poll_hierarchy_parser(self):
+        self._hierarchy_poll_job = None
+        while True:
+            try:
+                message = self.hierarchy_parser.results.get_nowait()
+            except queue.Empty:
+                break
+            if message[1] != self.hierarchy_parser.generation:
+                continue # From an abandoned run
+            if message[0] == "progress":
+                _, _, done, total = message
+                self._show_hierarchy_progress(done, total)
+            else:
+                _, _, parsed, errors = message
+                self._hide_hierarchy_progress()
+                old_modules, old_hierarchy = self.design_modules, self.design_hierarchy
+                modules, hierarchy = self._merge_parsed_files(parsed, errors)
+                if message[1] == self._incremental_generation:
+                    self._incremental_touched.clear()
+                elif modules and not hierarchy.tops:
+                    self.output_log_widget.insert(tk.END, "提示: 未检测到明确的顶层模块，将从循环例化中的模块开始显示。\n", "WARNING")
+                # The tree shows old_modules, so comparing the models tells which items to touch
+                self._update_hierarchy_tree(old_modules, old_hierarchy, modules, hierarchy)
+                return
+        self._hierarchy_poll_job = self.master.after(50, self._poll_hierarchy_parser)
+
+    def _poll_file_watcher(self):
+        changed = set()
+        while True:
+            try:
+                changed |= self.file_watcher.changes.get_nowait()
+            except queue.Empty:
+                break
+        if changed:
+            self._sources_changed(changed)
+        self.master.after(200, self._poll_file_watcher)
+
+    def _sources_changed(self, paths):
+        """Schedules a hierarchy refresh for ``paths``; a burst of changes is handled once it has settled."""
+        self._watch_changes.update(os.path.abspath(path) for path in paths)
+        if self._watch_debounce_job is not None:
+            self.master.after_cancel(self._watch_debounce_job)
+        self._watch_debounce_job = self.master.after(self.editor_settings["watch_debounce_ms"], self._refresh_changed_sources)
+
+    def _refresh_changed_sources(self):
+        """Re-parses only the project files that changed; the Treeview is then patched, not rebuilt."""
+        self._watch_debounce_job = None
+        project_files = {os.path.abspath(f): f for f in self.verilog_files}
+        touched = {project_files[path] for path in self._watch_changes if path in project_files}
+        self._watch_changes.clear()
+        if not touched:
+            return
+        running = self._hierarchy_poll_job is not None
+        if self.parse_cache.set_defines(self._project_defines()) or (running and self.hierarchy_parser.generation != self._incremental_generation):
+            # Every file needs parsing again, or a full build is under way: restart it so it reads the new contents
+            self._build_hierarchy_viewer()
+            return
+        if not running:
+            self._incremental_touched = set()
+        self._incremental_touched |= touched # A refresh still running is superseded by one covering its files too
+        self._incremental_generation = self.hierarchy_parser.start(self.verilog_files, self._incremental_touched)
+        if not running:
+            self._hierarchy_poll_job = self.master.after(50, self._poll_hierarchy_parser)
+
+    def _show_hierarchy_progress(self, done, total):
+        if not self.hierarchy_progress.winfo_ismapped():
+            self.hierarchy_progress.pack(side=tk.TOP, fill="x", padx=2, pady=2, before=self.hierarchy_tree)
+            self.hierarchy_progress_label.pack(side=tk.TOP, fill="x", padx=2, before=self.hierarchy_tree)
+        self.hierarchy_progress.config(maximum=max(total, 1), value=done)
+        self.hierarchy_progress_label.config(text=f"正在解析 {done}/{total} 个文件…")
+
+    def _hide_hierarchy_progress(self):
+        self.hierarchy_progress.pack_forget()
+        self.hierarchy_progress_label.pack_forget()
+
+    HIERARCHY_GROUP_MIN = 16 # Instances of one module in one parent shown as a single "X × N" item from this many
+
+    def _update_hierarchy_tree(self, old_modules, old_hierarchy, modules, hierarchy):
+        """Reconciles the Treeview with a new hierarchy model instead of rebuilding it.
+
+        Items are keyed by instance path (``top.u_core.u_alu``), so an item
+        that is still there keeps its open/closed state and its selection.
+        Besides the top level, only the items of modules whose definition
+        changed, of modules instantiating one that appeared or disappeared,
+        and of modules whose instantiation started or stopped closing a cycle
+        are compared, so the work follows the size of the change.
         """
-        module_details = all_modules.get(module_name)
-        
-        file_path = ""
-        line_num = 0
-        item_type = ""
-
-        if instance_info: # This is an instance (or top-level module passed as instance_info)
-            file_path = instance_info["file_path"]
-            line_num = instance_info["line"]
-            item_type = "实例" if parent_node_id else "模块" # Distinguish top-level module vs actual instance
-        elif module_details: # Fallback (should primarily be handled by instance_info for top-level)
-            file_path = module_details["file_path"]
-            line_num = module_details["definition_line"]
-            item_type = "模块"
-        else: # Undefined module (no details found for module_name)
-            file_path, line_num, item_type = "-", 0, "未定义"
-
-        # Determine display text based on whether it's a top-level module or an instance
-        display_text = f"模块: {module_name}" if parent_node_id == "" else f"实例: {instance_name} (类型: {module_name})"
-        
-        # Insert the item into the tree
-        # Store (Type, BaseFilename, FullPath, LineNumber) in values
-        current_node_id = self.hierarchy_tree.insert(
-            parent_node_id, 
-            "end", 
-            text=display_text,
-            values=(item_type, os.path.basename(file_path), file_path, line_num), # NEW: Store full path and line number
-            open=True # Keep nodes open by default
-        )
-        
-        if not module_details:
-            # If an instance points to an undefined module, show it as such
-            # And do not recurse further
-            self.hierarchy_tree.set(current_node_id, "Type", "未定义")
-            self.hierarchy_tree.set(current_node_id, "File", "-") # Set the 'File' column to '-' for undefined
-            return
-
-        # Now, find all instances within this module and recurse
-        for instance in module_details["instances"]:
-            # Ensure the instance's type exists before recursing to prevent errors
-            if instance["type"] in all_modules:
-                self._populate_tree_recursive(
-                    parent_node_id=current_node_id,
-                    module_name=instance["type"],
-                    instance_name=instance["name"],
-                    all_modules=all_modules,
-                    instance_info=instance # Pass instance info down (which includes its file_path and line)
-                )
+        changed = {name for name in old_modules.keys() | modules.keys() if old_modules.get(name) != modules.get(name)}
+        appeared_or_gone = old_modules.keys() ^ modules.keys()
+        affected = set(changed)
+        if appeared_or_gone:
+            affected.update(name for name, details in modules.items()
+                            if any(instance["type"] in appeared_or_gone for instance in details["instances"]))
+        affected.update(parent for parent, _ in old_hierarchy.back_edges ^ hierarchy.back_edges)
+
+        tree = self.hierarchy_tree
+        for item in self._reconcile_hierarchy_children("", [self._top_spec(name) for name in hierarchy.roots]):
+            self._fill_hierarchy_item(item) # New top-level modules show their first level
+            tree.item(item, open=True)
+        for name in affected:
+            if name not in modules:
+                self._hierarchy_nodes.pop(name, None) # Its items are replaced along with their parents
+                continue
+            # Collapsed items only need touching if the placeholder has to come or go
+            had_instances = name in old_modules and bool(old_modules[name]["instances"])
+            placeholder_changed = had_instances != bool(modules[name]["instances"])
+            items = self._hierarchy_nodes.get(name, set())
+            for item in list(items):
+                spec = self._hierarchy_specs.get(item)
+                if spec is None or spec[4] != name or not tree.exists(item):
+                    items.discard(item) # Deleted, or the path shows another module now
+                elif item in self._hierarchy_filled:
+                    self._refresh_hierarchy_item(item)
+                elif placeholder_changed:
+                    self._reset_hierarchy_item(item)
+
+    def _top_spec(self, module_name):
+        details = self.design_modules[module_name]
+        file_path = details["file_path"]
+        return (module_name, f"模块: {module_name}", ("模块", os.path.basename(file_path), file_path, details["definition_line"]),
+                "module", module_name)
+
+    def _instance_specs(self, path, module_name, only_type=None):
+        """Describes the items below the item of ``module_name`` at ``path``, as
+        ``(item, text, values, kind, key)``: kind "module" (key: its module), "group"
+        (key: parent module, instance type and path) or "leaf". ``only_type`` lists
+        the members of one group."""
+        hierarchy = self.design_hierarchy
+        counts = hierarchy.edges[module_name]
+        grouped = () if only_type else {child for child, count in counts.items() if count >= self.HIERARCHY_GROUP_MIN}
+        specs, seen = [], set()
+        for instance in self.design_modules[module_name]["instances"]:
+            instance_type = instance["type"]
+            if only_type is not None and instance_type != only_type:
+                continue
+            location = (os.path.basename(instance["file_path"]), instance["file_path"], instance["line"])
+            if instance_type in grouped:
+                item = f"{path}.[{instance_type}]"
+                if item not in seen: # The group item goes where its first instance would be
+                    seen.add(item)
+                    specs.append((item, f"模块: {instance_type} × {counts[instance_type]} 实例", ("实例组",) + location,
+                                  "group", (module_name, instance_type, path)))
+                continue
+            # Group members keep the path they have outside the group
+            item = f"{path}.{instance['name']}"
+            if item in seen: # The same name twice, e.g. in `ifdef branches that were both active
+                suffix = 2
+                while f"{item}#{suffix}" in seen:
+                    suffix += 1
+                item = f"{item}#{suffix}"
+            seen.add(item)
+            text = f"实例: {instance['name']} (类型: {instance_type})"
+            if (module_name, instance_type) in hierarchy.back_edges:
+                # Expanding it would repeat the cycle forever
+                specs.append((item, text + " ↻", ("循环例化",) + location, "leaf", None))
+            elif instance_type in self.design_modules:
+                specs.append((item, text, ("实例",) + location, "module", instance_type))
             else:
                 # If an instance type is not defined in project files, add a placeholder
-                self.hierarchy_tree.insert(
-                    current_node_id, 
-                    "end", 
-                    text=f"实例: {instance['name']} (类型: {instance['type']})",
-                    values=("未定义实例", os.path.basename(instance["file_path"]), instance["file_path"], instance["line"])
-                )
+                specs.append((item, text, ("未定义实例",) + location, "leaf", None))
+        return specs
+
+    def _child_specs(self, item):
+        _, _, _, kind, key = self._hierarchy_specs[item]
+        if kind == "group":
+            module_name, instance_type, path = key
+            return self._instance_specs(path, module_name, instance_type)
+        return self._instance_specs(item, key)
+
+    def _reconcile_hierarchy_children(self, parent, specs):
+        """Makes the children of ``parent`` match ``specs``, moving, inserting, updating
+        and deleting only what differs. Returns the items inserted."""
+        tree = self.hierarchy_tree
+        wanted = {spec[0] for spec in specs}
+        current = tree.get_children(parent)
+        stale = [item for item in current if item not in wanted]
+        if stale:
+            tree.delete(*stale)
+        kept = [item for item in current if item in wanted]
+        placed, inserted = set(), []
+        next_kept = 0
+        for index, spec in enumerate(specs):
+            item = spec[0]
+            while next_kept < len(kept) and kept[next_kept] in placed:
+                next_kept += 1
+            placed.add(item)
+            if next_kept < len(kept) and kept[next_kept] == item:
+                next_kept += 1 # Already in place
+            elif item in self._hierarchy_specs and tree.exists(item):
+                tree.move(item, parent, index) # Reordered, or moved in or out of a group
+            else:
+                self._insert_hierarchy_item(parent, index, spec)
+                inserted.append(item)
+                continue
+            old_spec = self._hierarchy_specs[item]
+            if old_spec != spec:
+                tree.item(item, text=spec[1], values=spec[2])
+                self._register_hierarchy_item(spec)
+                if old_spec[3:] != spec[3:]: # It shows another module now; its children are out of date
+                    self._reset_hierarchy_item(item)
+        return inserted
+
+    def _register_hierarchy_item(self, spec):
+        self._hierarchy_specs[spec[0]] = spec
+        if spec[3] == "module":
+            self._hierarchy_nodes.setdefault(spec[4], set()).add(spec[0])
+
+    def _insert_hierarchy_item(self, parent, index, spec):
+        """Inserts one item of the hierarchy Treeview. The values hold (Type, BaseFilename,
+        FullPath, LineNumber) for navigation. Children are not inserted yet: a placeholder
+        keeps the item expandable, and _fill_hierarchy_item replaces it on expand."""
+        item, text, values, _, _ = spec
+        self.hierarchy_tree.insert(parent, index, iid=item, text=text, values=values, open=False)
+        self._register_hierarchy_item(spec)
+        self._hierarchy_filled.discard(item)
+        if self._has_children(spec):
+            self.hierarchy_tree.insert(item, "end", text="…", tags=("placeholder",))
+
+    def _has_children(self, spec):
+        return spec[3] == "group" or (spec[3] == "module" and bool(self.design_modules[spec[4]]["instances"]))
+
+    def _reset_hierarchy_item(self, item):
+        """Drops an item's children; an expanded item gets them again from the model, a collapsed one a placeholder."""
+        tree = self.hierarchy_tree
+        tree.delete(*tree.get_children(item))
+        self._hierarchy_filled.discard(item)
+        if self._has_children(self._hierarchy_specs[item]):
+            tree.insert(item, "end", text="…", tags=("placeholder",))
+            if tree.item(item, "open"):
+                self._fill_hierarchy_item(item)
+
+    def _refresh_hierarchy_item(self, item):
+        """Brings the children of an expanded module item (and of its expanded groups) up to date with the model."""
+        specs = self._child_specs(item)
+        self._reconcile_hierarchy_children(item, specs)
+        for spec in specs:
+            if spec[3] == "group" and spec[0] in self._hierarchy_filled:
+                self._reconcile_hierarchy_children(spec[0], self._child_specs(spec[0]))
+
+    def _fill_hierarchy_item(self, item):
+        """Replaces an item's placeholder by its children; returns False if it had none."""
+        spec = self._hierarchy_specs.get(item)
+        if item in self._hierarchy_filled or spec is None or not self._has_children(spec):
+            return False
+        self.hierarchy_tree.delete(*self.hierarchy_tree.get_children(item))
+        self._hierarchy_filled.add(item)
+        self._reconcile_hierarchy_children(item, self._child_specs(item))
+        return True
+
+    def _is_expandable(self, item):
+        spec = self._hierarchy_specs.get(item)
+        return spec is not None and spec[3] in ("module", "group")
+
+    def _on_hierarchy_open(self, event):
+        item = self.hierarchy_tree.focus() # <<TreeviewOpen>> is about the focused item
+        if self._is_expandable(item):
+            self._fill_hierarchy_item(item)
+
+    HIERARCHY_EXPAND_LIMIT = 20000 # Items inserted by one "expand to depth" before it stops
+
+    def expand_hierarchy_to_depth(self):
+        """Expands the selected items (or every top-level module) a given number of levels."""
+        depth = simpledialog.askinteger("展开层次", "展开到深度:", parent=self.master, minvalue=1, initialvalue=2)
+        if depth:
+            self._expand_hierarchy(self.hierarchy_tree.selection() or self.hierarchy_tree.get_children(), depth)
+
+    def _expand_hierarchy(self, items, depth):
+        tree = self.hierarchy_tree
+        level = list(items)
+        shown = 0
+        for _ in range(depth):
+            next_level = []
+            for item in level:
+                if not self._is_expandable(item):
+                    continue
+                self._fill_hierarchy_item(item)
+                tree.item(item, open=True)
+                children = tree.get_children(item)
+                shown += len(children)
+                next_level.extend(children)
+                if shown > self.HIERARCHY_EXPAND_LIMIT:
+                    self.output_log_widget.insert(tk.END, f"提示: 层次展开已在 {shown} 个条目处停止。\n", "WARNING")
+                    return
+            level = next_level
+
+    def show_hierarchy_statistics(self, limit=20):
+        """Writes instance counts, subtree sizes and depths of the most replicated modules to the output log."""
+        hierarchy = self.design_hierarchy
+        log = self.output_log_widget
+        log.insert(tk.END, "\n--- 设计层次统计 ---\n")
+        log.insert(tk.END, f"模块: {len(hierarchy.modules)}  展开后实例: {hierarchy.total_instances}  "
+                           f"最大深度: {max(hierarchy.depths.values(), default=0)}\n")
+        for name in sorted(hierarchy.modules, key=lambda name: (-hierarchy.instance_counts[name], name))[:limit]:
+            log.insert(tk.END, f"  模块 {name} × {hierarchy.instance_counts[name]} 实例"
+                               f"  (每个含 {hierarchy.subtree_sizes[name]} 个子实例, 深度 {hierarchy.depths[name]})\n")
+        for cycle in hierarchy.cycles:
+            log.insert(tk.END, f"  循环例化: {' → '.join(cycle)}\n", "WARNING")
+        log.see(tk.END)
+
+    def collapse_hierarchy(self):
+        tree = self.hierarchy_tree
+        pending = list(tree.get_children())
+        while pending:
+            item = pending.pop()
+            if tree.item(item, "open"):
+                tree.item(item, open=False)
+                pending.extend(tree.get_children(item))
 
     def _on_hierarchy_select(self, event):
         """Handles selection event in the hierarchy Treeview to open file and jump to line."""
@@ -1229,6 +6472,8 @@ end
         if not selected_item_id:
             return
 
+        if "placeholder" in self.hierarchy_tree.item(selected_item_id, "tags"):
+            return
         item_values = self.hierarchy_tree.item(selected_item_id, "values")
         # item_values will contain (Type, BaseFilename, FullPath, LineNumber)
         
@@ -1242,46 +6487,53 @@ end
             full_file_path = item_values[2]
             line_num = int(item_values[3])
 
-            if not os.path.exists(full_file_path):
-                messagebox.showerror("文件不存在", f"文件 '{os.path.basename(full_file_path)}' 未找到。")
-                return
-            
-            # Open the file in an editor tab (re-using existing logic)
-            if full_file_path in self.open_editors:
-                tab_frame, text_widget = self.open_editors[full_file_path]
-                self.notebook.select(tab_frame) # Switch to existing tab
-            else:
-                tab_data = self.create_editor_tab(full_file_path)
-                if tab_data:
-                    tab_frame, text_widget = tab_data
-                    self.notebook.add(tab_frame, text=os.path.basename(full_file_path)) # Use basename for tab text
-                    self.notebook.select(tab_frame)
-                    self.open_editors[full_file_path] = (tab_frame, text_widget)
-                else:
-                    return # Failed to open editor
-
-            # Jump to the specific line number in the editor
-            try:
-                # Tkinter text widget lines are 1-based, just like our line_num
-                # First, ensure the line is visible
-                text_widget.see(f"{line_num}.0") 
-                # Then, place the cursor at the beginning of the line
-                text_widget.mark_set(tk.INSERT, f"{line_num}.0")
-                # Highlight the line temporarily
-                text_widget.tag_remove("highlight_line", "1.0", tk.END) # Clear previous highlight
-                text_widget.tag_add("highlight_line", f"{line_num}.0", f"{line_num}.end")
-                text_widget.tag_config("highlight_line", background="lightblue")
-                text_widget.after(1000, lambda: text_widget.tag_remove("highlight_line", "1.0", tk.END)) # Remove highlight after 1 second
-
-            except Exception as e:
-                self.output_log_widget.insert(tk.END, f"无法跳转到行 {line_num} 在文件 {os.path.basename(full_file_path)} 中: {e}\n", "ERROR")
-                print(f"Error jumping to line {line_num} in {os.path.basename(full_file_path)}: {e}")
+            self._jump_to_location(full_file_path, line_num)
         else:
             # This branch indicates an item in the Treeview has insufficient data,
             # which should ideally not happen if populate_tree_recursive sets values correctly.
             print(f"Warning: Treeview item {selected_item_id} has insufficient values for navigation: {item_values}")
 
+    def _jump_to_location(self, full_file_path, line_num, column=0):
+        """Opens ``full_file_path`` in an editor tab (or switches to it) and shows ``line_num``."""
+        if not os.path.exists(full_file_path):
+            messagebox.showerror("文件不存在", f"文件 '{os.path.basename(full_file_path)}' 未找到。")
+            return
+        
+        # Open the file in an editor tab (re-using existing logic)
+        if full_file_path in self.open_editors:
+            tab_frame, text_widget = self.open_editors[full_file_path]
+            self.notebook.select(tab_frame) # Switch to existing tab
+        else:
+            tab_data = self.create_editor_tab(full_file_path)
+            if tab_data:
+                tab_frame, text_widget = tab_data
+                self.notebook.add(tab_frame, text=os.path.basename(full_file_path)) # Use basename for tab text
+                self.notebook.select(tab_frame)
+                self.open_editors[full_file_path] = (tab_frame, text_widget)
+            else:
+                return # Failed to open editor
+
+        # Jump to the specific line number in the editor
+        try:
+            # Tkinter text widget lines are 1-based, just like our line_num
+            # First, ensure the line is visible
+            text_widget.see(f"{line_num}.0") 
+            # Then, place the cursor on the line (at the given column, if any)
+            text_widget.mark_set(tk.INSERT, f"{line_num}.{column}")
+            # Highlight the line temporarily
+            text_widget.tag_remove("highlight_line", "1.0", tk.END) # Clear previous highlight
+            text_widget.tag_add("highlight_line", f"{line_num}.0", f"{line_num}.end")
+            text_widget.tag_config("highlight_line", background="lightblue")
+            text_widget.after(1000, lambda: text_widget.tag_remove("highlight_line", "1.0", tk.END)) # Remove highlight after 1 second
+
+        except Exception as e:
+            self.output_log_widget.insert(tk.END, f"无法跳转到行 {line_num} 在文件 {os.path.basename(full_file_path)} 中: {e}\n", "ERROR")
+            print(f"Error jumping to line {line_num} in {os.path.basename(full_file_path)}: {e}")
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Frozen builds: lets the parser pool's spawned children run their task instead of the GUI
+    if "--worker" in sys.argv:
+        sys.exit(_worker_main(sys.argv[1:]))
     root = tk.Tk()
     gui = VerilogGUI(root)
     root.mainloop() 
\ No newline at end of file